@@ -0,0 +1,7 @@
+# -*- coding: utf-8 -*-
+"""
+Dosing, temperature and LED automations for the Pioreactor.
+
+Importing the package doesn't register anything, so the tools in tools/ and validation can use it off the
+device. The plugin's entry point is registry, which imports every automation.
+"""
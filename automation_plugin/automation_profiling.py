@@ -0,0 +1,303 @@
+# -*- coding: utf-8 -*-
+"""
+Opt-in profiling of the automations' execute() cycles.
+
+Enable in config.ini, then restart the automations:
+
+    [automation_profiling]
+    enabled=1
+    # optional
+    dump_path=/home/pioreactor/.pioreactor/automation_profile.json
+    dump_every_seconds=300
+    publish=1
+
+The plugin's registry then imports this module, which wraps `execute` of every dosing, temperature and LED
+automation, including those defined later, and the methods where execute usually spends its time:
+execute_io_action and the pump calls, the heater and LED setters, waiting on the weight scale, and PID
+construction. Per execute, it records wall time, time spent in each of those, mL pumped and the number
+of pump actuations into fixed-bucket histograms, per automation. Time is counted under the innermost of
+those, ex: a gravimetric pump call's waits on the scale are scale time, not pump time. Exchanges that an
+asynchronous DosingQueue runs after execute has returned are recorded on their own, as queued_* metrics.
+They are written to dump_path as JSON and published to pioreactor/<unit>/<experiment>/<job_name>/profile
+every dump_every_seconds.
+
+When disabled, nothing is wrapped, so there is no overhead.
+"""
+from __future__ import annotations
+
+import functools
+import json
+import threading
+import time
+from bisect import bisect_right
+from typing import Any, Callable, Optional
+
+from .dosing.dosing_queue import DosingQueue
+from .dosing.scale import ScaleReader
+
+# upper edges in seconds (or mL, or actuations), log-spaced: 10µs to ~17min, 3 buckets per decade. The last
+# bucket holds everything above.
+BUCKET_EDGES = [10 ** (exponent / 3) for exponent in range(-15, 10)]
+
+# method name -> what the time inside it is counted as.
+TIMED_METHODS = {
+    "execute_io_action": "dosing",
+    "add_media_to_bioreactor": "pump",
+    "add_alt_media_to_bioreactor": "pump",
+    "remove_waste_from_bioreactor": "pump",
+    "update_heater": "heater",
+    "update_heater_with_delta": "heater",
+    "set_led_intensity": "led",
+    "set_led_intensities": "led",
+    "_fresh_weight": "scale",
+    "_settled_weight": "scale",
+    "wait_for_sample": "scale",
+}
+PUMP_METHODS = ("add_media_to_bioreactor", "add_alt_media_to_bioreactor", "remove_waste_from_bioreactor")
+
+
+class Histogram:
+    __slots__ = ("counts", "count", "sum", "max")
+
+    def __init__(self) -> None:
+        self.counts = [0] * (len(BUCKET_EDGES) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def add(self, value: float) -> None:
+        self.counts[bisect_right(BUCKET_EDGES, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def to_dict(self) -> dict[str, Any]:
+        return {"count": self.count, "sum": self.sum, "max": self.max, "counts": self.counts}
+
+
+class Profiler:
+    def __init__(self, dump_path: Optional[str] = None, dump_every_seconds: float = 300.0, publish: bool = True) -> None:
+        self.dump_path = dump_path
+        self.dump_every_seconds = dump_every_seconds
+        self.publish = publish
+        self.histograms: dict[str, dict[str, Histogram]] = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._last_dump = time.monotonic()
+        self._patched: list[tuple[type, str, Any]] = []
+        self._wrappers: set[Callable] = set()
+
+    # recording
+    def _frame(self) -> Optional[dict[str, float]]:
+        return getattr(self._local, "frame", None)
+
+    def record(self, job: Any, frame: dict[str, float]) -> None:
+        name = getattr(job, "automation_name", type(job).__name__)
+        with self._lock:
+            histograms = self.histograms.setdefault(name, {})
+            for metric, value in frame.items():
+                histograms.setdefault(metric, Histogram()).add(value)
+            due = time.monotonic() - self._last_dump >= self.dump_every_seconds
+            if due:
+                self._last_dump = time.monotonic()
+        if due:
+            self.dump(job)
+
+    def snapshot(self) -> dict[str, Any]:
+        with self._lock:
+            return {
+                "bucket_edges": BUCKET_EDGES,
+                "automations": {
+                    name: {metric: histogram.to_dict() for metric, histogram in histograms.items()}
+                    for name, histograms in self.histograms.items()
+                },
+            }
+
+    def dump(self, job: Any = None) -> None:
+        snapshot = self.snapshot()
+        if self.dump_path:
+            with open(self.dump_path, "w") as f:
+                json.dump(snapshot, f)
+        if self.publish and job is not None:
+            from pioreactor.pubsub import publish
+
+            publish(f"pioreactor/{job.unit}/{job.experiment}/{job.job_name}/profile", json.dumps(snapshot))
+
+    # wrapping
+    def _wrap_execute(self, execute: Callable) -> Callable:
+        @functools.wraps(execute)
+        def profiled_execute(job, *args, **kwargs):
+            if self._frame() is not None:
+                # a subclass's execute calling super().execute(): already being timed.
+                return execute(job, *args, **kwargs)
+
+            frame = self._local.frame = {"pump_ml": 0.0, "actuations": 0.0}
+            self._local.stack = []
+            started = time.perf_counter()
+            try:
+                return execute(job, *args, **kwargs)
+            finally:
+                frame["execute_seconds"] = time.perf_counter() - started
+                self._local.frame = None
+                self.record(job, frame)
+
+        return profiled_execute
+
+    def _wrap_complete(self, complete: Callable) -> Callable:
+        # an asynchronous DosingQueue runs its exchanges on another thread, after execute has returned, so each
+        # one gets a frame of its own. Synchronous exchanges run in submit, inside execute's frame.
+        @functools.wraps(complete)
+        def profiled_complete(queue, *args, **kwargs):
+            if self._frame() is not None:
+                return complete(queue, *args, **kwargs)
+
+            frame = self._local.frame = {"pump_ml": 0.0, "actuations": 0.0}
+            self._local.stack = []
+            started = time.perf_counter()
+            try:
+                return complete(queue, *args, **kwargs)
+            finally:
+                frame["exchange_seconds"] = time.perf_counter() - started
+                self._local.frame = None
+                self.record(queue.job, {f"queued_{metric}": value for metric, value in frame.items()})
+
+        return profiled_complete
+
+    def _wrap_timed(self, method: Callable, name: str) -> Callable:
+        category = TIMED_METHODS[name]
+
+        @functools.wraps(method)
+        def timed(*args, **kwargs):
+            frame = self._frame()
+            stack = getattr(self._local, "stack", [])
+            if frame is None or any(entry[0] == category for entry in stack):
+                # outside an execute, or nested in the same category (ex: execute_io_action's recursion).
+                return method(*args, **kwargs)
+
+            # [category, started]: the enclosing category's clock stops while this one runs.
+            started = time.perf_counter()
+            if stack:
+                self._charge(frame, stack[-1], started)
+            stack.append([category, started])
+            try:
+                result = method(*args, **kwargs)
+            finally:
+                stopped = time.perf_counter()
+                self._charge(frame, stack.pop(), stopped)
+                if stack:
+                    stack[-1][1] = stopped
+            if name in PUMP_METHODS:
+                frame["actuations"] += 1
+                if name != "remove_waste_from_bioreactor":
+                    frame["pump_ml"] += float(result or 0.0)
+            return result
+
+        return timed
+
+    @staticmethod
+    def _charge(frame: dict[str, float], entry: list, until: float) -> None:
+        key = f"{entry[0]}_seconds"
+        frame[key] = frame.get(key, 0.0) + until - entry[1]
+
+    def _patch(self, cls: type, name: str, wrapper: Callable) -> None:
+        original = cls.__dict__.get(name)
+        if original is None or getattr(original, "__func__", original) in self._wrappers:
+            return
+        if isinstance(original, (staticmethod, classmethod)):
+            wrapped = wrapper(original.__func__)
+            setattr(cls, name, type(original)(wrapped))
+        else:
+            wrapped = wrapper(original)
+            setattr(cls, name, wrapped)
+        self._wrappers.add(wrapped)
+        self._patched.append((cls, name, original))
+
+    def _patch_class(self, cls: type) -> None:
+        self._patch(cls, "execute", self._wrap_execute)
+        for name in TIMED_METHODS:
+            self._patch(cls, name, lambda method, name=name: self._wrap_timed(method, name))
+
+    def install(self, base_classes: list[type], pid_class: Optional[type] = None) -> None:
+        def all_subclasses(cls: type) -> list[type]:
+            return [cls] + [sub for direct in cls.__subclasses__() for sub in all_subclasses(direct)]
+
+        self._patch(DosingQueue, "_complete", self._wrap_complete)
+        self._patch(ScaleReader, "wait_for_sample", lambda method: self._wrap_timed(method, "wait_for_sample"))
+        for base in base_classes:
+            for cls in all_subclasses(base):
+                self._patch_class(cls)
+
+            # automations defined after this point.
+            original = base.__dict__.get("__init_subclass__")
+            profiler = self
+
+            def __init_subclass__(cls, base=base, original=original, **kwargs):
+                if original is not None:
+                    original.__func__(cls, **kwargs)
+                else:
+                    super(base, cls).__init_subclass__(**kwargs)
+                profiler._patch_class(cls)
+
+            base.__init_subclass__ = classmethod(__init_subclass__)  # type: ignore
+            self._patched.append((base, "__init_subclass__", original))
+
+        if pid_class is not None:
+            init = pid_class.__init__
+
+            @functools.wraps(init)
+            def counted_init(pid, *args, **kwargs):
+                frame = self._frame()
+                if frame is not None:
+                    frame["pid_constructions"] = frame.get("pid_constructions", 0.0) + 1
+                init(pid, *args, **kwargs)
+
+            pid_class.__init__ = counted_init  # type: ignore
+            self._patched.append((pid_class, "__init__", init))
+
+    def uninstall(self) -> None:
+        for cls, name, original in reversed(self._patched):
+            if original is None:
+                delattr(cls, name)
+            else:
+                setattr(cls, name, original)
+        self._patched = []
+
+
+PROFILER: Optional[Profiler] = None
+
+
+def enable(dump_path: Optional[str] = None, dump_every_seconds: float = 300.0, publish: bool = True) -> Profiler:
+    global PROFILER
+    if PROFILER is not None:
+        return PROFILER
+
+    from pioreactor.automations.dosing.base import DosingAutomationJob
+    from pioreactor.automations.led.base import LEDAutomationJob
+    from pioreactor.automations.temperature.base import TemperatureAutomationJob
+    from pioreactor.utils.streaming_calculations import PID
+
+    PROFILER = Profiler(dump_path, dump_every_seconds, publish)
+    PROFILER.install([DosingAutomationJob, TemperatureAutomationJob, LEDAutomationJob], pid_class=PID)
+    return PROFILER
+
+
+def disable() -> None:
+    global PROFILER
+    if PROFILER is not None:
+        PROFILER.uninstall()
+        PROFILER = None
+
+
+def enable_from_config() -> Optional[Profiler]:
+    from pioreactor.config import config
+
+    if not config.getboolean("automation_profiling", "enabled", fallback=False):
+        return None
+    return enable(
+        dump_path=config.get("automation_profiling", "dump_path", fallback=None),
+        dump_every_seconds=config.getfloat("automation_profiling", "dump_every_seconds", fallback=300.0),
+        publish=config.getboolean("automation_profiling", "publish", fallback=True),
+    )
+
+
+enable_from_config()
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+"""
+Warm restarts for automations that keep state between execute() calls.
+
+Some state can't be rebuilt from the next readings: a PID's integral, whether AdaptedTurbidostat is part-way
+down from max to min OD, which liquid SwitchingDosing is on, how far a temperature ramp or light cycle has got.
+Without it, a restart after a power blip or an update re-settles from scratch.
+
+An automation creates a Checkpoint in __init__, applies what `load()` returns, and hands its state (a small
+JSON-able dict) to `save()` after each execute. Saves go to local_persistant_storage under the experiment and
+the automation's name, every save_every_seconds, on disconnect, and, with save_changes_now, as soon as the
+state changes. `load()` only returns a checkpoint saved less than max_age_hours ago. Checkpoints are opt-in,
+in config.ini:
+
+    [automation_checkpoints]
+    enabled=1
+    # optional
+    save_every_seconds=60
+    max_age_hours=24
+
+Times in a checkpoint must be unix times: time.monotonic() restarts with the Pi.
+"""
+from __future__ import annotations
+
+import json
+import time
+from typing import Any, Optional
+
+from pioreactor.config import config
+from pioreactor.utils import local_persistant_storage
+
+CACHE_NAME = "automation_checkpoints"
+
+# the state of pioreactor.utils.streaming_calculations.PID between updates.
+PID_STATE = ("error_sum", "error_prev", "derivative_prev", "_last_input")
+
+
+def pid_state(pid: Any) -> dict[str, Optional[float]]:
+    return {name: getattr(pid, name, None) for name in PID_STATE}
+
+
+def restore_pid(pid: Any, state: Optional[dict[str, Optional[float]]]) -> None:
+    for name, value in (state or {}).items():
+        if name in PID_STATE:
+            setattr(pid, name, value)
+
+
+class Checkpoint:
+    """
+    save_changes_now: write a changed state right away instead of at the next save_every_seconds, for state
+    that changes rarely but matters, ex: which liquid is in the vial.
+    """
+
+    def __init__(self, job: Any, save_changes_now: bool = False) -> None:
+        self.job = job
+        self.save_changes_now = save_changes_now
+        self.key = f"{job.experiment}/{job.automation_name}"
+        self.enabled = config.getboolean("automation_checkpoints", "enabled", fallback=False)
+        self.save_every_seconds = config.getfloat("automation_checkpoints", "save_every_seconds", fallback=60.0)
+        self.max_age_seconds = config.getfloat("automation_checkpoints", "max_age_hours", fallback=24.0) * 3600
+        self.state: Optional[dict[str, Any]] = None  # last written
+        self._saved_at: Optional[float] = None  # time.monotonic()
+
+    def load(self) -> dict[str, Any]:
+        """The state saved by the last run of this automation in this experiment, or {}."""
+        if not self.enabled:
+            return {}
+        with local_persistant_storage(CACHE_NAME) as cache:
+            raw = cache.get(self.key)
+        if raw is None:
+            return {}
+
+        try:
+            checkpoint = json.loads(raw)
+        except ValueError:
+            return {}
+        age = time.time() - checkpoint.get("saved_at", 0.0)
+        if not (0 <= age <= self.max_age_seconds):
+            return {}
+
+        self.job.logger.info(f"Resuming from the checkpoint saved {age / 60:.1f} min ago.")
+        self.state = checkpoint["state"]
+        return checkpoint["state"]
+
+    def save(self, state: dict[str, Any], force: bool = False) -> None:
+        if not self.enabled:
+            return
+        # unchanged states are rewritten too, so a long-running job's checkpoint doesn't age out.
+        due = self._saved_at is None or time.monotonic() - self._saved_at >= self.save_every_seconds
+        if not (force or due or (self.save_changes_now and state != self.state)):
+            return
+
+        with local_persistant_storage(CACHE_NAME) as cache:
+            cache[self.key] = json.dumps({"saved_at": time.time(), "state": state})
+        self.state = state
+        self._saved_at = time.monotonic()
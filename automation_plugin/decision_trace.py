@@ -0,0 +1,378 @@
+# -*- coding: utf-8 -*-
+"""
+Opt-in binary trace of every automation decision.
+
+Enable in config.ini, then restart the automations:
+
+    [decision_trace]
+    enabled=1
+    # optional
+    directory=/home/pioreactor/.pioreactor/traces
+    buffer_records=4096
+    flush_every_seconds=60
+
+Like automation_profiling, importing this module wraps `execute` of every dosing, temperature and LED
+automation. After each execute, one fixed-width record (RECORD, 96 bytes) with the inputs the automation
+saw, the event it returned and the volumes it moved is packed into a preallocated buffer. With async_dosing,
+the record is packed once the exchanges the execute queued are done, or replaced, so it holds what they
+moved. Buffers are appended to <directory>/<unit>__<experiment>__<automation_name>.trace when full, every
+flush_every_seconds, when the automation disconnects, and at exit. Missing inputs are NaN.
+
+The files are plain arrays of records, so they can be memory-mapped without parsing:
+
+    > trace = decision_trace.load("pioreactor1__exp__morbidostat.trace")   # numpy.memmap, needs numpy
+    > trace["normalized_od"][trace["action"] == decision_trace.ACTIONS.index("AddAltMediaEvent")]
+"""
+from __future__ import annotations
+
+import atexit
+import functools
+import os
+import struct
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Optional
+
+from .dosing.dosing_queue import DosingQueue
+from .dosing.dosing_queue import PUMPS
+
+FIELDS = (
+    ("timestamp", "d"),
+    ("od", "d"),
+    ("normalized_od", "d"),
+    ("growth_rate", "d"),
+    ("temperature", "d"),
+    ("alt_media_fraction", "d"),
+    ("media_ml", "d"),
+    ("alt_media_ml", "d"),
+    ("waste_ml", "d"),
+    ("heater_duty_cycle", "d"),
+    ("led_intensity", "d"),
+    ("execute_seconds", "f"),
+    ("action", "B"),
+)
+RECORD = struct.Struct("<" + "".join(code for _, code in FIELDS) + "3x")  # padded to a multiple of 8 bytes
+
+# `action` is the index of the returned event's class name. 0 is also used for execute returning None.
+ACTIONS = (
+    "NoEvent",
+    "DilutionEvent",
+    "AddMediaEvent",
+    "AddAltMediaEvent",
+    "ChangedLedIntensity",
+    "UpdatedHeaterDC",
+    "ErrorOccurred",
+    "Other",
+)
+NAN = float("nan")
+OD_CHANNEL = "2"  # of latest_od, as read by the automations
+
+
+def record_dtype():
+    import numpy as np
+
+    return np.dtype([(name, "<" + ("f8" if code == "d" else "f4" if code == "f" else "u1")) for name, code in FIELDS] + [("_", "V3")])
+
+
+def load(path: str):
+    """Memory-map a trace file as a numpy structured array."""
+    import numpy as np
+
+    if os.path.getsize(path) == 0:
+        return np.zeros(0, dtype=record_dtype())
+    return np.memmap(path, dtype=record_dtype(), mode="r")
+
+
+class TraceWriter:
+    """Packs records into a preallocated buffer, and appends it to `path` in batches."""
+
+    def __init__(self, path: str, buffer_records: int = 4096, flush_every_seconds: float = 60.0) -> None:
+        self.path = path
+        self.flush_every_seconds = flush_every_seconds
+        self.buffer = bytearray(RECORD.size * buffer_records)
+        self.capacity = buffer_records
+        self.n = 0
+        self._lock = threading.Lock()
+        self._flushed_at = time.monotonic()
+
+    def append(self, *values: float) -> None:
+        with self._lock:
+            RECORD.pack_into(self.buffer, self.n * RECORD.size, *values)
+            self.n += 1
+            if self.n == self.capacity or time.monotonic() - self._flushed_at >= self.flush_every_seconds:
+                self._flush()
+
+    def _flush(self) -> None:
+        if self.n:
+            with open(self.path, "ab") as f:
+                f.write(memoryview(self.buffer)[: self.n * RECORD.size])
+            self.n = 0
+        self._flushed_at = time.monotonic()
+
+    def flush(self) -> None:
+        with self._lock:
+            self._flush()
+
+
+def _moved(future: Future) -> dict[str, float]:
+    # nothing was moved by an exchange that was replaced, or failed.
+    if future.cancelled() or future.exception() is not None:
+        return {}
+    return future.result()
+
+
+def _read(job: Any, name: str) -> float:
+    try:
+        value = getattr(job, name)
+    except Exception:  # ex: no OD readings yet
+        return NAN
+    if isinstance(value, dict):  # latest_od is keyed by PD channel
+        value = value.get(OD_CHANNEL)
+    try:
+        return float(value) if value is not None else NAN
+    except (TypeError, ValueError):
+        return NAN
+
+
+class DecisionTracer:
+    def __init__(self, directory: str, buffer_records: int = 4096, flush_every_seconds: float = 60.0) -> None:
+        self.directory = directory
+        self.buffer_records = buffer_records
+        self.flush_every_seconds = flush_every_seconds
+        self.writers: dict[str, TraceWriter] = {}
+        self._local = threading.local()
+        self._lock = threading.Lock()  # frames are completed from the DosingQueue thread, see _wrap_submit
+        self._patched: list[tuple[type, str, Any]] = []
+        self._wrappers: set[Callable] = set()
+        os.makedirs(directory, exist_ok=True)
+
+    def writer_for(self, job: Any) -> TraceWriter:
+        writer = getattr(job, "_decision_trace_writer", None)
+        if writer is None:
+            name = f"{job.unit}__{job.experiment}__{job.automation_name}.trace"
+            writer = TraceWriter(os.path.join(self.directory, name), self.buffer_records, self.flush_every_seconds)
+            object.__setattr__(job, "_decision_trace_writer", writer)
+            self.writers[writer.path] = writer
+        return writer
+
+    def flush(self) -> None:
+        for writer in list(self.writers.values()):
+            writer.flush()
+
+    def _append(self, job: Any, frame: dict[str, Any]) -> None:
+        inputs, outputs = frame["inputs"], frame["outputs"]
+        self.writer_for(job).append(*inputs, frame["media_ml"], frame["alt_media_ml"], frame["waste_ml"], *outputs)
+
+    # wrapping
+    def _wrap_execute(self, execute: Callable) -> Callable:
+        @functools.wraps(execute)
+        def traced_execute(job, *args, **kwargs):
+            if getattr(self._local, "frame", None) is not None:
+                return execute(job, *args, **kwargs)
+
+            frame = self._local.frame = {
+                "media_ml": 0.0,
+                "alt_media_ml": 0.0,
+                "waste_ml": 0.0,
+                "led_intensity": NAN,
+                "depth": 0,
+                "queued": 0,  # exchanges submitted to a DosingQueue and not done yet
+                "inputs": None,
+            }
+            started = time.perf_counter()
+            event = None
+            try:
+                event = execute(job, *args, **kwargs)
+                return event
+            finally:
+                elapsed = time.perf_counter() - started
+                self._local.frame = None
+                action = ACTIONS.index(type(event).__name__) if type(event).__name__ in ACTIONS else (0 if event is None else len(ACTIONS) - 1)
+                frame["outputs"] = (_read(job, "heater_duty_cycle"), frame["led_intensity"], elapsed, action)
+                with self._lock:
+                    frame["inputs"] = (
+                        time.time(),
+                        _read(job, "latest_od"),
+                        _read(job, "latest_normalized_od"),
+                        _read(job, "latest_growth_rate"),
+                        _read(job, "latest_temperature"),
+                        _read(job, "alt_media_fraction"),
+                    )
+                    done = frame["queued"] == 0
+                if done:
+                    self._append(job, frame)
+
+        return traced_execute
+
+    def _wrap_submit(self, submit: Callable) -> Callable:
+        # an asynchronous DosingQueue runs execute_io_action on its own thread, after execute has returned, so
+        # the volumes are added to the execute's frame when each exchange is done, and the record is packed
+        # after the last one. Synchronous exchanges run in submit, and are counted by traced_io_action.
+        @functools.wraps(submit)
+        def traced_submit(queue, *args, **kwargs):
+            frame = getattr(self._local, "frame", None)
+            if frame is None or not queue.asynchronous:
+                return submit(queue, *args, **kwargs)
+
+            with self._lock:
+                frame["queued"] += 1
+            try:
+                future = submit(queue, *args, **kwargs)
+            except Exception:
+                self._exchange_done(queue.job, frame, {})
+                raise
+            future.add_done_callback(lambda future: self._exchange_done(queue.job, frame, _moved(future)))
+            return future
+
+        return traced_submit
+
+    def _exchange_done(self, job: Any, frame: dict[str, Any], moved: dict[str, float]) -> None:
+        with self._lock:
+            for pump in PUMPS:
+                frame[pump] += float(moved.get(pump, 0.0))
+            frame["queued"] -= 1
+            done = frame["queued"] == 0 and frame["inputs"] is not None
+        if done:
+            self._append(job, frame)
+
+    def _wrap_on_disconnected(self, on_disconnected: Callable) -> Callable:
+        @functools.wraps(on_disconnected)
+        def flushing_on_disconnected(job, *args, **kwargs):
+            try:
+                return on_disconnected(job, *args, **kwargs)
+            finally:
+                # after the automation's own clean up, ex: stopping its DosingQueue, which packs the last records.
+                writer = getattr(job, "_decision_trace_writer", None)
+                if writer is not None:
+                    writer.flush()
+
+        return flushing_on_disconnected
+
+    def _wrap_io_action(self, execute_io_action: Callable) -> Callable:
+        @functools.wraps(execute_io_action)
+        def traced_io_action(job, *args, **kwargs):
+            frame = getattr(self._local, "frame", None)
+            if frame is None:
+                return execute_io_action(job, *args, **kwargs)
+
+            # only count the outermost call: execute_io_action recurses into subdoses.
+            frame["depth"] += 1
+            try:
+                moved = execute_io_action(job, *args, **kwargs)
+            finally:
+                frame["depth"] -= 1
+            if frame["depth"] == 0:
+                for pump in ("media_ml", "alt_media_ml", "waste_ml"):
+                    frame[pump] += float(moved.get(pump, 0.0))
+            return moved
+
+        return traced_io_action
+
+    def _wrap_led(self, setter: Callable) -> Callable:
+        @functools.wraps(setter)
+        def traced_setter(job, *args, **kwargs):
+            frame = getattr(self._local, "frame", None)
+            if frame is not None and args:
+                # set_led_intensity(channel, intensity) or set_led_intensities(intensity)
+                frame["led_intensity"] = float(args[-1])
+            return setter(job, *args, **kwargs)
+
+        return traced_setter
+
+    def _patch(self, cls: type, name: str, wrapper: Callable) -> None:
+        original = cls.__dict__.get(name)
+        if original is None or original in self._wrappers or isinstance(original, (staticmethod, classmethod)):
+            return
+        wrapped = wrapper(original)
+        self._wrappers.add(wrapped)
+        setattr(cls, name, wrapped)
+        self._patched.append((cls, name, original))
+
+    def _patch_class(self, cls: type) -> None:
+        self._patch(cls, "execute", self._wrap_execute)
+        self._patch(cls, "execute_io_action", self._wrap_io_action)
+        self._patch(cls, "set_led_intensity", self._wrap_led)
+        self._patch(cls, "set_led_intensities", self._wrap_led)
+        self._patch(cls, "on_disconnected", self._wrap_on_disconnected)
+
+    def install(self, base_classes: list[type]) -> None:
+        def all_subclasses(cls: type) -> list[type]:
+            return [cls] + [sub for direct in cls.__subclasses__() for sub in all_subclasses(direct)]
+
+        self._patch(DosingQueue, "submit", self._wrap_submit)
+        for base in base_classes:
+            for cls in all_subclasses(base):
+                self._patch_class(cls)
+            if "on_disconnected" not in base.__dict__:
+                # automations that don't define one.
+                base.on_disconnected = self._wrap_on_disconnected(base.on_disconnected)  # type: ignore
+                self._patched.append((base, "on_disconnected", None))
+
+            # automations defined after this point.
+            original = base.__dict__.get("__init_subclass__")
+            tracer = self
+
+            def __init_subclass__(cls, base=base, original=original, **kwargs):
+                if original is not None:
+                    original.__func__(cls, **kwargs)
+                else:
+                    super(base, cls).__init_subclass__(**kwargs)
+                tracer._patch_class(cls)
+
+            base.__init_subclass__ = classmethod(__init_subclass__)  # type: ignore
+            self._patched.append((base, "__init_subclass__", original))
+
+    def uninstall(self) -> None:
+        self.flush()
+        for cls, name, original in reversed(self._patched):
+            if original is None:
+                delattr(cls, name)
+            else:
+                setattr(cls, name, original)
+        self._patched = []
+
+
+TRACER: Optional[DecisionTracer] = None
+
+
+def enable(directory: str, buffer_records: int = 4096, flush_every_seconds: float = 60.0) -> DecisionTracer:
+    global TRACER
+    if TRACER is not None:
+        return TRACER
+
+    from pioreactor.automations.dosing.base import DosingAutomationJob
+    from pioreactor.automations.led.base import LEDAutomationJob
+    from pioreactor.automations.temperature.base import TemperatureAutomationJob
+
+    TRACER = DecisionTracer(directory, buffer_records, flush_every_seconds)
+    TRACER.install([DosingAutomationJob, TemperatureAutomationJob, LEDAutomationJob])
+    atexit.register(TRACER.flush)
+    return TRACER
+
+
+def disable() -> None:
+    global TRACER
+    if TRACER is not None:
+        atexit.unregister(TRACER.flush)
+        TRACER.uninstall()
+        TRACER = None
+
+
+def enable_from_config() -> Optional[DecisionTracer]:
+    try:
+        from pioreactor.config import config
+    except ImportError:
+        # off the device, ex: to load() or replay traces.
+        return None
+
+    if not config.getboolean("decision_trace", "enabled", fallback=False):
+        return None
+    return enable(
+        directory=config.get("decision_trace", "directory", fallback="/home/pioreactor/.pioreactor/traces"),
+        buffer_records=config.getint("decision_trace", "buffer_records", fallback=4096),
+        flush_every_seconds=config.getfloat("decision_trace", "flush_every_seconds", fallback=60.0),
+    )
+
+
+enable_from_config()
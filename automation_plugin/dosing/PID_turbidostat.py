@@ -8,10 +8,16 @@ from contextlib import suppress
 from pioreactor.automations import events
 from pioreactor.automations.dosing.base import DosingAutomationJob
 from pioreactor.config import config
-from pioreactor.exc import CalibrationError
-from pioreactor.utils import local_persistant_storage
 from pioreactor.utils.streaming_calculations import PID
 
+from ..checkpoints import Checkpoint
+from ..checkpoints import pid_state
+from ..checkpoints import restore_pid
+from ..utils import as_bool
+from .dosing_queue import DosingQueue
+from .od_estimator import ODEstimator
+from .pump_calibrations import require_calibrations
+
 class PIDTurbidostat(DosingAutomationJob):
     """
     Turbidostat mode - try to keep cell density constant by dosing whenever the target is surpassed by using PID method
@@ -21,25 +27,32 @@ class PIDTurbidostat(DosingAutomationJob):
         "target_normalized_od": {"datatype": "float", "settable": True, "unit": "AU"},
         "target_od": {"datatype": "float", "settable": True, "unit": "OD"},
         "duration": {"datatype": "float", "settable": True, "unit": "min"},
+        "async_dosing": {"datatype": "boolean", "settable": False},
+        "od_window": {"datatype": "integer", "settable": False},
     }
+    REQUIRED_PUMPS = ("media", "waste")
     target_od = None
     target_normalized_od = None
-    VIAL_VOLUME = config.getfloat("bioreactor", "max_volume_ml", fallback=14)
 
     def __init__(
         self,
         target_normalized_od: Optional[float | str] = None,
         target_od: Optional[float | str] = None,
+        async_dosing: bool | str = False,
+        od_window: int | str = 0,
         **kwargs,
     ) -> None:
         super().__init__(**kwargs)
 
 
-        with local_persistant_storage("current_pump_calibration") as cache:
-            if "media" not in cache:
-                raise CalibrationError("Media pump calibration must be performed first.")
-            elif "waste" not in cache:
-                raise CalibrationError("Waste pump calibration must be performed first.")
+        require_calibrations(self.REQUIRED_PUMPS)
+        # opt-in: submit exchanges to a background queue instead of blocking execute while the pumps run.
+        self.async_dosing = as_bool(async_dosing)
+        self.dosing_queue = DosingQueue(self, asynchronous=self.async_dosing)
+        # opt-in: trigger on, and feed the PID, a regression over the last od_window readings instead of the
+        # latest one, so noise isn't amplified by the derivative term.
+        self.od_window = int(od_window)
+        self.od_estimator = ODEstimator(self.od_window) if self.od_window else None
 
         if target_normalized_od is not None and target_od is not None:
             raise ValueError("Only provide target nOD or target OD, not both.")
@@ -49,18 +62,21 @@ class PIDTurbidostat(DosingAutomationJob):
         
 
 
+        # read here rather than at class definition, so importing the plugin doesn't need the config.
+        self.max_volume_ml = config.getfloat("bioreactor", "max_volume_ml", fallback=14)
         Kp = config.getfloat("dosing_automation.pid_turbidostat", "Kp")
         Ki = config.getfloat("dosing_automation.pid_turbidostat", "Ki")
         Kd = config.getfloat("dosing_automation.pid_turbidostat", "Kd")
 
         if target_normalized_od is not None:
-            self.set_target_nod(target_normalized_od)
+            # set directly: set_target_nod checks is_targeting_nOD, which relies on this attribute.
+            self.target_normalized_od = float(target_normalized_od)
             self.pid = PID(
             -Kp,
             -Ki,
             -Kd,
             setpoint=self.target_normalized_od,
-            output_limits=(0, 14),
+            output_limits=(0, self.max_volume_ml),
             sample_time=None,
             unit=self.unit,
             experiment=self.experiment,
@@ -68,13 +84,13 @@ class PIDTurbidostat(DosingAutomationJob):
             target_name="normalized_od",
         )
         elif target_od is not None:
-            self.set_target_od(target_od)
+            self.target_od = float(target_od)
             self.pid = PID(
             -Kp,
             -Ki,
             -Kd,
             setpoint=self.target_od,
-            output_limits=(0, 14),
+            output_limits=(0, self.max_volume_ml),
             sample_time=None,
             unit=self.unit,
             experiment=self.experiment,
@@ -86,53 +102,80 @@ class PIDTurbidostat(DosingAutomationJob):
         assert isinstance(self.duration, float)
         self.volume = 0.
 
+        # warm restart: pick up the PID's integral where the last run of this experiment left it.
+        self.checkpoint = Checkpoint(self)
+        restore_pid(self.pid, self.checkpoint.load().get("pid"))
+
     @property
     def is_targeting_nOD(self) -> bool:
         return self.target_normalized_od is not None
 
-    def execute(self) -> Optional[events.DilutionEvent]:
+    def _filtered(self, latest: float) -> float:
+        if self.od_estimator is None:
+            return latest
+        self.od_estimator.update(latest)
+        return self.od_estimator.od
+
+    def _exchange(self, ml: float) -> float:
+        # with async_dosing, only what was asked for is known yet.
+        moved = self.dosing_queue.exchange(media_ml=ml, waste_ml=ml)
+        return ml if moved is None else moved["media_ml"]
+
+    def _account_for_exchanges(self) -> None:
+        # the exchanges done since the last execute, before the estimator sees a reading taken after them.
+        for moved in self.dosing_queue.collect():
+            if self.od_estimator is not None:
+                self.od_estimator.exchanged(self.vial_volume, moved["media_ml"])
+
+    def execute(self) -> Optional[events.AutomationEvent]:
+        self._account_for_exchanges()
+        if self.dosing_queue.busy:
+            # don't update the PID on a reading the exchange in flight hasn't finished diluting.
+            return events.NoEvent("waiting for the last exchange to finish.")
         if self.is_targeting_nOD:
-            return self._execute_target_nod()
+            event = self._execute_target_nod()
         else:
-            return self._execute_target_od()
+            event = self._execute_target_od()
+        self.checkpoint.save({"pid": pid_state(self.pid)})
+        return event
 
 
 
 
     def _execute_target_od(self) -> Optional[events.DilutionEvent]:
         assert self.target_od is not None
-        if self.latest_od["2"] >= self.target_od:
-            latest_od_before_dosing = self.latest_od["2"]
+        latest_od = self._filtered(self.latest_od["2"])
+        if latest_od >= self.target_od:
+            latest_od_before_dosing = latest_od
             target_od_before_dosing = self.target_od
-            self.volume = self.pid.update(self.latest_od, dt=self.duration / 60)
+            self.volume = self.pid.update(latest_od_before_dosing, dt=self.duration / 60)
 
-            results = self.execute_io_action(media_ml=self.volume, waste_ml=self.volume)
-            media_moved = results["media_ml"]
+            media_moved = self._exchange(self.volume)
             return events.DilutionEvent(
-                f"Latest Normalized OD = {latest_od_before_dosing:.2f} ≥ Target  nOD = {target_od_before_dosing:.2f}; cycled {media_moved:.2f} mL",
+                f"Latest Normalized OD = {latest_od_before_dosing:.2f} ≥ Target  nOD = {target_od_before_dosing:.2f}; {self.dosing_queue.verb} {media_moved:.2f} mL",
                 {
                     "latest_normalized_od": latest_od_before_dosing,
                     "target_normalized_od": target_od_before_dosing,
-                    "volume": media_moved,
+                    self.dosing_queue.volume_key: media_moved,
                 },
             )
         else:
             return None
     def _execute_target_nod(self) -> Optional[events.DilutionEvent]:
         assert self.target_normalized_od is not None
-        if self.latest_normalized_od >= self.target_normalized_od:
-            latest_normalized_od_before_dosing = self.latest_normalized_od
+        latest_normalized_od = self._filtered(self.latest_normalized_od)
+        if latest_normalized_od >= self.target_normalized_od:
+            latest_normalized_od_before_dosing = latest_normalized_od
             target_normalized_od_before_dosing = self.target_normalized_od
-            self.volume = self.pid.update(self.latest_normalized_od, dt=self.duration / 60)
+            self.volume = self.pid.update(latest_normalized_od, dt=self.duration / 60)
 
-            results = self.execute_io_action(media_ml=self.volume, waste_ml=self.volume)
-            media_moved = results["media_ml"]
+            media_moved = self._exchange(self.volume)
             return events.DilutionEvent(
-                f"Latest Normalized OD = {latest_normalized_od_before_dosing:.2f} ≥ Target  nOD = {target_normalized_od_before_dosing:.2f}; cycled {media_moved:.2f} mL",
+                f"Latest Normalized OD = {latest_normalized_od_before_dosing:.2f} ≥ Target  nOD = {target_normalized_od_before_dosing:.2f}; {self.dosing_queue.verb} {media_moved:.2f} mL",
                 {
                     "latest_normalized_od": latest_normalized_od_before_dosing,
                     "target_normalized_od": target_normalized_od_before_dosing,
-                    "volume": media_moved,
+                    self.dosing_queue.volume_key: media_moved,
                 },
             )
         else:
@@ -155,8 +198,15 @@ class PIDTurbidostat(DosingAutomationJob):
             with suppress(AttributeError):
                 self.pid.set_setpoint(self.target_normalized_od)
 
+    def on_disconnected(self) -> None:
+        super().on_disconnected()
+        self.dosing_queue.stop()
+        self.checkpoint.save({"pid": pid_state(self.pid)}, force=True)
+
 
 
+# run on the command line, from the repo root, with
+# $ python3 -m automation_plugin.dosing.PID_turbidostat
 if __name__ == "__main__":
     from pioreactor.background_jobs.dosing_control import DosingController
 
@@ -0,0 +1,224 @@
+# -*- coding: utf-8 -*-
+from __future__ import annotations
+
+from typing import Optional
+
+from pioreactor.automations import events
+from pioreactor.automations.dosing.base import DosingAutomationJob
+
+from ..checkpoints import Checkpoint
+from ..utils import as_bool
+from .dosing_queue import DosingQueue
+from .mixing import dilution_plan
+from .od_estimator import ODEstimator
+from .pump_calibrations import require_calibrations
+
+
+class AdaptedTurbidostat(DosingAutomationJob):
+    """
+    Adapted Turbidostat mode - adjust media volume based on OD levels
+    """
+
+    automation_name = "adapted_turbidostat"
+    published_settings = {
+        "volume": {"datatype": "float", "settable": True, "unit": "mL"},
+        "max_od": {"datatype": "float", "settable": True, "unit": "OD"},
+        "min_od": {"datatype": "float", "settable": True, "unit": "OD"},
+        "max_normalized_od": {"datatype": "float", "settable": True, "unit": "AU"},
+        "min_normalized_od": {"datatype": "float", "settable": True, "unit": "AU"},
+        "duration": {"datatype": "float", "settable": True, "unit": "min"},
+        "dosing_mode": {"datatype": "string", "settable": True},
+        "async_dosing": {"datatype": "boolean", "settable": False},
+        "od_window": {"datatype": "integer", "settable": False},
+    }
+    REQUIRED_PUMPS = ("media", "waste")
+    DOSING_MODES = ("fixed_volume", "single_dose")
+
+    def __init__(
+        self,
+        volume: float | str,
+        max_od: float,
+        min_od: float,
+        max_normalized_od: Optional[float | str],
+        min_normalized_od: Optional[float | str],
+        dosing_mode: str = "fixed_volume",
+        async_dosing: bool | str = False,
+        od_window: int | str = 0,
+        **kwargs,
+    ) -> None:
+        super().__init__(**kwargs)
+        use_normalized_od = (float(min_normalized_od) > 0 and float(max_normalized_od) > 0)
+        use_raw_od = float(min_od) > 0 and float(max_od) > 0
+        require_calibrations(self.REQUIRED_PUMPS)
+        # opt-in: submit exchanges to a background queue instead of blocking execute while the pumps run.
+        self.async_dosing = as_bool(async_dosing)
+        self.dosing_queue = DosingQueue(self, asynchronous=self.async_dosing)
+        if use_normalized_od and use_raw_od:
+            raise ValueError("Use only raw Or normalized OD")
+        if not (use_raw_od or use_normalized_od):
+            raise ValueError("Provide OD values")
+
+        if use_normalized_od:
+            self.is_pumping = False
+            self.use_normalized_od = True
+        else:
+            self.is_pumping = False
+            self.use_normalized_od = False
+
+        self.volume = float(volume)
+        self.min_od = float(min_od)
+        self.max_od = float(max_od)
+        self.max_normalized_od = float(max_normalized_od)
+        self.min_normalized_od = float(min_normalized_od)
+        self.set_dosing_mode(dosing_mode)
+
+        # opt-in: trigger on a regression over the last od_window readings instead of the latest one.
+        self.od_window = int(od_window)
+        self.od_estimator = ODEstimator(self.od_window) if self.od_window else None
+
+        # warm restart: keep diluting down to the minimum if the last run of this experiment was.
+        self.checkpoint = Checkpoint(self, save_changes_now=True)
+        self.is_pumping = bool(self.checkpoint.load().get("is_pumping", self.is_pumping))
+
+    @property
+    def filtered_od(self) -> float:
+        """The latest OD, or normalized OD if use_normalized_od, smoothed if od_window is set."""
+        if self.od_estimator is not None:
+            return self.od_estimator.od
+        return self.latest_normalized_od if self.use_normalized_od else self.latest_od["2"]
+
+    def _exchange(self, ml: float, replaceable: bool = True) -> float:
+        # with async_dosing, only what was asked for is known yet.
+        moved = self.dosing_queue.exchange(replaceable=replaceable, media_ml=ml, waste_ml=ml)
+        return ml if moved is None else moved["media_ml"]
+
+    def _account_for_exchanges(self) -> None:
+        # the exchanges done since the last execute, before the estimator sees a reading taken after them.
+        for moved in self.dosing_queue.collect():
+            if self.od_estimator is not None:
+                self.od_estimator.exchanged(self.vial_volume, moved["media_ml"])
+
+    def set_dosing_mode(self, value: str) -> None:
+        if value not in self.DOSING_MODES:
+            raise ValueError(f"dosing_mode must be one of {self.DOSING_MODES}.")
+        self.dosing_mode = value
+
+    def on_disconnected(self) -> None:
+        super().on_disconnected()
+        self.dosing_queue.stop()
+        self.checkpoint.save({"is_pumping": self.is_pumping}, force=True)
+
+    def execute(self) -> Optional[events.AutomationEvent]:
+        event = self._execute()
+        self.checkpoint.save({"is_pumping": self.is_pumping})
+        return event
+
+    def _execute(self) -> Optional[events.AutomationEvent]:
+        self._account_for_exchanges()
+        if self.dosing_queue.busy:
+            # the reading was taken before the exchange in flight is done: wait for the next one.
+            return events.NoEvent("waiting for the last exchange to finish.")
+
+        if self.od_estimator is not None:
+            self.od_estimator.update(self.latest_normalized_od if self.use_normalized_od else self.latest_od["2"])
+
+        if self.dosing_mode == "single_dose":
+            return self._execute_single_dose()
+        elif self.use_normalized_od:
+            if self.filtered_od >= self.max_normalized_od:
+                    
+                # Start or continue pumping if normalized OD is above the maximum threshold
+                return self._execute_max_normalized_od()
+            elif self.is_pumping and self.filtered_od >= self.min_normalized_od:
+                # Continue pumping if already in the pumping state and normalized OD is above the minimum threshold
+                return self._execute_pumping_normalized_od()
+            else:
+                self.is_pumping = False
+                return None
+        else:
+            if self.filtered_od >= self.max_od:
+                # Start or continue pumping if OD is above the maximum threshold
+                return self._execute_max_od()
+            elif self.is_pumping and self.filtered_od >= self.min_od:
+                # Continue pumping if already in the pumping state and OD is above the minimum threshold
+                return self._execute_pumping()
+            else:
+                self.is_pumping = False
+                return None
+            
+
+        # Dans la fonction _execute_max_normalized_od
+    def _execute_max_normalized_od(self) -> Optional[events.DilutionEvent]:
+        # Start pumping if normalized OD is above the maximum threshold
+        self.is_pumping = True
+        return self._execute_pumping_normalized_od()
+
+    # Dans la fonction _execute_pumping_normalized_od
+    def _execute_pumping_normalized_od(self) -> Optional[events.DilutionEvent]:
+        # Continue pumping until normalized OD is below the minimum threshold
+        if self.filtered_od >= self.min_normalized_od:
+            latest_normalized_od_before_dosing = self.filtered_od
+            target_normalized_od_before_dosing = self.min_normalized_od
+            media_moved = self._exchange(self.volume)
+            return events.DilutionEvent(
+                f"Latest Normalized OD = {latest_normalized_od_before_dosing:.2f} ≥ Min Normalized OD = {target_normalized_od_before_dosing:.2f}; {self.dosing_queue.verb} {media_moved:.2f} mL",
+                {
+                    "latest_normalized_od": latest_normalized_od_before_dosing,
+                    "target_normalized_od": target_normalized_od_before_dosing,
+                    self.dosing_queue.volume_key: media_moved,
+                },
+            )
+        else:
+            return None
+
+
+    def _execute_max_od(self) -> Optional[events.DilutionEvent]:
+        # Start pumping if OD is above the maximum threshold
+        self.is_pumping = True
+        return self._execute_pumping()
+
+
+    def _execute_pumping(self) -> Optional[events.DilutionEvent]:
+        # Continue pumping until OD is below the minimum threshold
+        if self.filtered_od >= self.min_od and self.is_pumping:
+            latest_od_before_dosing = self.filtered_od
+            target_od_before_dosing = self.min_od
+            media_moved = self._exchange(self.volume)
+            return events.DilutionEvent(
+             f"Latest OD = {latest_od_before_dosing:.2f} ≥ Min OD = {target_od_before_dosing:.2f}; {self.dosing_queue.verb} {media_moved:.2f} mL",
+             {
+                 "latest_od": latest_od_before_dosing,
+                 "target_od": target_od_before_dosing,
+                 self.dosing_queue.volume_key: media_moved,
+             },
+         )
+    
+        else:
+            return None
+
+    def _execute_single_dose(self) -> Optional[events.DilutionEvent]:
+        # dilute from above the maximum straight down to the minimum in one go, instead of one `volume` per cycle.
+        if self.use_normalized_od:
+            name, latest, maximum, minimum = "normalized_od", self.filtered_od, self.max_normalized_od, self.min_normalized_od
+        else:
+            name, latest, maximum, minimum = "od", self.filtered_od, self.max_od, self.min_od
+
+        if latest < maximum:
+            return None
+
+        # full-size actuations, then one smaller one that lands on the minimum.
+        plan = dilution_plan(latest, minimum, self.vial_volume, self.MAX_SUBDOSE)
+        media_moved = 0.0
+        for ml in plan:
+            # don't let the steps replace each other: the plan needs all of them.
+            media_moved += self._exchange(ml, replaceable=False)
+
+        label = "Normalized OD" if self.use_normalized_od else "OD"
+        return events.DilutionEvent(
+            f"Latest {label} = {latest:.2f} ≥ Max {label} = {maximum:.2f}; {self.dosing_queue.verb} {media_moved:.2f} mL in {len(plan)} actuations to reach Min {label} = {minimum:.2f}",
+            {
+                f"latest_{name}": latest,
+                f"target_{name}": minimum,
+                self.dosing_queue.volume_key: media_moved,
+            },
+        )
@@ -3,8 +3,9 @@ from __future__ import annotations
 
 from pioreactor.automations import events
 from pioreactor.automations.dosing.base import DosingAutomationJobContrib
-from pioreactor.exc import CalibrationError
-from pioreactor.utils import local_persistant_storage
+
+from .mixing import co_dosing_split
+from .pump_calibrations import require_calibrations
 
 
 class ChemostatWithConstantAltMediaFraction(DosingAutomationJobContrib):
@@ -16,23 +17,45 @@ class ChemostatWithConstantAltMediaFraction(DosingAutomationJobContrib):
     published_settings = {
         "volume": {"datatype": "float", "settable": True, "unit": "mL"},
         "target_fraction": {"datatype": "float", "settable": True, "unit": "%"},
+        "exchange_mode": {"datatype": "string", "settable": True},
     }
+    REQUIRED_PUMPS = ("media", "waste", "alt_media")
+    EXCHANGE_MODES = ("sequential", "co_dosing")
 
-    def __init__(self, volume: float | str, target_fraction: float | str, **kwargs) -> None:
+    def __init__(self, volume: float | str, target_fraction: float | str, exchange_mode: str = "sequential", **kwargs) -> None:
         super().__init__(**kwargs)
 
-        with local_persistant_storage("current_pump_calibration") as cache:
-            if "media" not in cache:
-                raise CalibrationError("Media pump calibration must be performed first.")
-            elif "waste" not in cache:
-                raise CalibrationError("Waste pump calibration must be performed first.")
-            elif "alt_media" not in cache:
-                raise CalibrationError("Alt-media pump calibration must be performed first.")
+        require_calibrations(self.REQUIRED_PUMPS)
 
         self.volume = float(volume)
         self.target_fraction = float(target_fraction)
+        self.set_exchange_mode(exchange_mode)
+
+    def set_exchange_mode(self, value: str) -> None:
+        if value not in self.EXCHANGE_MODES:
+            raise ValueError(f"exchange_mode must be one of {self.EXCHANGE_MODES}.")
+        self.exchange_mode = value
 
     def execute(self) -> events.DilutionEvent:
+        if self.exchange_mode == "co_dosing":
+            return self._execute_co_dosing()
+        else:
+            return self._execute_sequential()
+
+    def _execute_co_dosing(self) -> events.DilutionEvent:
+        # split the exchange between media and alt media up front, so one exchange (and one waste step per
+        # subdose) lands on target_fraction. `volume` is the media per cycle, as in sequential mode, so both modes
+        # dilute at the same rate: at target_fraction, that's an exchange of volume / (1 - target_fraction). It's
+        # enlarged if even that much alt media can't get there.
+        total_ml = self.volume / (1 - self.target_fraction)
+        media_ml, alt_media_ml = co_dosing_split(self.alt_media_fraction, self.target_fraction, self.vial_volume, total_ml, self.MAX_SUBDOSE)
+        exchanged = self.execute_io_action(media_ml=media_ml, alt_media_ml=alt_media_ml, waste_ml=media_ml + alt_media_ml)
+
+        return events.DilutionEvent(
+            f"exchanged {exchanged['media_ml']:.2f}ml of media and {exchanged['alt_media_ml']:.2f}mL of alt media",
+        )
+
+    def _execute_sequential(self) -> events.DilutionEvent:
         media_exchanged = self.execute_io_action(media_ml=self.volume, waste_ml=self.volume)
 
         # after this occurs, our alt_media_fraction has been reduced. We need to get it back up to target_fraction.
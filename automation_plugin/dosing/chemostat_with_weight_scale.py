@@ -0,0 +1,670 @@
+import time
+from collections import deque
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Callable, Iterable, Optional
+
+from msgspec.json import decode, encode
+from pioreactor.actions.pump import PWMPump
+from pioreactor.config import config
+from pioreactor.automations.dosing.base import DosingAutomationJobContrib
+from pioreactor.automations import events
+from pioreactor.exc import CalibrationError
+from pioreactor.hardware import PWM_TO_PIN
+from pioreactor.pubsub import QOS
+from pioreactor.structs import DosingEvent
+from pioreactor.structs import PumpCalibration
+from pioreactor.utils import local_persistant_storage
+
+from ..utils import as_bool
+from .scale import ScaleReader
+
+# runs the pumps at 50% until ChemostatWithScale.calibrate has fitted them. Weighed doses only need the duty
+# cycle from it, not the volumes.
+SlowPump = PumpCalibration(
+    name="SlowCalibration",
+    pioreactor_unit="_testing",
+    created_at="2024-01-01",
+    pump="",
+    hz=200.0,
+    dc=50.0,
+    duration_=1.0,
+    bias_=0,
+    voltage=-1,
+)
+
+# calibrations fitted by ChemostatWithScale.calibrate, by pump. Kept apart from the pump calibrations the
+# other automations use, which are measured at their own duty cycle.
+CALIBRATION_CACHE_NAME = "chemostat_with_scale_calibration"
+
+# dosing_events' event, by pump.
+DOSING_EVENTS = {"media": "add_media", "alt_media": "add_alt_media", "waste": "remove_waste"}
+
+
+def _solve(a: list[list[float]], b: list[float]) -> list[float]:
+    # Gaussian elimination with partial pivoting, for the small normal equations below.
+    n = len(b)
+    m = [row[:] + [b_i] for row, b_i in zip(a, b)]
+    for col in range(n):
+        pivot = max(range(col, n), key=lambda r: abs(m[r][col]))
+        if abs(m[pivot][col]) < 1e-12:
+            raise ValueError("Singular system.")
+        m[col], m[pivot] = m[pivot], m[col]
+        for r in range(col + 1, n):
+            f = m[r][col] / m[col][col]
+            for c in range(col, n + 1):
+                m[r][c] -= f * m[col][c]
+    x = [0.0] * n
+    for r in reversed(range(n)):
+        x[r] = (m[r][n] - sum(m[r][c] * x[c] for c in range(r + 1, n))) / m[r][r]
+    return x
+
+
+def fit_pump_model(runs: Iterable[tuple[float, float, float]]) -> tuple[float, float, float]:
+    """
+    Least-squares fit of ml = seconds * (rate + rate_per_dc * dc) + bias to (dc, seconds, ml) runs, jointly over
+    all duty cycles. Returns (rate, rate_per_dc, bias), in mL/s, mL/s per % and mL.
+    """
+    # normal equations of the design matrix with columns [seconds, seconds * dc, 1], accumulated in one pass.
+    xtx = [[0.0] * 3 for _ in range(3)]
+    xty = [0.0] * 3
+    for dc, seconds, ml in runs:
+        row = (seconds, seconds * dc, 1.0)
+        for i in range(3):
+            xty[i] += row[i] * ml
+            for j in range(3):
+                xtx[i][j] += row[i] * row[j]
+    try:
+        rate, rate_per_dc, bias = _solve(xtx, xty)
+    except ValueError:
+        raise ValueError("Need runs at two or more duty cycles, and two or more durations.")
+    return rate, rate_per_dc, bias
+
+
+def flow_rate(samples: list[tuple[float, float]]) -> float:
+    # least-squares slope of weight against time, in g/s (~ mL/s).
+    n = len(samples)
+    if n < 2:
+        return 0.0
+    mean_t = sum(t for t, _ in samples) / n
+    mean_w = sum(w for _, w in samples) / n
+    var_t = sum((t - mean_t) ** 2 for t, _ in samples)
+    if var_t == 0:
+        return 0.0
+    return sum((t - mean_t) * (w - mean_w) for t, w in samples) / var_t
+
+
+@dataclass
+class GravimetricDoseResult:
+    target_ml: float
+    moved_ml: float
+    elapsed_s: float
+    stopped_by: str  # one of "prediction", "target", "timeout", "volume_ceiling", "state", or "time" for timed doses
+
+    @property
+    def overshoot_ml(self) -> float:
+        return self.moved_ml - self.target_ml
+
+
+class PredictiveStop:
+    """
+    Closed-loop stop for a running pump, driven by the ScaleReader stream. The live flow rate is the
+    least-squares slope of the most recent weights, and the pump is stopped as soon as the volume
+    predicted to arrive before the stop takes effect would reach the target. This compensates for
+    sample age and stop latency, which otherwise show up as overshoot.
+
+    `direction` is +1 when the vial gains weight (adding media) and -1 when it loses weight (waste).
+    """
+
+    def __init__(
+        self,
+        scale: ScaleReader,
+        target_ml: float,
+        direction: int = 1,
+        stop_latency_s: float = 0.1,
+        max_seconds: float = 120.0,
+        max_ml: Optional[float] = None,
+        window: int = 8,
+        settle_s: float = 1.0,
+    ) -> None:
+        assert direction in (1, -1)
+        self.scale = scale
+        self.target_ml = target_ml
+        self.direction = direction
+        self.stop_latency_s = stop_latency_s
+        self.max_seconds = max_seconds
+        self.max_ml = max_ml if max_ml is not None else 2 * target_ml
+        self.window = window
+        self.settle_s = settle_s
+
+    def run(self, initial_weight: float, stop_pump: Callable[[], None], should_continue: Callable[[], bool]) -> GravimetricDoseResult:
+        """
+        Call right after the pump is started. Blocks (sleeping between samples) until the pump should stop,
+        calls `stop_pump`, waits for the weight to settle, and reports what was actually moved.
+        """
+        started_at = time.monotonic()
+        last_ts = started_at
+        recent: deque[tuple[float, float]] = deque(maxlen=self.window)
+        stopped_by = "timeout"
+
+        while True:
+            elapsed = time.monotonic() - started_at
+            if elapsed >= self.max_seconds:
+                stopped_by = "timeout"
+                break
+            if not should_continue():
+                stopped_by = "state"
+                break
+
+            sample = self.scale.wait_for_sample(after=last_ts, timeout=min(self.scale.timeout, self.max_seconds - elapsed))
+            if sample is None:
+                continue
+
+            last_ts, weight = sample
+            recent.append(sample)
+            moved = self.direction * (weight - initial_weight)
+
+            if moved >= self.max_ml:
+                stopped_by = "volume_ceiling"
+                break
+            if moved >= self.target_ml:
+                stopped_by = "target"
+                break
+
+            # volume expected to arrive between this sample and the pump actually stopping.
+            rate = max(self.direction * flow_rate(list(recent)), 0.0)
+            in_flight = rate * (time.monotonic() - last_ts + self.stop_latency_s)
+            if moved + in_flight >= self.target_ml:
+                stopped_by = "prediction"
+                break
+
+        stop_pump()
+        stopped_at = time.monotonic()
+
+        # let drops land and the scale settle before taking the final reading.
+        time.sleep(self.settle_s)
+        settled = self.scale.samples(since=stopped_at + self.settle_s / 2)
+        if settled:
+            final_weight = sum(w for _, w in settled) / len(settled)
+        else:
+            final_weight = self.scale.mean_weight(n=3)
+
+        return GravimetricDoseResult(
+            target_ml=self.target_ml,
+            moved_ml=self.direction * (final_weight - initial_weight),
+            elapsed_s=stopped_at - started_at,
+            stopped_by=stopped_by,
+        )
+
+
+@dataclass
+class ConcurrentExchangeResult:
+    target_ml: float
+    media_ml: float  # from the media pump's on-time and flow rate
+    waste_ml: float  # media_ml less the net weight change
+    net_ml: float
+    elapsed_s: float
+    trims: int
+    stopped_by: str  # one of "target", "timeout", "state"
+
+
+class BalancedExchange:
+    """
+    Runs the media and waste pumps at the same time, driven by the ScaleReader stream. Whichever pump is ahead
+    is paused when the net weight leaves ±tolerance_ml of where it started, and restarted once the other one
+    has brought it back to the start.
+
+    The scale only sees the net change, so the media volume is integrated from the media pump's on-time and
+    flow rate. That rate is measured whenever media runs alone: a short lead-in up to +tolerance_ml, and while
+    waste is paused. The waste rate is measured while media is paused, or inferred from the net flow with both
+    running. Media run before the first rate is measured is counted once it is. Once target_ml of media is in,
+    media stops and waste runs alone back down to the starting weight.
+    """
+
+    def __init__(
+        self,
+        scale: ScaleReader,
+        target_ml: float,
+        tolerance_ml: float = 0.5,
+        stop_latency_s: float = 0.1,
+        max_seconds: float = 240.0,
+        window: int = 8,
+        settle_s: float = 1.0,
+        flow_rates: Optional[dict[str, float]] = None,
+    ) -> None:
+        self.scale = scale
+        self.target_ml = target_ml
+        self.tolerance_ml = tolerance_ml
+        self.stop_latency_s = stop_latency_s
+        self.max_seconds = max_seconds
+        self.window = window
+        self.settle_s = settle_s
+        # mL/s, by pump. Seeded from the previous exchange, and updated as they're measured.
+        self.flow_rates = dict(flow_rates or {})
+
+    def _update_flow_rates(self, running: dict[str, bool], recent: deque[tuple[float, float]]) -> None:
+        if len(recent) < 3:
+            return
+        net_rate = flow_rate(list(recent))
+        if running["media"] and not running["waste"]:
+            self.flow_rates["media"] = net_rate
+        elif running["waste"] and not running["media"]:
+            self.flow_rates["waste"] = -net_rate
+        elif running["media"] and running["waste"] and "media" in self.flow_rates:
+            self.flow_rates["waste"] = self.flow_rates["media"] - net_rate
+
+    def run(
+        self,
+        initial_weight: float,
+        start_pump: Callable[[str], None],
+        stop_pump: Callable[[str], None],
+        should_continue: Callable[[], bool],
+    ) -> ConcurrentExchangeResult:
+        """
+        Blocks until the exchange is done, starting and stopping the "media" and "waste" pumps with
+        `start_pump` and `stop_pump`. Both are stopped on return.
+        """
+        started_at = last_tick = time.monotonic()
+        last_ts = started_at
+        running = {"media": False, "waste": False}
+        recent: deque[tuple[float, float]] = deque(maxlen=self.window)
+        media_ml = 0.0
+        unrated_s = 0.0  # media on-time before its flow rate was measured
+        trims = 0
+        phase = "lead_in"  # then "exchange", then "drain"
+        stopped_by = "timeout"
+
+        def account() -> None:
+            nonlocal media_ml, unrated_s, last_tick
+            now = time.monotonic()
+            if running["media"]:
+                unrated_s += now - last_tick
+            if "media" in self.flow_rates:
+                media_ml += max(self.flow_rates["media"], 0.0) * unrated_s
+                unrated_s = 0.0
+            last_tick = now
+
+        def set_running(pump: str, on: bool) -> None:
+            if running[pump] != on:
+                account()
+                (start_pump if on else stop_pump)(pump)
+                running[pump] = on
+                recent.clear()  # the net flow changes
+
+        try:
+            set_running("media", True)
+            while True:
+                account()
+                elapsed = time.monotonic() - started_at
+                if elapsed >= self.max_seconds:
+                    stopped_by = "timeout"
+                    break
+                if not should_continue():
+                    stopped_by = "state"
+                    break
+
+                sample = self.scale.wait_for_sample(after=last_ts, timeout=min(self.scale.timeout, self.max_seconds - elapsed))
+                if sample is None:
+                    continue
+
+                last_ts, weight = sample
+                recent.append(sample)
+                self._update_flow_rates(running, recent)
+                net = weight - initial_weight
+                account()
+
+                if phase != "drain":
+                    if media_ml + max(self.flow_rates.get("media", 0.0), 0.0) * self.stop_latency_s >= self.target_ml:
+                        set_running("media", False)
+                        set_running("waste", True)
+                        phase = "drain"
+                    elif phase == "lead_in":
+                        if net >= self.tolerance_ml:
+                            set_running("waste", True)
+                            phase = "exchange"
+                    elif net > self.tolerance_ml and running["media"] and running["waste"]:
+                        set_running("media", False)  # media is ahead
+                        trims += 1
+                    elif net < -self.tolerance_ml and running["waste"] and running["media"]:
+                        set_running("waste", False)  # waste is ahead
+                        trims += 1
+                    elif not running["media"] and net <= 0:
+                        set_running("media", True)
+                    elif not running["waste"] and net >= 0:
+                        set_running("waste", True)
+
+                if phase == "drain":
+                    # volume expected to leave between this sample and the pump actually stopping.
+                    in_flight = max(self.flow_rates.get("waste", 0.0), 0.0) * (time.monotonic() - last_ts + self.stop_latency_s)
+                    if net - in_flight <= 0:
+                        stopped_by = "target"
+                        break
+        finally:
+            for pump in running:
+                set_running(pump, False)
+        stopped_at = time.monotonic()
+
+        # let drops land and the scale settle before taking the final reading.
+        time.sleep(self.settle_s)
+        settled = self.scale.samples(since=stopped_at + self.settle_s / 2)
+        if settled:
+            final_weight = sum(w for _, w in settled) / len(settled)
+        else:
+            final_weight = self.scale.mean_weight(n=3)
+
+        net_ml = final_weight - initial_weight
+        return ConcurrentExchangeResult(
+            target_ml=self.target_ml,
+            media_ml=media_ml,
+            waste_ml=media_ml - net_ml,
+            net_ml=net_ml,
+            elapsed_s=stopped_at - started_at,
+            trims=trims,
+            stopped_by=stopped_by,
+        )
+
+
+class ChemostatWithScale(DosingAutomationJobContrib):
+    """
+    Chemostat whose doses are measured with a scale under the vial, on a serial port.
+
+    In the default sequential exchange_mode, media is added and then waste removed, each stopped by weight. In
+    the concurrent exchange_mode, both pumps run at once and the net weight is held within ±volume_tolerance_ml
+    (see BalancedExchange), which takes about half the time. The media volume is then inferred from flow rates
+    rather than weighed, and there is no extra waste removal at the end.
+
+    In the timed dose_mode, sequential doses are run for the duration given by a calibration fitted on the scale
+    (see calibrate), and only weighed before and after, so the scale is polled for a couple of seconds per dose
+    instead of throughout. The scale isn't polled between doses in any mode.
+
+    The volumes moved are published as dosing_events in every mode, as the pump actions do.
+    """
+
+    automation_name = "chemostat_with_scale"
+
+    published_settings = {
+        "volume": {"datatype": "float", "settable": True, "unit": "mL"},
+        "duration": {"datatype": "float", "settable": True, "unit": "min"},
+        "exchange_mode": {"datatype": "string", "settable": True},
+        "dose_mode": {"datatype": "string", "settable": True},
+    }
+    EXCHANGE_MODES = ("sequential", "concurrent")
+    DOSE_MODES = ("weighed", "timed")
+
+    def __init__(
+        self,
+        volume: float | str,
+        exchange_mode: str = "sequential",
+        dose_mode: str = "weighed",
+        recalibrate: bool | str = False,
+        **kwargs,
+    ) -> None:
+        super().__init__(**kwargs)
+
+        self.volume = float(volume)
+        self.set_exchange_mode(exchange_mode)
+        self.latest_dose_result: Optional[GravimetricDoseResult] = None
+        self.latest_exchange_result: Optional[ConcurrentExchangeResult] = None
+        self.flow_rates: dict[str, float] = {}  # mL/s by pump, measured during concurrent exchanges
+        self.max_dose_seconds = config.getfloat("dosing_automation.chemostat_with_scale", "max_dose_seconds", fallback=120.0)
+        self.stop_latency_s = config.getfloat("dosing_automation.chemostat_with_scale", "stop_latency_s", fallback=0.1)
+        self.volume_tolerance_ml = config.getfloat("dosing_automation.chemostat_with_scale", "volume_tolerance_ml", fallback=0.5)
+        self.settle_s = config.getfloat("dosing_automation.chemostat_with_scale", "settle_s", fallback=1.0)
+        self.confirm_tolerance_ml = config.getfloat("dosing_automation.chemostat_with_scale", "confirm_tolerance_ml", fallback=0.2)
+        # the port is opened on the first execute, see ScaleReader.start, so a job that fails here doesn't hold it.
+        self.scale = ScaleReader(config.get("dosing_automation.chemostat_with_scale", "scale_port", fallback="/dev/ttyUSB0"))
+
+        # fitted by calibrate(), by pump. With recalibrate, or without them in the timed dose_mode, the pumps are
+        # calibrated on the first execute.
+        self.calibrations: dict[str, PumpCalibration] = {}
+        self._calibrate_first = as_bool(recalibrate)
+        if not self._calibrate_first:
+            with local_persistant_storage(CALIBRATION_CACHE_NAME) as cache:
+                for pump_name in ("media", "waste"):
+                    if pump_name in cache:
+                        self.calibrations[pump_name] = decode(cache[pump_name], type=PumpCalibration)
+        self.flow_rates.update({pump_name: calibration.duration_ for pump_name, calibration in self.calibrations.items()})
+        self.set_dose_mode(dose_mode)
+
+    def set_exchange_mode(self, value: str) -> None:
+        if value not in self.EXCHANGE_MODES:
+            raise ValueError(f"exchange_mode must be one of {self.EXCHANGE_MODES}.")
+        self.exchange_mode = value
+
+    def set_dose_mode(self, value: str) -> None:
+        if value not in self.DOSE_MODES:
+            raise ValueError(f"dose_mode must be one of {self.DOSE_MODES}.")
+        self.dose_mode = value
+
+    def _fresh_weight(self) -> float:
+        # a sample taken after this call started, so the baseline isn't stale.
+        self.scale.resume()
+        sample = self.scale.wait_for_sample(after=time.monotonic(), timeout=5 * self.scale.timeout)
+        if sample is None:
+            raise IOError(f"No reading from the scale on {self.scale.port}.")
+        return sample[1]
+
+    def _settled_weight(self, n: int = 5) -> float:
+        # mean of n samples taken once drops have landed and the scale has settled.
+        self.scale.resume()
+        time.sleep(self.settle_s)
+        after = time.monotonic()
+        total = 0.0
+        for _ in range(n):
+            sample = self.scale.wait_for_sample(after=after, timeout=5 * self.scale.timeout)
+            if sample is None:
+                raise IOError(f"No reading from the scale on {self.scale.port}.")
+            after, weight = sample
+            total += weight
+        return total / n
+
+    def _run_for(self, pump_name: str, seconds: float, dc: float) -> float:
+        # mL moved by running pump_name for `seconds` at `dc`, weighed before and after.
+        direction = 1 if pump_name == "media" else -1
+        calibration = PumpCalibration(
+            name="ChemostatWithScaleCalibrationRun",
+            pioreactor_unit=self.unit,
+            created_at=datetime.now(timezone.utc).isoformat(),
+            pump=pump_name,
+            hz=SlowPump.hz,
+            dc=dc,
+            duration_=1.0,
+            bias_=0.0,
+            voltage=-1,
+        )
+        initial_weight = self._settled_weight()
+        pin = PWM_TO_PIN[config.get("PWM_reverse", pump_name)]
+        with PWMPump(self.unit, self.experiment, pin, calibration=calibration, mqtt_client=self.pub_client) as pump:
+            pump.by_duration(seconds)
+        return direction * (self._settled_weight() - initial_weight)
+
+    def calibrate(self) -> dict[str, PumpCalibration]:
+        """
+        Fit each pump's flow rate and bias on the scale, and store them as PumpCalibrations at dose_dc.
+
+        Media and waste are run in turn for each of calibration_durations (s) at each of calibration_duty_cycles
+        (%), so the vial ends about where it started. Waste can only remove what is above its tube, so start with
+        the vial filled to it. The flow rate is fitted as linear in the duty cycle, jointly over all runs.
+        """
+        section = "dosing_automation.chemostat_with_scale"
+        duty_cycles = [float(dc) for dc in config.get(section, "calibration_duty_cycles", fallback="40,60,80").split(",")]
+        durations = [float(s) for s in config.get(section, "calibration_durations", fallback="2,4").split(",")]
+        dose_dc = config.getfloat(section, "dose_dc", fallback=SlowPump.dc)
+
+        self.logger.info(f"Calibrating the media and waste pumps at {duty_cycles}% duty cycles.")
+        runs: dict[str, list[tuple[float, float, float]]] = {"media": [], "waste": []}
+        try:
+            for dc in duty_cycles:
+                for seconds in durations:
+                    for pump_name in ("media", "waste"):
+                        runs[pump_name].append((dc, seconds, self._run_for(pump_name, seconds, dc)))
+        finally:
+            self.scale.pause()
+
+        calibrations = {}
+        for pump_name, pump_runs in runs.items():
+            rate, rate_per_dc, bias = fit_pump_model(pump_runs)
+            duration_ = rate + rate_per_dc * dose_dc
+            if duration_ <= 0:
+                raise CalibrationError(f"Fitted a flow rate of {duration_:.3f}mL/s for the {pump_name} pump at {dose_dc}%.")
+
+            calibrations[pump_name] = PumpCalibration(
+                name=f"{self.automation_name}_{pump_name}",
+                pioreactor_unit=self.unit,
+                created_at=datetime.now(timezone.utc).isoformat(),
+                pump=pump_name,
+                hz=SlowPump.hz,
+                dc=dose_dc,
+                duration_=duration_,
+                bias_=bias,
+                voltage=-1,
+            )
+            self.logger.info(f"{pump_name} pump: {duration_:.3f}mL/s at {dose_dc}%, bias {bias:+.3f}mL.")
+
+        with local_persistant_storage(CALIBRATION_CACHE_NAME) as cache:
+            for pump_name, calibration in calibrations.items():
+                cache[pump_name] = encode(calibration)
+        self.calibrations = calibrations
+        self.flow_rates.update({pump_name: calibration.duration_ for pump_name, calibration in calibrations.items()})
+        return calibrations
+
+    def _dose_by_time(self, pump_name: str, ml: float, direction: int, unit: str, experiment: str, mqtt_client) -> GravimetricDoseResult:
+        calibration = self.calibrations[pump_name]
+        initial_weight = self._fresh_weight()
+        self.scale.pause()
+
+        pin = PWM_TO_PIN[config.get("PWM_reverse", pump_name)]
+        started_at = time.monotonic()
+        with PWMPump(unit, experiment, pin, calibration=calibration, mqtt_client=mqtt_client) as pump:
+            pump.by_volume(ml)
+        elapsed_s = time.monotonic() - started_at
+
+        try:
+            moved_ml = direction * (self._settled_weight() - initial_weight)
+        finally:
+            self.scale.pause()
+
+        result = GravimetricDoseResult(target_ml=ml, moved_ml=moved_ml, elapsed_s=elapsed_s, stopped_by="time")
+        if abs(result.overshoot_ml) > self.confirm_tolerance_ml:
+            self.logger.warning(f"{pump_name} dose was {result.overshoot_ml:+.2f}mL off its target of {ml:.2f}mL. Consider recalibrating.")
+        self.logger.debug(f"{pump_name} dose: target={ml:.3f}mL, moved={result.moved_ml:.3f}mL, overshoot={result.overshoot_ml:+.3f}mL, by time.")
+        self.latest_dose_result = result
+        return result
+
+    def _dose_by_weight(self, pump_name: str, ml: float, direction: int, unit: str, experiment: str, mqtt_client) -> GravimetricDoseResult:
+        initial_weight = self._fresh_weight()
+
+        pin = PWM_TO_PIN[config.get("PWM_reverse", pump_name)]
+        controller = PredictiveStop(
+            self.scale,
+            ml,
+            direction=direction,
+            stop_latency_s=self.stop_latency_s,
+            max_seconds=self.max_dose_seconds,
+        )
+
+        try:
+            with PWMPump(unit, experiment, pin, calibration=self.calibrations.get(pump_name, SlowPump), mqtt_client=mqtt_client) as pump:
+                pump.continuously(block=False)
+                result = controller.run(initial_weight, pump.stop, lambda: self.state == self.READY)
+        finally:
+            self.scale.pause()
+
+        if result.stopped_by in ("timeout", "volume_ceiling"):
+            self.logger.warning(f"Stopped {pump_name} pump by {result.stopped_by} after {result.elapsed_s:.1f}s, with {result.moved_ml:.2f}mL of {ml:.2f}mL moved.")
+        self.logger.debug(f"{pump_name} dose: target={ml:.3f}mL, moved={result.moved_ml:.3f}mL, overshoot={result.overshoot_ml:+.3f}mL, stopped by {result.stopped_by}.")
+        self.latest_dose_result = result
+        return result
+
+    def _publish_dosing_event(self, pump_name: str, ml: float, source_of_event: str, mqtt_client) -> None:
+        # what the pump actions publish after a dose. PWMPump doesn't, so without it the job's own bookkeeping
+        # (vial volume, alt_media_fraction and throughputs, updated from dosing_events), the UI and the exports
+        # wouldn't see these volumes.
+        event = DosingEvent(volume_change=max(ml, 0.0), event=DOSING_EVENTS[pump_name], source_of_event=source_of_event, timestamp=datetime.now(timezone.utc))
+        mqtt_client.publish(f"pioreactor/{self.unit}/{self.experiment}/dosing_events", encode(event), qos=QOS.EXACTLY_ONCE)
+
+    def add_media_to_bioreactor(self, ml: float, unit: str, experiment: str, source_of_event: str, mqtt_client) -> float:
+        if ml == 0:
+            return 0.0
+
+        dose = self._dose_by_time if self.dose_mode == "timed" else self._dose_by_weight
+        result = dose("media", ml, 1, unit, experiment, mqtt_client)
+        self._publish_dosing_event("media", result.moved_ml, source_of_event, mqtt_client)
+        self.logger.info(f"Added {result.moved_ml:.2f}ml via weight-based methods.")
+        return result.moved_ml
+
+    def remove_waste_from_bioreactor(self, ml: float, unit: str, experiment: str, source_of_event: str, mqtt_client) -> float:
+        if ml == 0:
+            return 0.0
+
+        dose = self._dose_by_time if self.dose_mode == "timed" else self._dose_by_weight
+        result = dose("waste", ml, -1, unit, experiment, mqtt_client)
+        self._publish_dosing_event("waste", result.moved_ml, source_of_event, mqtt_client)
+        self.logger.info(f"Removed {result.moved_ml:.2f}ml via weight-based methods.")
+        return result.moved_ml
+
+    def _exchange_concurrently(self, ml: float) -> ConcurrentExchangeResult:
+        initial_weight = self._fresh_weight()
+        controller = BalancedExchange(
+            self.scale,
+            ml,
+            tolerance_ml=self.volume_tolerance_ml,
+            stop_latency_s=self.stop_latency_s,
+            max_seconds=2 * self.max_dose_seconds,
+            flow_rates=self.flow_rates,
+        )
+
+        pins = {pump_name: PWM_TO_PIN[config.get("PWM_reverse", pump_name)] for pump_name in ("media", "waste")}
+        calibrations = {pump_name: self.calibrations.get(pump_name, SlowPump) for pump_name in pins}
+        try:
+            with PWMPump(self.unit, self.experiment, pins["media"], calibration=calibrations["media"], mqtt_client=self.pub_client) as media_pump, PWMPump(
+                self.unit, self.experiment, pins["waste"], calibration=calibrations["waste"], mqtt_client=self.pub_client
+            ) as waste_pump:
+                pumps = {"media": media_pump, "waste": waste_pump}
+                result = controller.run(
+                    initial_weight,
+                    lambda pump_name: pumps[pump_name].continuously(block=False),
+                    lambda pump_name: pumps[pump_name].stop(),
+                    lambda: self.state == self.READY,
+                )
+        finally:
+            self.scale.pause()
+
+        self.flow_rates = controller.flow_rates
+        source_of_event = f"{self.job_name}:{self.automation_name}"
+        self._publish_dosing_event("media", result.media_ml, source_of_event, self.pub_client)
+        self._publish_dosing_event("waste", result.waste_ml, source_of_event, self.pub_client)
+        if result.stopped_by == "timeout":
+            self.logger.warning(f"Stopped the concurrent exchange by timeout after {result.elapsed_s:.1f}s, with {result.media_ml:.2f}mL of {ml:.2f}mL of media in.")
+        if abs(result.net_ml) > self.volume_tolerance_ml:
+            self.logger.warning(f"Vial weight is {result.net_ml:+.2f}g off after the concurrent exchange.")
+        self.logger.debug(
+            f"concurrent exchange: target={ml:.3f}mL, media={result.media_ml:.3f}mL, waste={result.waste_ml:.3f}mL, net={result.net_ml:+.3f}mL, {result.trims} trims, {result.elapsed_s:.1f}s, stopped by {result.stopped_by}."
+        )
+        self.latest_exchange_result = result
+        return result
+
+    def execute(self) -> events.DilutionEvent:
+        if not self.scale.running:
+            self.scale.start().pause()
+
+        if self._calibrate_first or (self.dose_mode == "timed" and len(self.calibrations) < 2):
+            self._calibrate_first = False
+            self.calibrate()
+
+        if self.exchange_mode == "concurrent":
+            result = self._exchange_concurrently(self.volume)
+            return events.DilutionEvent(
+                f"exchanged {result.waste_ml:.2f}mL concurrently",
+                data={"volume_actually_cycled": result.waste_ml, "net_ml": result.net_ml},
+            )
+
+        volume_actually_cycled = self.execute_io_action(media_ml=self.volume, waste_ml=self.volume)
+        return events.DilutionEvent(
+            f"exchanged {volume_actually_cycled['waste_ml']}mL",
+            data={"volume_actually_cycled": volume_actually_cycled["waste_ml"]},
+        )
+
+    def on_disconnected(self) -> None:
+        super().on_disconnected()
+        self.scale.stop()
@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+"""
+Non-blocking dosing for DosingAutomationJobs.
+
+A DosingQueue runs the job's execute_io_action on an asyncio loop in a background thread, so `execute`
+can submit an exchange and return while the pumps run:
+
+    self.dosing_queue = DosingQueue(self, asynchronous=True)
+    ...
+    future = self.dosing_queue.submit(media_ml=1.0, waste_ml=1.0)
+
+Exchanges run one at a time, in submission order. A submission made while another is still waiting to
+start replaces it: it's the newer decision, from a newer OD reading, and summing the two would dose for
+the same reading twice. Submissions made with replaceable=False, ex: the steps of a plan, never replace and
+are never replaced. Each exchange is a single execute_io_action call, so the usual ordering holds: every
+subdose adds media and alt media first, then removes waste.
+
+Futures resolve to the volumes moved, and are cancelled if the exchange is replaced, or if the queue is
+stopped before it starts. The volumes moved by every finished exchange are also kept until `collect`ed, so
+an automation can account for them at the start of its next execute, on its own thread. With
+asynchronous=False, submit runs the exchange immediately.
+"""
+from __future__ import annotations
+
+import asyncio
+import threading
+from collections import deque
+from concurrent.futures import Future
+from typing import Callable, Optional
+
+PUMPS = ("waste_ml", "media_ml", "alt_media_ml")
+
+
+class _Exchange:
+    def __init__(self, volumes: dict[str, float], replaceable: bool) -> None:
+        self.volumes = volumes
+        self.replaceable = replaceable
+        self.future: Future[dict[str, float]] = Future()
+
+
+class DosingQueue:
+    def __init__(self, job, asynchronous: bool = True) -> None:
+        self.job = job
+        self.asynchronous = asynchronous
+        self.replaced = 0  # number of exchanges replaced by a newer submission before they started
+
+        self._lock = threading.Lock()
+        self._pending: deque[_Exchange] = deque()
+        self._in_flight: Optional[_Exchange] = None
+        self._moved: list[dict[str, float]] = []
+        self._stopping = False
+
+        if asynchronous:
+            self._loop = asyncio.new_event_loop()
+            self._ready = threading.Event()
+            self._thread = threading.Thread(target=self._run_loop, name="dosing_queue", daemon=True)
+            self._thread.start()
+            self._ready.wait()
+
+    def _run_loop(self) -> None:
+        asyncio.set_event_loop(self._loop)
+        self._loop.run_until_complete(self._worker())
+
+    async def _worker(self) -> None:
+        self._wake = asyncio.Event()
+        self._ready.set()
+
+        while True:
+            await self._wake.wait()
+            self._wake.clear()
+
+            while True:
+                with self._lock:
+                    if self._stopping or not self._pending:
+                        break
+                    exchange = self._in_flight = self._pending.popleft()
+
+                if not exchange.future.set_running_or_notify_cancel():
+                    with self._lock:
+                        self._in_flight = None
+                    continue
+
+                # execute_io_action blocks while the pumps run, so keep it off the loop.
+                await self._loop.run_in_executor(
+                    None, self._complete, exchange, lambda: self.job.execute_io_action(**exchange.volumes)
+                )
+
+            if self._stopping:
+                return
+
+    def _complete(self, exchange: _Exchange, action: Callable[[], dict[str, float]]) -> None:
+        # record what was moved, and that nothing is in flight, before resolving the future, so whoever waited
+        # on it sees both.
+        try:
+            moved = action()
+        except Exception as e:
+            with self._lock:
+                self._in_flight = None
+            if self.asynchronous:
+                self.job.logger.error(f"Queued exchange failed: {e}")
+            exchange.future.set_exception(e)
+        else:
+            with self._lock:
+                self._in_flight = None
+                self._moved.append(moved)
+            exchange.future.set_result(moved)
+
+    def submit(self, replaceable: bool = True, **volumes: float) -> Future[dict[str, float]]:
+        """Queue an exchange, ex: submit(media_ml=1.0, waste_ml=1.0)."""
+        volumes = {pump: float(volumes.get(pump, 0.0)) for pump in PUMPS}
+        exchange = _Exchange(volumes, replaceable)
+
+        if not self.asynchronous:
+            exchange.future.set_running_or_notify_cancel()
+            self._complete(exchange, lambda: self.job.execute_io_action(**volumes))
+            return exchange.future
+
+        with self._lock:
+            if self._stopping:
+                raise RuntimeError("DosingQueue is stopped.")
+
+            if replaceable and self._pending and self._pending[-1].replaceable:
+                replaced = self._pending.pop()
+                replaced.future.cancel()
+                self.replaced += 1
+            self._pending.append(exchange)
+
+        self._loop.call_soon_threadsafe(self._wake.set)
+        return exchange.future
+
+    def exchange(self, replaceable: bool = True, **volumes: float) -> Optional[dict[str, float]]:
+        """
+        Like execute_io_action, returning the volumes moved. When asynchronous, returns None without waiting
+        for the pumps: the volumes moved are only known once the exchange is done, see collect.
+        """
+        future = self.submit(replaceable=replaceable, **volumes)
+        if not self.asynchronous:
+            return future.result()
+        return None
+
+    def collect(self) -> list[dict[str, float]]:
+        """The volumes moved by the exchanges that finished since the last call, in order."""
+        with self._lock:
+            moved, self._moved = self._moved, []
+        return moved
+
+    @property
+    def verb(self) -> str:
+        # for events: when asynchronous, execute only knows what it asked for.
+        return "queued" if self.asynchronous else "cycled"
+
+    @property
+    def volume_key(self) -> str:
+        return "volume_queued" if self.asynchronous else "volume"
+
+    @property
+    def busy(self) -> bool:
+        with self._lock:
+            return self._in_flight is not None or bool(self._pending)
+
+    def drain(self, timeout: Optional[float] = None) -> None:
+        """Block until everything submitted so far has been dosed."""
+        with self._lock:
+            futures = [exchange.future for exchange in ([self._in_flight] if self._in_flight else []) + list(self._pending)]
+        for future in futures:
+            future.exception(timeout=timeout)
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """Cancel exchanges that haven't started, and wait for the one in flight to finish."""
+        if not self.asynchronous:
+            return
+
+        with self._lock:
+            if self._stopping:
+                return
+            self._stopping = True
+            pending, self._pending = self._pending, deque()
+
+        for exchange in pending:
+            exchange.future.cancel()
+        self._loop.call_soon_threadsafe(self._wake.set)
+        self._thread.join(timeout=timeout)
+        if not self._thread.is_alive():
+            self._loop.close()
@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+"""
+Closed-form helpers for the vial mixing model used by DosingAutomationJob: an actuation adds `ml` to a
+vial holding `vial_volume`, mixes, and waste brings the vial back to `vial_volume`. Anything diluted by
+the actuation (OD, or the fraction of the other media) is multiplied by vial_volume / (vial_volume + ml).
+
+execute_io_action splits any exchange above DosingAutomationJob.MAX_SUBDOSE in halves, until every piece
+fits, and each piece dilutes separately: see subdose_count. Keep the steps of a plan at or below it, or
+account for the split, like co_dosing_split and switch_volume.
+"""
+from __future__ import annotations
+
+from math import floor, inf, log, nextafter
+
+
+def dilution_factor(vial_volume: float, ml: float) -> float:
+    return vial_volume / (vial_volume + ml)
+
+
+def fraction_after_exchange(alt_media_fraction: float, vial_volume: float, alt_media_ml: float = 0.0, media_ml: float = 0.0) -> float:
+    # same as AltMediaFractionCalculator; waste afterwards does not change the fraction.
+    return (alt_media_fraction * vial_volume + alt_media_ml) / (vial_volume + alt_media_ml + media_ml)
+
+
+def dilution_plan(current: float, target: float, vial_volume: float, max_ml: float) -> list[float]:
+    """
+    Volumes of the actuations needed to dilute a quantity from `current` down to `target`: the minimum
+    number of `max_ml` actuations, followed by one smaller correction so the last step lands on `target`.
+
+    Examples
+    ---------
+    > dilution_plan(1.0, 0.5, 14, 0.75)  # halve the OD of a 14mL vial
+    """
+    assert vial_volume > 0 and max_ml > 0
+    if current <= 0 or target >= current:
+        return []
+    if target <= 0:
+        raise ValueError("Dilution can only approach zero, provide a positive target.")
+
+    ratio = target / current
+    full_step = dilution_factor(vial_volume, max_ml)
+    n_full = floor(log(ratio) / log(full_step))
+
+    # whatever dilution remains is done by one correction actuation, solved from vial_volume / (vial_volume + ml).
+    remaining = ratio / full_step**n_full
+    correction_ml = vial_volume * (1 / remaining - 1)
+
+    plan = [max_ml] * n_full
+    if correction_ml > 1e-6:
+        plan.append(min(correction_ml, max_ml))
+    return plan
+
+
+def subdose_count(ml: float, max_ml: float) -> int:
+    # execute_io_action halves any exchange above max_ml until every piece fits.
+    n = 1
+    while ml / n > max_ml:
+        n *= 2
+    return n
+
+
+def co_dosing_split(alt_media_fraction: float, target_fraction: float, vial_volume: float, ml: float, max_ml: float) -> tuple[float, float]:
+    """
+    Split a single exchange of `ml` into (media_ml, alt_media_ml), pumped together in one execute_io_action call,
+    so that alt_media_fraction lands on `target_fraction`. Accounts for the exchange being split into subdoses.
+
+    If even `ml` of pure alt_media can't reach the target, the exchange is enlarged to the smallest volume
+    that can, so the returned volumes may sum to more than `ml`. If even pure media overshoots, it's all media.
+    """
+    if not (0 <= target_fraction < 1):
+        raise ValueError("target_fraction must be in [0, 1).")
+
+    def all_alt_media_fraction(total_ml: float) -> float:
+        n = subdose_count(total_ml, max_ml)
+        return 1 - (1 - alt_media_fraction) * dilution_factor(vial_volume, total_ml / n) ** n
+
+    if all_alt_media_fraction(ml) < target_fraction:
+        # smallest exchange that reaches the target. all_alt_media_fraction increases with total_ml (more
+        # subdoses only help), so bisect.
+        low, high = ml, max(ml, max_ml)
+        while all_alt_media_fraction(high) < target_fraction:
+            low, high = high, 2 * high
+        for _ in range(60):
+            mid = (low + high) / 2
+            low, high = (low, mid) if all_alt_media_fraction(mid) >= target_fraction else (mid, high)
+        ml = high
+
+    # each of the n subdoses moves the fraction towards alt_ml / ml by a factor r, so after all of them:
+    #   fraction = c + (alt_media_fraction - c) * r**n,  with c = alt_ml / ml.
+    n = subdose_count(ml, max_ml)
+    decay = dilution_factor(vial_volume, ml / n) ** n
+    alt_media_ml = ml * (target_fraction - alt_media_fraction * decay) / (1 - decay)
+    alt_media_ml = min(max(alt_media_ml, 0.0), ml)
+    return ml - alt_media_ml, alt_media_ml
+
+
+def switch_volume(alt_media_fraction: float, target_fraction: float, vial_volume: float, max_ml: float) -> tuple[str, float]:
+    """
+    Returns which liquid to pump ("alt_media" or "media") and the volume of the single execute_io_action that
+    moves alt_media_fraction to `target_fraction`, accounting for the exchange being split into subdoses.
+    Adding alt_media dilutes (1 - fraction), adding media dilutes fraction.
+
+    Examples
+    ---------
+    > switch_volume(0.0, 0.95, 14, 0.75)  # from media to 95% alt_media
+    """
+    if target_fraction >= alt_media_fraction:
+        liquid, remaining = "alt_media", (1 - target_fraction) / (1 - alt_media_fraction)
+    else:
+        liquid, remaining = "media", target_fraction / alt_media_fraction
+    if remaining >= 1:
+        return liquid, 0.0
+    if remaining <= 0:
+        raise ValueError("Dilution can only approach pure media or alt_media, provide a target in (0, 1).")
+
+    # n subdoses of ml / n dilute by (vial_volume / (vial_volume + ml / n)) ** n, so solve for ml with n = 1, 2,
+    # 4, ... until execute_io_action would split ml into at most n subdoses.
+    n = 1
+    while True:
+        ml = n * vial_volume * (remaining ** (-1 / n) - 1)
+        if subdose_count(ml, max_ml) == n:
+            return liquid, ml
+        if subdose_count(ml, max_ml) < n:
+            # n / 2 subdoses fall short, and n overshoot: the smallest volume split into n.
+            return liquid, nextafter(n / 2 * max_ml, inf)
+        n *= 2
+
+
+def fraction_after_io_action(alt_media_fraction: float, vial_volume: float, alt_media_ml: float, media_ml: float, max_ml: float) -> float:
+    """alt_media_fraction after execute_io_action(alt_media_ml=..., media_ml=..., waste_ml=alt_media_ml + media_ml)."""
+    ml = alt_media_ml + media_ml
+    if ml <= 0:
+        return alt_media_fraction
+    n = subdose_count(ml, max_ml)
+    decay = dilution_factor(vial_volume, ml / n) ** n
+    return alt_media_ml / ml + (alt_media_fraction - alt_media_ml / ml) * decay
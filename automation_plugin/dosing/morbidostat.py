@@ -0,0 +1,193 @@
+# -*- coding: utf-8 -*-
+from __future__ import annotations
+
+from math import log
+from typing import Optional
+
+from pioreactor.automations import events
+from pioreactor.automations.dosing.base import DosingAutomationJobContrib
+
+from ..utils import as_bool
+from .dosing_queue import DosingQueue
+from .mixing import co_dosing_split
+from .od_estimator import ODEstimator
+from .pump_calibrations import require_calibrations
+
+
+class Morbidostat(DosingAutomationJobContrib):
+    """
+    As defined in Toprak 2013., keep cell density below and threshold using chemical means. The conc.
+    of the chemical is diluted slowly over time, allowing the microbes to recover.
+
+    The drug concentration in the vial is the base class's alt_media_fraction, which tracks the volumes
+    actually exchanged, times the concentration in the alt media. In the adaptive dosing_mode, each exchange is split between alt media and media so that the
+    concentration lands on a target inhibition, which moves up or down by inhibition_step each cycle,
+    instead of exchanging a fixed `volume` of one or the other.
+    """
+
+    automation_name = "morbidostat"
+    published_settings = {
+        "volume": {"datatype": "float", "settable": True, "unit": "mL"},
+        "target_normalized_od": {"datatype": "float", "settable": True, "unit": "AU"},
+        "duration": {"datatype": "float", "settable": True, "unit": "min"},
+        "async_dosing": {"datatype": "boolean", "settable": False},
+        "od_window": {"datatype": "integer", "settable": False},
+        "dosing_mode": {"datatype": "string", "settable": True},
+        "alt_media_drug_concentration": {"datatype": "float", "settable": True},
+        "ic50": {"datatype": "float", "settable": True},
+        "hill": {"datatype": "float", "settable": True},
+        "inhibition_step": {"datatype": "float", "settable": True},
+        "drug_concentration": {"datatype": "float", "settable": False},
+        "target_inhibition": {"datatype": "float", "settable": False},
+    }
+    REQUIRED_PUMPS = ("media", "waste", "alt_media")
+    DOSING_MODES = ("fixed_volume", "adaptive")
+    MAX_INHIBITION = 0.95
+    MAX_EXCHANGE_MULTIPLE = 3  # an adaptive exchange can be at most this many `volume`s
+
+    def __init__(
+        self,
+        target_normalized_od: float | str,
+        volume: float | str,
+        async_dosing: bool | str = False,
+        od_window: int | str = 0,
+        dosing_mode: str = "fixed_volume",
+        alt_media_drug_concentration: float | str = 1.0,
+        ic50: Optional[float | str] = None,
+        hill: float | str = 1.0,
+        inhibition_step: float | str = 0.1,
+        **kwargs,
+    ):
+        super(Morbidostat, self).__init__(**kwargs)
+
+        require_calibrations(self.REQUIRED_PUMPS)
+        # opt-in: submit exchanges to a background queue instead of blocking execute while the pumps run.
+        self.async_dosing = as_bool(async_dosing)
+        self.dosing_queue = DosingQueue(self, asynchronous=self.async_dosing)
+
+        self.target_normalized_od = float(target_normalized_od)
+        self.volume = float(volume)
+
+        # opt-in: decide on a regression over the last od_window readings, comparing the fitted growth rate to
+        # the dilution rate, instead of comparing the latest reading to the previous one.
+        self.od_window = int(od_window)
+        self.od_estimator = ODEstimator(self.od_window) if self.od_window else None
+
+        # drug concentrations are in the units of alt_media_drug_concentration (1.0: a fraction of the alt media's).
+        self.ic50 = float(ic50) if ic50 is not None else None
+        self.hill = float(hill)
+        self.inhibition_step = float(inhibition_step)
+        self.set_dosing_mode(dosing_mode)
+
+        self.set_alt_media_drug_concentration(alt_media_drug_concentration)
+        self.target_inhibition = self.inhibition(self.drug_concentration) if self.ic50 else 0.0
+
+    def set_dosing_mode(self, value: str) -> None:
+        if value not in self.DOSING_MODES:
+            raise ValueError(f"dosing_mode must be one of {self.DOSING_MODES}.")
+        if value == "adaptive" and not self.ic50:
+            raise ValueError("The adaptive dosing_mode needs the drug's ic50.")
+        self.dosing_mode = value
+
+    def set_alt_media_drug_concentration(self, value: float | str) -> None:
+        self.alt_media_drug_concentration = float(value)
+        self._update_drug_concentration()
+
+    def _update_drug_concentration(self) -> None:
+        self.drug_concentration = self.alt_media_fraction * self.alt_media_drug_concentration
+
+    def inhibition(self, concentration: float) -> float:
+        # Hill curve: 0 without drug, 0.5 at ic50.
+        assert self.ic50
+        return concentration**self.hill / (concentration**self.hill + self.ic50**self.hill)
+
+    def concentration_for(self, inhibition: float) -> float:
+        assert self.ic50
+        return self.ic50 * (inhibition / (1 - inhibition)) ** (1 / self.hill)
+
+    def on_disconnected(self) -> None:
+        super().on_disconnected()
+        self.dosing_queue.stop()
+
+    @property
+    def dilution_rate(self) -> float:
+        # 1/h, from exchanging `volume` every `duration` minutes.
+        return log((self.vial_volume + self.volume) / self.vial_volume) / (self.duration / 60)
+
+    def _exchange(self, **volumes: float) -> None:
+        self.dosing_queue.exchange(**volumes)
+        self._account_for_exchanges()
+
+    def _account_for_exchanges(self) -> None:
+        # the exchanges done since the last execute, before the estimator sees a reading taken after them.
+        for moved in self.dosing_queue.collect():
+            if self.od_estimator is not None:
+                self.od_estimator.exchanged(self.vial_volume, moved["media_ml"] + moved["alt_media_ml"])
+        self._update_drug_concentration()
+
+    def _exchange_towards(self, inhibition: float) -> None:
+        # split an exchange of `volume` (enlarged up to MAX_EXCHANGE_MULTIPLE if needed) between alt media and
+        # media, so the drug concentration lands on the one giving `inhibition`.
+        self.target_inhibition = min(max(inhibition, 0.0), self.MAX_INHIBITION)
+        # pure alt media is only reached asymptotically, so cap the fraction just below it.
+        target_fraction = min(self.concentration_for(self.target_inhibition) / self.alt_media_drug_concentration, 0.99)
+        media_ml, alt_media_ml = co_dosing_split(self.alt_media_fraction, target_fraction, self.vial_volume, self.volume, self.MAX_SUBDOSE)
+
+        max_ml = self.MAX_EXCHANGE_MULTIPLE * self.volume
+        if media_ml + alt_media_ml > max_ml:
+            media_ml, alt_media_ml = 0.0, max_ml
+        self._exchange(media_ml=media_ml, alt_media_ml=alt_media_ml, waste_ml=media_ml + alt_media_ml)
+
+    def _add_drug(self) -> None:
+        if self.dosing_mode == "adaptive":
+            self._exchange_towards(self.inhibition(self.drug_concentration) + self.inhibition_step)
+        else:
+            self._exchange(alt_media_ml=self.volume, waste_ml=self.volume)
+
+    def _dilute(self) -> None:
+        if self.dosing_mode == "adaptive":
+            self._exchange_towards(self.inhibition(self.drug_concentration) - self.inhibition_step)
+        else:
+            self._exchange(media_ml=self.volume, waste_ml=self.volume)
+
+    def execute(self) -> events.AutomationEvent:
+        self._account_for_exchanges()
+        if self.dosing_queue.busy:
+            # the drug concentration isn't settled until the exchange in flight is done.
+            return events.NoEvent("waiting for the last exchange to finish.")
+        elif self.od_estimator is not None:
+            return self._execute_filtered()
+        elif self.previous_normalized_od is None:
+            return events.NoEvent("skip first event to wait for OD readings.")
+        elif (
+            self.latest_normalized_od >= self.target_normalized_od
+            and self.latest_normalized_od >= self.previous_normalized_od
+        ):
+            # if we are above the threshold, and growth rate is greater than dilution rate
+            # the second condition is an approximation of this.
+            self._add_drug()
+            return events.AddAltMediaEvent(
+                f"latest OD, {self.latest_normalized_od:.2f} >= Target OD, {self.target_normalized_od:.2f} and Latest OD, {self.latest_normalized_od:.2f} >= Previous OD, {self.previous_normalized_od:.2f}"
+            )
+        else:
+            self._dilute()
+            return events.DilutionEvent(
+                f"latest OD, {self.latest_normalized_od:.2f} < Target OD, {self.target_normalized_od:.2f} or Latest OD, {self.latest_normalized_od:.2f} < Previous OD, {self.previous_normalized_od:.2f}"
+            )
+
+    def _execute_filtered(self) -> events.AutomationEvent:
+        self.od_estimator.update(self.latest_normalized_od)
+        if not self.od_estimator.ready:
+            return events.NoEvent("skip first events to wait for OD readings.")
+
+        normalized_od, growth_rate = self.od_estimator.od, self.od_estimator.growth_rate
+        if normalized_od >= self.target_normalized_od and growth_rate >= self.dilution_rate:
+            self._add_drug()
+            return events.AddAltMediaEvent(
+                f"Filtered OD, {normalized_od:.2f} >= Target OD, {self.target_normalized_od:.2f} and growth rate, {growth_rate:.3f}/h >= dilution rate, {self.dilution_rate:.3f}/h"
+            )
+        else:
+            self._dilute()
+            return events.DilutionEvent(
+                f"Filtered OD, {normalized_od:.2f} < Target OD, {self.target_normalized_od:.2f} or growth rate, {growth_rate:.3f}/h < dilution rate, {self.dilution_rate:.3f}/h"
+            )
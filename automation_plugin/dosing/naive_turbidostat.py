@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+"""
+run on the command line, from the repo root, with
+$ python3 -m automation_plugin.dosing.naive_turbidostat
+
+Exit with ctrl-c
+"""
+from pioreactor.automations.dosing.base import DosingAutomationJobContrib
+
+from .od_estimator import ODEstimator
+
+
+class NaiveTurbidostat(DosingAutomationJobContrib):
+
+    automation_name = "naive_turbidostat"
+    published_settings = {
+        "target_od": {"datatype": "float", "settable": True, "unit": "AU"},
+        "od_window": {"datatype": "integer", "settable": False},
+    }
+
+    def __init__(self, target_od, od_window=0, **kwargs):
+        super().__init__(**kwargs)
+        self.target_od = float(target_od)
+        # opt-in: trigger on a regression over the last od_window readings instead of the latest one.
+        self.od_window = int(od_window)
+        self.od_estimator = ODEstimator(self.od_window) if self.od_window else None
+
+    def execute(self):
+        od = self.latest_od["2"]
+        if self.od_estimator is not None:
+            self.od_estimator.update(od)
+            od = self.od_estimator.od
+
+        if od > self.target_od:
+            moved = self.execute_io_action(media_ml=1.0, waste_ml=1.0)
+            if self.od_estimator is not None:
+                self.od_estimator.exchanged(self.vial_volume, moved["media_ml"])
+
+
+if __name__ == "__main__":
+    from pioreactor.background_jobs.dosing_control import DosingController
+
+    dc = DosingController(
+        "naive_turbidostat",
+        target_od=2.0,
+        duration=1,  # check every 1 minute
+        unit="test_unit",
+        experiment="test_experiment",
+    )
+    dc.block_until_disconnected()
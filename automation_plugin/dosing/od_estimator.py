@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+"""
+Streaming OD smoother and growth rate estimator.
+
+ODEstimator fits a line to log(OD) over the last `window` readings. The fit uses running sums over a fixed
+ring buffer, so an update costs the same whatever the window, and memory is fixed. The slope is the growth
+rate (1/h) and the fitted value at the latest reading is the smoothed OD.
+
+After a dilution, call `dilute(factor)` with the fraction of culture left (vial_volume / (vial_volume + ml)).
+Earlier readings are shifted onto the diluted scale in O(1), so the fit stays continuous and the growth rate
+excludes the dilution.
+"""
+from __future__ import annotations
+
+import time
+from collections import deque
+from math import exp, log
+from typing import Optional
+
+MIN_OD = 1e-6
+
+
+class ODEstimator:
+    def __init__(self, window: int = 10) -> None:
+        if window < 2:
+            raise ValueError("window must be at least 2 readings.")
+        self.window = window
+        self._buffer: deque[tuple[float, float]] = deque(maxlen=window)  # (hours since first reading, log OD - offset when added)
+        self._started_at: Optional[float] = None
+        self._offset = 0.0  # total log dilution so far
+        self._updates = 0
+        self._reset_sums()
+
+    def _reset_sums(self) -> None:
+        self._sum_t = self._sum_tt = self._sum_y = self._sum_ty = 0.0
+        for t, y in self._buffer:
+            self._add(t, y, 1)
+
+    def _add(self, t: float, y: float, sign: int) -> None:
+        self._sum_t += sign * t
+        self._sum_tt += sign * t * t
+        self._sum_y += sign * y
+        self._sum_ty += sign * t * y
+
+    def update(self, od: float, timestamp: Optional[float] = None) -> None:
+        timestamp = time.monotonic() if timestamp is None else timestamp
+        if self._started_at is None:
+            self._started_at = timestamp
+
+        t = (timestamp - self._started_at) / 3600
+        y = log(max(od, MIN_OD)) - self._offset
+        if len(self._buffer) == self.window:
+            self._add(*self._buffer[0], -1)
+        self._buffer.append((t, y))
+        self._add(t, y, 1)
+
+        # recompute the sums from the buffer now and then, so rounding from add / remove doesn't accumulate.
+        self._updates += 1
+        if self._updates % (100 * self.window) == 0:
+            self._reset_sums()
+
+    def dilute(self, factor: float) -> None:
+        """Shift earlier readings by log(factor), ex: factor = vial_volume / (vial_volume + ml)."""
+        if not (0 < factor <= 1):
+            raise ValueError("factor must be in (0, 1].")
+        self._offset += log(factor)
+
+    def exchanged(self, vial_volume: float, ml: float) -> None:
+        """Record an exchange of `ml` in a vial holding `vial_volume`."""
+        if ml > 0:
+            self.dilute(vial_volume / (vial_volume + ml))
+
+    @property
+    def ready(self) -> bool:
+        return len(self._buffer) >= 2
+
+    def _fit(self) -> tuple[float, float]:
+        # least squares on the stored values. The dilution offset is the same for every point, so it only moves
+        # the intercept: it's added back in `od`.
+        n = len(self._buffer)
+        mean_t, mean_y = self._sum_t / n, self._sum_y / n
+        variance = self._sum_tt / n - mean_t**2
+        slope = (self._sum_ty / n - mean_t * mean_y) / variance if variance > 1e-12 else 0.0
+        return slope, mean_y + slope * (self._buffer[-1][0] - mean_t)
+
+    @property
+    def growth_rate(self) -> float:
+        """Growth rate, in 1/h, excluding dilutions. 0 until there are two readings."""
+        return self._fit()[0] if self.ready else 0.0
+
+    @property
+    def od(self) -> float:
+        """Smoothed OD at the latest reading, on the current (diluted) scale."""
+        if not self._buffer:
+            raise ValueError("No OD readings yet.")
+        return exp(self._fit()[1] + self._offset)
@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+"""
+Pump calibration preflight shared by the dosing automations.
+
+Automations declare the pumps they need and call `require_calibrations` in __init__:
+
+    REQUIRED_PUMPS = ("media", "waste")
+    ...
+    require_calibrations(self.REQUIRED_PUMPS)
+
+The preflight only asks local storage whether each pump is calibrated. The pumps read their own calibrations
+when they run.
+"""
+from __future__ import annotations
+
+from typing import Iterable
+
+from pioreactor.exc import CalibrationError
+from pioreactor.utils import local_persistant_storage
+
+CACHE_NAME = "current_pump_calibration"
+PUMP_LABELS = {"media": "Media", "alt_media": "Alt-media", "waste": "Waste"}
+
+
+def require_calibrations(pumps: Iterable[str]) -> None:
+    """
+    Check that each of `pumps` is calibrated, in order. Raises CalibrationError for the first one that isn't.
+    """
+    with local_persistant_storage(CACHE_NAME) as cache:
+        for pump in pumps:
+            if pump not in cache:
+                raise CalibrationError(f"{PUMP_LABELS.get(pump, pump)} pump calibration must be performed first.")
+
@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+"""
+Serial scale reading for ChemostatWithScale: the scale answers each b"\r" with its weight, ex: b"  0.1234kg\r".
+
+tools/fake_scale.py serves the same protocol on a pty, to run ScaleReader without a scale.
+"""
+from __future__ import annotations
+
+import re
+import time
+from collections import deque
+from threading import Condition, Event, Thread
+from typing import TYPE_CHECKING, Optional
+
+if TYPE_CHECKING:
+    from serial import Serial
+
+WEIGHT_PATTERN = re.compile(rb"(\d+\.\d+)kg")
+
+
+def parse_weight(raw_result: bytes) -> Optional[float]:
+    # the scale answers with something like b"  0.1234kg\r". Returns grams, or None if unparseable.
+    match = WEIGHT_PATTERN.search(raw_result)
+    if match is None:
+        return None
+    return float(match.group(1)) * 1000
+
+
+def get_weight_from_scale(ser) -> float:
+    # single synchronous read. Prefer ScaleReader when reading repeatedly.
+    while True:
+        ser.write(b"\r")
+        weight = parse_weight(ser.read_until(b"\r"))
+        if weight is not None:
+            return weight
+
+
+class ScaleReader:
+    """
+    Owns a single serial connection to the scale, and polls it from a background thread. Timestamped
+    weights (in g, timestamps from time.monotonic) are kept in a fixed-size ring buffer, so readers
+    never wait on the serial round trip.
+
+    `port` can be any device pyserial can open, including the slave end of a pty, which is
+    handy for running against a fake scale, see tools/fake_scale.py.
+    """
+
+    def __init__(self, port: str = "/dev/ttyUSB0", buffer_size: int = 256, timeout: float = 1.0) -> None:
+        self.port = port
+        self.timeout = timeout
+        self.last_error: Optional[Exception] = None
+        self._samples: deque[tuple[float, float]] = deque(maxlen=buffer_size)
+        self._new_sample = Condition()
+        self._stop_event = Event()
+        self._polling = Event()
+        self._polling.set()
+        self._thread: Optional[Thread] = None
+        self._serial: Optional["Serial"] = None
+
+    def start(self) -> "ScaleReader":
+        if self._thread is not None:
+            return self
+        # imported here: pyserial is only needed once a scale is actually used.
+        from serial import Serial
+
+        self._serial = Serial(self.port, timeout=self.timeout)
+        try:
+            self._stop_event.clear()
+            thread = Thread(target=self._poll, daemon=True, name="scale-reader")
+            thread.start()
+            self._thread = thread
+        finally:
+            # don't hold on to the port if polling couldn't start.
+            if self._thread is None:
+                self._serial.close()
+                self._serial = None
+        return self
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None
+
+    def stop(self) -> None:
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout=2 * self.timeout)
+            self._thread = None
+        if self._serial is not None:
+            self._serial.close()
+            self._serial = None
+
+    def __enter__(self) -> "ScaleReader":
+        return self.start()
+
+    def __exit__(self, *args) -> None:
+        self.stop()
+
+    def pause(self) -> None:
+        """Stop polling, ex: while nothing needs weights, to keep the serial line quiet."""
+        self._polling.clear()
+
+    def resume(self) -> None:
+        self._polling.set()
+
+    def _poll(self) -> None:
+        from serial import SerialException
+
+        assert self._serial is not None
+        while not self._stop_event.is_set():
+            if not self._polling.wait(self.timeout):
+                continue
+            try:
+                self._serial.write(b"\r")
+                weight = parse_weight(self._serial.read_until(b"\r"))
+            except (SerialException, OSError) as e:
+                # keep the thread alive through transient errors, ex: the scale being power cycled.
+                self.last_error = e
+                self._stop_event.wait(self.timeout)
+                continue
+
+            if weight is None:
+                continue
+
+            with self._new_sample:
+                self._samples.append((time.monotonic(), weight))
+                self._new_sample.notify_all()
+
+    def latest(self) -> Optional[tuple[float, float]]:
+        """Most recent (timestamp, weight) sample, or None if nothing has been read yet."""
+        with self._new_sample:
+            return self._samples[-1] if self._samples else None
+
+    def samples(self, since: float = float("-inf")) -> list[tuple[float, float]]:
+        """Snapshot of the buffered (timestamp, weight) samples taken after `since`."""
+        with self._new_sample:
+            return [sample for sample in self._samples if sample[0] > since]
+
+    def mean_weight(self, n: int = 5) -> float:
+        """Average of the last n buffered weights."""
+        with self._new_sample:
+            if not self._samples:
+                raise ValueError("No weights have been read from the scale yet.")
+            recent = list(self._samples)[-n:]
+        return sum(weight for _, weight in recent) / len(recent)
+
+    def wait_for_sample(self, after: float = float("-inf"), timeout: Optional[float] = None) -> Optional[tuple[float, float]]:
+        """
+        Block until a sample newer than `after` is available, and return it. Returns None on timeout.
+        Without arguments, this returns the latest sample, waiting only if the buffer is empty.
+        """
+        with self._new_sample:
+            if self._new_sample.wait_for(lambda: bool(self._samples) and self._samples[-1][0] > after, timeout=timeout):
+                return self._samples[-1]
+            return None
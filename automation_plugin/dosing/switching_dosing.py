@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+from __future__ import annotations
+
+from typing import Optional
+
+from pioreactor.automations import events
+from pioreactor.automations.dosing.base import DosingAutomationJobContrib
+
+from ..checkpoints import Checkpoint
+from .mixing import subdose_count
+from .mixing import switch_volume
+from .pump_calibrations import require_calibrations
+
+
+class SwitchingDosing(DosingAutomationJobContrib):
+    """
+    Run od on the culture until it reaches a certain threshold, at which point it adds alternate media and removes media at the same time until effectively there is only alternate media in the vial, then to switch back when the same od as before is reached, rinse and repeat
+    """
+
+    automation_name = "switching_dosing"
+    published_settings = {
+        "target_od": {"datatype": "float", "settable": True, "unit": "AU"},
+        "duration": {"datatype": "float", "settable": True, "unit": "min"},
+        "switch_mode": {"datatype": "string", "settable": True},
+    }
+    REQUIRED_PUMPS = ("media", "waste", "alt_media")
+    SWITCH_MODES = ("planned", "iterative")
+
+    def __init__(self, target_od: float | str, switch_mode: str = "planned", **kwargs) -> None:
+        super().__init__(**kwargs)
+
+        require_calibrations(self.REQUIRED_PUMPS)
+
+
+        self.target_od = float(target_od)
+        self.set_switch_mode(switch_mode)
+
+        # warm restart: a restart after switching to alt media would otherwise switch to it again.
+        self.checkpoint = Checkpoint(self, save_changes_now=True)
+        self.current_liquid = self.checkpoint.load().get("current_liquid", "media")
+
+    def set_switch_mode(self, value: str) -> None:
+        if value not in self.SWITCH_MODES:
+            raise ValueError(f"switch_mode must be one of {self.SWITCH_MODES}.")
+        self.switch_mode = value
+
+    def on_disconnected(self) -> None:
+        super().on_disconnected()
+        self.checkpoint.save({"current_liquid": self.current_liquid}, force=True)
+
+    def execute(self) -> Optional[events.DilutionEvent]:
+        event = self._execute()
+        self.checkpoint.save({"current_liquid": self.current_liquid})
+        return event
+
+    def _execute(self) -> Optional[events.DilutionEvent]:
+        if self.latest_od['2'] >= self.target_od:
+
+            if self.current_liquid == "media":
+                # we are required to dose until self.alt_media_fraction > 0.95
+                target = 0.95
+                alt_media_ml_moved = self._switch_to(target, "alt_media")
+                self.current_liquid = "alt_media"
+
+                return events.DilutionEvent(f"Replaced until alt_media_fraction={target}, dosed {alt_media_ml_moved:.2f}mL alt-media.")
+
+            elif self.current_liquid == "alt_media":
+                # we are required to dose until self.alt_media_fraction < 0.05
+                target = 0.05
+                media_ml_moved = self._switch_to(target, "media")
+                self.current_liquid = "media"
+
+                return events.DilutionEvent(f"Replaced until alt_media_fraction={target}, dosed {media_ml_moved:.2f}mL media.")
+
+        else:
+            return None
+
+    def _switch_to(self, target: float, liquid: str) -> float:
+        pump = f"{liquid}_ml"
+        ml_moved = 0.0
+
+        if self.switch_mode == "planned":
+            # compute the whole exchange up front from the mixing model, as one execute_io_action: it splits the
+            # volume into subdoses, which switch_volume accounts for.
+            planned_liquid, ml = switch_volume(self.alt_media_fraction, target, self.vial_volume, self.MAX_SUBDOSE)
+            assert planned_liquid == liquid or ml == 0
+            self.logger.debug(f"Switching to {liquid} with {ml:.2f}mL in {subdose_count(ml, self.MAX_SUBDOSE)} subdoses.")
+            if ml > 0:
+                results = self.execute_io_action(waste_ml=ml, **{pump: ml})
+                ml_moved += results[pump]
+        else:
+            def is_switched() -> bool:
+                return self.alt_media_fraction > target if liquid == "alt_media" else self.alt_media_fraction < target
+
+            while not is_switched() and self.state == self.READY:
+                results = self.execute_io_action(waste_ml=0.75, **{pump: 0.75})
+                ml_moved += results[pump]
+
+        return ml_moved
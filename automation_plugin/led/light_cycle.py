@@ -0,0 +1,215 @@
+# -*- coding: utf-8 -*-
+from __future__ import annotations
+import time
+from pioreactor.actions.led_intensity import led_intensity
+from pioreactor.automations.led.base import LEDAutomationJobContrib
+from pioreactor.automations import events
+from pioreactor.types import LedChannel
+from math import exp, floor
+from typing import Optional
+
+from ..checkpoints import Checkpoint
+
+__plugin_summary__ = "An LED automation for smooth light cycles"
+__plugin_version__ = "0.0.1"
+__plugin_name__ = "Light Cycle LED automation"
+
+
+def logistic(t, k, d):
+    return 1 / (1 + exp(-k * (t - d)))
+
+
+DAWN_MIDPOINT_HOURS = 5
+DAWN_STEEPNESS = 1.5  # 1/h, of the dawn and dusk logistics
+MAX_LIGHT_HOURS = 24
+
+
+def light_at_time_t(t, light_hours=16.0, day_hours=24.0):
+    # dawn is centered 5h into the day, dusk 5h after the end of the photoperiod. Each is used up to half-way
+    # to the other's midpoint, where the two logistics are equal: half-way through the photoperiod, and half-way
+    # through the night. So the curve is continuous for any light_hours, including from one day to the next.
+    dusk_midpoint = DAWN_MIDPOINT_HOURS + light_hours
+    night_start = (dusk_midpoint + DAWN_MIDPOINT_HOURS + day_hours) / 2 - day_hours
+    t = (t - night_start) % day_hours + night_start
+    if t < DAWN_MIDPOINT_HOURS + light_hours / 2:
+        return logistic(t, DAWN_STEEPNESS, DAWN_MIDPOINT_HOURS)
+    else:
+        return logistic(t, -DAWN_STEEPNESS, dusk_midpoint)
+
+
+def intensity_table(max_light_intensity: float, light_hours: float, resolution_minutes: float, day_hours: float = 24.0) -> list[float]:
+    """
+    One day of intensities, one entry per `resolution_minutes` slot, sampled at the start of each slot. Raises
+    ValueError if two consecutive entries, including the last and the first, are further apart than the
+    logistics' steepest change over a slot.
+    """
+    slots = max(1, round(day_hours * 60 / resolution_minutes))
+    table = [max_light_intensity * light_at_time_t(i * resolution_minutes / 60, light_hours, day_hours) for i in range(slots)]
+
+    max_step = max_light_intensity * DAWN_STEEPNESS / 4 * resolution_minutes / 60
+    for i, intensity in enumerate(table):
+        if abs(intensity - table[i - 1]) > max_step + 1e-9:
+            raise ValueError(f"The light cycle jumps by {abs(intensity - table[i - 1]):.2f}% at slot {i}, more than {max_step:.2f}%.")
+    return table
+
+
+def dawn_anchor(dawn_time: str, now: float) -> float:
+    """
+    Unix time at which the light day of `now`'s local date starts, such that the light is half-way up at
+    `dawn_time` ("HH:MM", local time). Resolve it again each day: across a DST change, the previous day's anchor
+    is an hour off.
+    """
+    hours, minutes = (int(part) for part in dawn_time.split(":"))
+    if not (0 <= hours < 24 and 0 <= minutes < 60):
+        raise ValueError(f"dawn_time should look like HH:MM, got {dawn_time}.")
+    local = time.localtime(now)
+    dawn = time.mktime((local.tm_year, local.tm_mon, local.tm_mday, hours, minutes, 0, 0, 0, -1))
+    return dawn - DAWN_MIDPOINT_HOURS * 3600
+
+
+class LightCycle(LEDAutomationJobContrib):
+
+    automation_name: str = "light_cycle"
+    published_settings: dict[str, dict] = {
+        "duration": {
+            "datatype": "float",
+            "settable": False,
+            "unit": "min",
+        },  # doesn't make sense to change duration.
+        "max_light_intensity": {"datatype": "float", "settable": True, "unit": "%"},
+        "light_hours": {"datatype": "float", "settable": True, "unit": "h"},
+        "change_tolerance": {"datatype": "float", "settable": True, "unit": "%"},
+        "dawn_time": {"datatype": "string", "settable": True},
+    }
+
+    def __init__(
+        self,
+        max_light_intensity: float,
+        light_hours: float = 16.0,
+        resolution_minutes: float = 5.0,
+        change_tolerance: float = 0.0,
+        dawn_time: Optional[str] = None,
+        **kwargs,
+    ):
+        super().__init__(**kwargs)
+        self.channels: list[LedChannel] = [LedChannel("B"), LedChannel("C")]
+        self.max_light_intensity = float(max_light_intensity)
+        self.resolution_minutes = float(resolution_minutes)
+        # skip writes whose change from the last written value is at most this (in %).
+        self.change_tolerance = float(change_tolerance)
+        self.last_written_intensity: float | None = None
+        self.set_light_hours(light_hours)
+
+        # the schedule is a function of absolute time since the anchor, so delays, pauses and restarts don't
+        # shift the cycle. Without a dawn_time, the cycle starts when the job starts, or, after a restart in the
+        # same experiment, where the last run's cycle was.
+        self.checkpoint = Checkpoint(self, save_changes_now=True)
+        saved = self.checkpoint.load()
+        self._anchor_date: Optional[tuple[int, int, int]] = None  # local date the dawn_time anchor was resolved for
+        if dawn_time is not None or "anchor" not in saved:
+            self.set_dawn_time(dawn_time)
+        else:
+            self.dawn_time = saved.get("dawn_time")
+            self.anchor = saved["anchor"]
+
+    def _state(self) -> dict:
+        return {"anchor": self.anchor, "dawn_time": self.dawn_time}
+
+    def set_dawn_time(self, value: Optional[str]) -> None:
+        self.dawn_time = value or None
+        self._anchor_date = None
+        if self.dawn_time:
+            self._resolve_anchor(time.time())
+        else:
+            self.anchor = time.time()
+        self.checkpoint.save(self._state())
+
+    def _resolve_anchor(self, now: float) -> None:
+        # a dawn_time is local time, so its anchor is resolved for each local day, to keep dawn at dawn_time
+        # across DST changes.
+        date = time.localtime(now)[:3]
+        if date != self._anchor_date:
+            self.anchor = dawn_anchor(self.dawn_time, now)
+            self._anchor_date = date
+
+    def on_disconnected(self) -> None:
+        super().on_disconnected()
+        self.checkpoint.save(self._state(), force=True)
+
+    @property
+    def hours_online(self) -> float:
+        # hours since the anchor, which is the position in the light cycle (modulo the day).
+        return (time.time() - self.anchor) / 3600
+
+    def _build_table(self) -> None:
+        self.table = intensity_table(self.max_light_intensity, self.light_hours, self.resolution_minutes)
+
+    def set_max_light_intensity(self, value: float | str) -> None:
+        self.max_light_intensity = float(value)
+        self._build_table()
+
+    def set_light_hours(self, value: float | str) -> None:
+        light_hours = float(value)
+        if not (0 <= light_hours <= MAX_LIGHT_HOURS):
+            raise ValueError(f"light_hours must be between 0 and {MAX_LIGHT_HOURS}h.")
+        self.light_hours = light_hours
+        self._build_table()
+
+    def intensity_at(self, hours: float) -> float:
+        # floored, so hours before the anchor fall in the previous day's slots. Rounded first, so a time on a slot
+        # boundary isn't read as the slot before it.
+        return self.table[floor(round(hours * 60 / self.resolution_minutes, 9)) % len(self.table)]
+
+    def set_led_intensities(self, intensity: float) -> bool:
+        """
+        Set all of self.channels in one led_intensity call. Like set_led_intensity, retries for a few seconds if
+        the channels are locked.
+        """
+        attempts = 12
+        for _ in range(attempts):
+            success = led_intensity(
+                {channel: intensity for channel in self.channels},
+                unit=self.unit,
+                experiment=self.experiment,
+                pubsub_client=self.pub_client,
+                source_of_event=f"{self.job_name}:{self.automation_name}",
+            )
+            if success:
+                self.edited_channels.update(self.channels)
+                return True
+            time.sleep(0.5)
+
+        self.logger.warning(f"{self.automation_name} was unable to update channels {self.channels}.")
+        return False
+
+    def execute(self) -> events.AutomationEvent:
+        if self.dawn_time:
+            self._resolve_anchor(time.time())
+        self.checkpoint.save(self._state())
+        new_intensity = self.intensity_at(self.hours_online)
+
+        if self.last_written_intensity is not None and abs(new_intensity - self.last_written_intensity) <= self.change_tolerance:
+            return events.NoEvent(f"Intensity unchanged at {self.last_written_intensity:0.2f}%")
+
+        if not self.set_led_intensities(new_intensity):
+            # nothing changed: try again on the next execute.
+            return events.ErrorOccurred(f"Unable to change intensity to {new_intensity:0.2f}%")
+        self.last_written_intensity = new_intensity
+        return events.ChangedLedIntensity(f"Changed intensity to {new_intensity:0.2f}%")
+
+
+# run on the command line, from the repo root, with
+# $ python3 -m automation_plugin.led.light_cycle
+if __name__ == "__main__":
+    from pioreactor.background_jobs.led_control import LEDController
+    from pioreactor.whoami import get_unit_name, get_latest_experiment_name
+
+    lc = LEDController(
+        led_automation="light_cycle",
+        max_light_intensity=2.0,
+        duration=0.03,  # every Xmin we "wake up" and decide what to do.
+        unit=get_unit_name(),
+        experiment=get_latest_experiment_name(),
+    )
+
+    lc.block_until_disconnected()
@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+"""
+The plugin's entry point (see setup.py): importing this module registers the automations in this package.
+
+An automation registers itself with its controller when its module is imported, through the automation base
+classes' __init_subclass__, so this imports the module of every automation in settings_schema (generated by
+tools/generate_ui.py). The modules are cheap to import: their heavier dependencies, ex: pyserial, are only
+imported by the automations that use them, when they start. Each automation then checks the settings it's
+started with against the schema, see validation.check_on_start.
+
+automation_profiling and decision_trace wrap the automations' execute, so they're only imported if enabled in
+config.ini.
+"""
+from __future__ import annotations
+
+import importlib
+
+from pioreactor.config import config
+
+from .settings_schema import SCHEMAS
+from .validation import check_on_start
+
+# wrap the execute of the automations, if enabled in config.ini.
+OPT_IN_MODULES = ("automation_profiling", "decision_trace")
+
+
+for module in OPT_IN_MODULES:
+    if config.getboolean(module, "enabled", fallback=False):
+        importlib.import_module(f".{module}", __package__)
+
+for schema in SCHEMAS.values():
+    check_on_start(getattr(importlib.import_module(f".{schema['module']}", __package__), schema["class"]))
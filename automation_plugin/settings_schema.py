@@ -0,0 +1,174 @@
+# -*- coding: utf-8 -*-
+# generated by tools/generate_ui.py: rerun it instead of editing.
+#
+# automation_name -> kind, module (in automation_plugin) and class, and setting -> datatype, whether it's
+# required, can be None, can be changed while running, and its allowed values.
+SCHEMAS = {
+    "adapted_turbidostat": {
+        "kind": "dosing",
+        "module": "dosing.adapted_turbidostat",
+        "class": "AdaptedTurbidostat",
+        "settings": {
+            "volume": {"datatype": "float", "required": True, "nullable": False, "settable": True, "choices": None},
+            "max_od": {"datatype": "float", "required": True, "nullable": False, "settable": True, "choices": None},
+            "min_od": {"datatype": "float", "required": True, "nullable": False, "settable": True, "choices": None},
+            "max_normalized_od": {"datatype": "float", "required": True, "nullable": True, "settable": True, "choices": None},
+            "min_normalized_od": {"datatype": "float", "required": True, "nullable": True, "settable": True, "choices": None},
+            "dosing_mode": {"datatype": "string", "required": False, "nullable": False, "settable": True, "choices": ["fixed_volume", "single_dose"]},
+            "async_dosing": {"datatype": "boolean", "required": False, "nullable": False, "settable": False, "choices": None},
+            "od_window": {"datatype": "integer", "required": False, "nullable": False, "settable": False, "choices": None},
+            "duration": {"datatype": "float", "required": False, "nullable": True, "settable": True, "choices": None},
+            "skip_first_run": {"datatype": "boolean", "required": False, "nullable": False, "settable": False, "choices": None},
+            "initial_alt_media_fraction": {"datatype": "float", "required": False, "nullable": False, "settable": False, "choices": None},
+            "initial_vial_volume": {"datatype": "float", "required": False, "nullable": False, "settable": False, "choices": None},
+        },
+    },
+    "chemostat_with_constant_alt_media_fraction": {
+        "kind": "dosing",
+        "module": "dosing.chemostat_with_constant_alt_media_fraction",
+        "class": "ChemostatWithConstantAltMediaFraction",
+        "settings": {
+            "volume": {"datatype": "float", "required": True, "nullable": False, "settable": True, "choices": None},
+            "target_fraction": {"datatype": "float", "required": True, "nullable": False, "settable": True, "choices": None},
+            "exchange_mode": {"datatype": "string", "required": False, "nullable": False, "settable": True, "choices": ["sequential", "co_dosing"]},
+            "duration": {"datatype": "float", "required": False, "nullable": True, "settable": False, "choices": None},
+            "skip_first_run": {"datatype": "boolean", "required": False, "nullable": False, "settable": False, "choices": None},
+            "initial_alt_media_fraction": {"datatype": "float", "required": False, "nullable": False, "settable": False, "choices": None},
+            "initial_vial_volume": {"datatype": "float", "required": False, "nullable": False, "settable": False, "choices": None},
+        },
+    },
+    "chemostat_with_scale": {
+        "kind": "dosing",
+        "module": "dosing.chemostat_with_weight_scale",
+        "class": "ChemostatWithScale",
+        "settings": {
+            "volume": {"datatype": "float", "required": True, "nullable": False, "settable": True, "choices": None},
+            "exchange_mode": {"datatype": "string", "required": False, "nullable": False, "settable": True, "choices": ["sequential", "concurrent"]},
+            "dose_mode": {"datatype": "string", "required": False, "nullable": False, "settable": True, "choices": ["weighed", "timed"]},
+            "recalibrate": {"datatype": "boolean", "required": False, "nullable": False, "settable": False, "choices": None},
+            "duration": {"datatype": "float", "required": False, "nullable": True, "settable": True, "choices": None},
+            "skip_first_run": {"datatype": "boolean", "required": False, "nullable": False, "settable": False, "choices": None},
+            "initial_alt_media_fraction": {"datatype": "float", "required": False, "nullable": False, "settable": False, "choices": None},
+            "initial_vial_volume": {"datatype": "float", "required": False, "nullable": False, "settable": False, "choices": None},
+        },
+    },
+    "constant_duty_cycle": {
+        "kind": "temperature",
+        "module": "temperature.constant_duty_cycle",
+        "class": "ConstantDutyCycle",
+        "settings": {
+            "duty_cycle": {"datatype": "float", "required": True, "nullable": False, "settable": True, "choices": None},
+        },
+    },
+    "light_cycle": {
+        "kind": "led",
+        "module": "led.light_cycle",
+        "class": "LightCycle",
+        "settings": {
+            "max_light_intensity": {"datatype": "float", "required": True, "nullable": False, "settable": True, "choices": None},
+            "light_hours": {"datatype": "float", "required": False, "nullable": False, "settable": True, "choices": None},
+            "resolution_minutes": {"datatype": "float", "required": False, "nullable": False, "settable": False, "choices": None},
+            "change_tolerance": {"datatype": "float", "required": False, "nullable": False, "settable": True, "choices": None},
+            "dawn_time": {"datatype": "string", "required": False, "nullable": True, "settable": True, "choices": None},
+            "duration": {"datatype": "float", "required": True, "nullable": False, "settable": False, "choices": None},
+            "skip_first_run": {"datatype": "boolean", "required": False, "nullable": False, "settable": False, "choices": None},
+        },
+    },
+    "morbidostat": {
+        "kind": "dosing",
+        "module": "dosing.morbidostat",
+        "class": "Morbidostat",
+        "settings": {
+            "target_normalized_od": {"datatype": "float", "required": True, "nullable": False, "settable": True, "choices": None},
+            "volume": {"datatype": "float", "required": True, "nullable": False, "settable": True, "choices": None},
+            "async_dosing": {"datatype": "boolean", "required": False, "nullable": False, "settable": False, "choices": None},
+            "od_window": {"datatype": "integer", "required": False, "nullable": False, "settable": False, "choices": None},
+            "dosing_mode": {"datatype": "string", "required": False, "nullable": False, "settable": True, "choices": ["fixed_volume", "adaptive"]},
+            "alt_media_drug_concentration": {"datatype": "float", "required": False, "nullable": False, "settable": True, "choices": None},
+            "ic50": {"datatype": "float", "required": False, "nullable": True, "settable": True, "choices": None},
+            "hill": {"datatype": "float", "required": False, "nullable": False, "settable": True, "choices": None},
+            "inhibition_step": {"datatype": "float", "required": False, "nullable": False, "settable": True, "choices": None},
+            "duration": {"datatype": "float", "required": False, "nullable": True, "settable": True, "choices": None},
+            "skip_first_run": {"datatype": "boolean", "required": False, "nullable": False, "settable": False, "choices": None},
+            "initial_alt_media_fraction": {"datatype": "float", "required": False, "nullable": False, "settable": False, "choices": None},
+            "initial_vial_volume": {"datatype": "float", "required": False, "nullable": False, "settable": False, "choices": None},
+        },
+    },
+    "naive_turbidostat": {
+        "kind": "dosing",
+        "module": "dosing.naive_turbidostat",
+        "class": "NaiveTurbidostat",
+        "settings": {
+            "target_od": {"datatype": "float", "required": True, "nullable": False, "settable": True, "choices": None},
+            "od_window": {"datatype": "integer", "required": False, "nullable": False, "settable": False, "choices": None},
+            "duration": {"datatype": "float", "required": False, "nullable": True, "settable": False, "choices": None},
+            "skip_first_run": {"datatype": "boolean", "required": False, "nullable": False, "settable": False, "choices": None},
+            "initial_alt_media_fraction": {"datatype": "float", "required": False, "nullable": False, "settable": False, "choices": None},
+            "initial_vial_volume": {"datatype": "float", "required": False, "nullable": False, "settable": False, "choices": None},
+        },
+    },
+    "only_record_temperature": {
+        "kind": "temperature",
+        "module": "temperature.only_record_temperature",
+        "class": "OnlyRecordTemperature",
+        "settings": {
+        },
+    },
+    "pid_turbidostat": {
+        "kind": "dosing",
+        "module": "dosing.PID_turbidostat",
+        "class": "PIDTurbidostat",
+        "settings": {
+            "target_normalized_od": {"datatype": "float", "required": False, "nullable": True, "settable": True, "choices": None},
+            "target_od": {"datatype": "float", "required": False, "nullable": True, "settable": True, "choices": None},
+            "async_dosing": {"datatype": "boolean", "required": False, "nullable": False, "settable": False, "choices": None},
+            "od_window": {"datatype": "integer", "required": False, "nullable": False, "settable": False, "choices": None},
+            "duration": {"datatype": "float", "required": False, "nullable": True, "settable": True, "choices": None},
+            "skip_first_run": {"datatype": "boolean", "required": False, "nullable": False, "settable": False, "choices": None},
+            "initial_alt_media_fraction": {"datatype": "float", "required": False, "nullable": False, "settable": False, "choices": None},
+            "initial_vial_volume": {"datatype": "float", "required": False, "nullable": False, "settable": False, "choices": None},
+        },
+    },
+    "random_profile": {
+        "kind": "temperature",
+        "module": "temperature.random_temperature",
+        "class": "RandomTemperature",
+        "settings": {
+            "min_temperature": {"datatype": "float", "required": True, "nullable": False, "settable": True, "choices": None},
+            "max_temperature": {"datatype": "float", "required": True, "nullable": False, "settable": True, "choices": None},
+            "dwell": {"datatype": "float", "required": False, "nullable": False, "settable": True, "choices": None},
+            "seed": {"datatype": "integer", "required": False, "nullable": True, "settable": False, "choices": None},
+        },
+    },
+    "switching_dosing": {
+        "kind": "dosing",
+        "module": "dosing.switching_dosing",
+        "class": "SwitchingDosing",
+        "settings": {
+            "target_od": {"datatype": "float", "required": True, "nullable": False, "settable": True, "choices": None},
+            "switch_mode": {"datatype": "string", "required": False, "nullable": False, "settable": True, "choices": ["planned", "iterative"]},
+            "duration": {"datatype": "float", "required": False, "nullable": True, "settable": True, "choices": None},
+            "skip_first_run": {"datatype": "boolean", "required": False, "nullable": False, "settable": False, "choices": None},
+            "initial_alt_media_fraction": {"datatype": "float", "required": False, "nullable": False, "settable": False, "choices": None},
+            "initial_vial_volume": {"datatype": "float", "required": False, "nullable": False, "settable": False, "choices": None},
+        },
+    },
+    "temperature_gradient": {
+        "kind": "temperature",
+        "module": "temperature.temperature_gradient",
+        "class": "TemperatureGradient",
+        "settings": {
+            "final_target_temperature": {"datatype": "float", "required": True, "nullable": False, "settable": True, "choices": None},
+            "start_temperature": {"datatype": "float", "required": True, "nullable": False, "settable": True, "choices": None},
+            "time_to_reach": {"datatype": "float", "required": True, "nullable": False, "settable": True, "choices": None},
+        },
+    },
+    "temperature_profile": {
+        "kind": "temperature",
+        "module": "temperature.temperature_profile",
+        "class": "TemperatureProfile",
+        "settings": {
+            "profile": {"datatype": "string", "required": True, "nullable": False, "settable": False, "choices": None},
+        },
+    },
+}
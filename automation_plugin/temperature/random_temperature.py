@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+from __future__ import annotations
+
+import time
+from math import ceil
+from random import randrange
+from typing import Optional
+
+from pioreactor.automations.events import UpdatedHeaterDC
+from pioreactor.automations.temperature.base import TemperatureAutomationJobContrib
+from pioreactor.config import config
+from pioreactor.utils import clamp
+from pioreactor.utils.streaming_calculations import PID
+
+from .temperature_profile import MAX_TARGET_TEMP
+from .temperature_profile import ProfileError
+from .temperature_profile import TemperatureSchedule
+
+
+class RandomTemperature(TemperatureAutomationJobContrib):
+    """
+    Holds a temperature drawn between min_temperature and max_temperature for `dwell` minutes, then draws the
+    next one, tracking each with a PID that's kept across setpoints, as in TemperatureProfile.
+
+    The draws are seeded, so a run can be repeated with the same seed, and precomputed a day at a time as a
+    TemperatureSchedule, whose setpoints are logged when it's compiled.
+    """
+
+    automation_name = "random_profile"
+    published_settings = {
+        "min_temperature": {"datatype": "float", "unit": "°C", "settable": True},
+        "max_temperature": {"datatype": "float", "unit": "°C", "settable": True},
+        "dwell": {"datatype": "float", "unit": "min", "settable": True},
+        "seed": {"datatype": "integer", "settable": False},
+        "target_temperature": {"datatype": "float", "unit": "°C", "settable": False},
+    }
+    SCHEDULE_HOURS = 24  # compiled ahead at a time, rounded up to a whole number of dwells
+
+    def __init__(
+        self,
+        min_temperature: float | str,
+        max_temperature: float | str,
+        dwell: float | str = 60.0,
+        seed: Optional[int | str] = None,
+        **kwargs,
+    ) -> None:
+        super(RandomTemperature, self).__init__(**kwargs)
+        self.min_temperature = float(min_temperature)
+        self.max_temperature = float(max_temperature)
+        self.dwell = float(dwell)
+        # without one, a seed is drawn and logged, so the run can still be repeated.
+        self.seed = int(seed) if seed is not None else randrange(2**31)
+        self.logger.info(f"Drawing setpoints with seed={self.seed}.")
+        self._compile(started_at=time.monotonic())
+        self.target_temperature = self.schedule.setpoint_at(0)
+
+        self.pid = PID(
+            Kp=config.getfloat("temperature_automation.thermostat", "Kp"),
+            Ki=config.getfloat("temperature_automation.thermostat", "Ki"),
+            Kd=config.getfloat("temperature_automation.thermostat", "Kd"),
+            setpoint=self.target_temperature,
+            unit=self.unit,
+            experiment=self.experiment,
+            job_name=self.job_name,
+            target_name="temperature",
+            output_limits=(-25, 25),  # avoid whiplashing
+        )
+
+    def _compile(self, started_at: float, chunk: int = 0) -> None:
+        # chunk i covers [i, i + 1) * chunk length after started_at, with its own draws, so a long run doesn't
+        # repeat the first day's. Raises ProfileError (a ValueError) for bad settings.
+        if not self.dwell > 0:
+            raise ProfileError(f"dwell must be positive, got {self.dwell}.")
+        dwells = ceil(self.SCHEDULE_HOURS * 60 / self.dwell)
+        self.schedule = TemperatureSchedule.from_segments(
+            [{"random": {"min": self.min_temperature, "max": self.max_temperature, "dwell": self.dwell, "minutes": dwells * self.dwell, "seed": f"{self.seed}:{chunk}"}}]
+        )
+        self.started_at = started_at
+        self.chunk = chunk
+
+        chunk_started_at = time.time() - (time.monotonic() - self.chunk_start)
+        setpoints = ", ".join(
+            f"{time.strftime('%H:%M', time.localtime(chunk_started_at + start))} {value:.2f}°C" for start, value in zip(self.schedule.starts, self.schedule.values)
+        )
+        self.logger.info(f"Setpoints for the next {self.schedule.period / 3600:.1f}h: {setpoints}.")
+
+    @property
+    def chunk_start(self) -> float:
+        return self.started_at + self.chunk * self.schedule.period
+
+    def _restart_schedule(self) -> None:
+        self._compile(started_at=time.monotonic())
+        self.target_temperature = self.schedule.setpoint_at(0)
+        if hasattr(self, "pid"):
+            self.pid.set_setpoint(self.target_temperature)
+
+    def _set_and_restart(self, name: str, value: float | str) -> None:
+        # keep the previous value, and schedule, if the new one can't be compiled.
+        previous = getattr(self, name)
+        setattr(self, name, float(value))
+        try:
+            self._restart_schedule()
+        except Exception:
+            setattr(self, name, previous)
+            raise
+
+    def set_min_temperature(self, value: float | str) -> None:
+        self._set_and_restart("min_temperature", value)
+
+    def set_max_temperature(self, value: float | str) -> None:
+        self._set_and_restart("max_temperature", value)
+
+    def set_dwell(self, value: float | str) -> None:
+        self._set_and_restart("dwell", value)
+
+    def execute(self) -> Optional[UpdatedHeaterDC]:
+        if not hasattr(self, "pid"):
+            # execute can run before __init__ has finished, on the first temperature reading.
+            return None
+
+        assert self.latest_temperature is not None
+
+        elapsed = time.monotonic() - self.started_at
+        if elapsed >= (self.chunk + 1) * self.schedule.period:
+            self._compile(self.started_at, chunk=int(elapsed // self.schedule.period))
+
+        setpoint = clamp(0, self.schedule.setpoint_at(time.monotonic() - self.chunk_start), MAX_TARGET_TEMP)
+        if setpoint != self.target_temperature:
+            self.target_temperature = setpoint
+            self.pid.set_setpoint(setpoint)
+
+        output = self.pid.update(self.latest_temperature, dt=1)
+        self.update_heater_with_delta(output)
+
+        return UpdatedHeaterDC(
+            f"delta_dc={output}",
+            data={
+                "current_dc": self.heater_duty_cycle,
+                "delta_dc": output,
+                "target_temperature": self.target_temperature,
+            },
+        )
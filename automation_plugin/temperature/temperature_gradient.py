@@ -0,0 +1,180 @@
+# -*- coding: utf-8 -*-
+from __future__ import annotations
+
+import time
+
+from pioreactor.automations.events import UpdatedHeaterDC
+from pioreactor.automations.temperature.base import TemperatureAutomationJob
+from pioreactor.config import config
+from pioreactor.utils import clamp
+from pioreactor.utils.streaming_calculations import PID
+
+from ..checkpoints import Checkpoint
+from ..checkpoints import pid_state
+from ..checkpoints import restore_pid
+
+
+class RampSchedule:
+    """
+    Linear setpoint trajectory from `start_temperature` to `final_temperature` over `seconds`, anchored at a
+    time.monotonic() timestamp. The setpoint is a function of the clock only, so late or skipped ticks
+    don't accumulate drift.
+    """
+
+    def __init__(self, start_temperature: float, final_temperature: float, seconds: float, started_at: float) -> None:
+        self.start_temperature = start_temperature
+        self.final_temperature = final_temperature
+        self.started_at = started_at
+        self.ends_at = started_at + max(seconds, 0.0)
+        self.slope = (final_temperature - start_temperature) / seconds if seconds > 0 else 0.0
+
+    def setpoint_at(self, t: float) -> float:
+        if t >= self.ends_at:
+            return self.final_temperature
+        return self.start_temperature + self.slope * max(t - self.started_at, 0.0)
+
+
+class TemperatureGradient(TemperatureAutomationJob):
+    """
+    Uses a PID controller to change the DC% to match a target temperature, which ramps linearly from
+    start_temperature to final_target_temperature over time_to_reach minutes.
+    """
+
+    MAX_TARGET_TEMP = 50
+    automation_name = "temperature_gradient"
+    published_settings = {"final_target_temperature": {"datatype": "float", "unit": "°C", "settable": True},
+                          "start_temperature": {"datatype": "float", "unit": "°C", "settable": True},
+                          "time_to_reach": {"datatype": "float", "unit": "min", "settable": True},
+                          "target_temperature": {"datatype": "float", "unit": "°C", "settable": False}}
+
+    def __init__(self, final_target_temperature: float | str, start_temperature: float | str, time_to_reach: float | str, **kwargs) -> None:
+        super().__init__(**kwargs)
+        assert final_target_temperature is not None and start_temperature is not None, "target_temperature must be set"
+        self.final_target_temperature = float(final_target_temperature)
+        self.start_temperature = float(start_temperature)
+        self.time_to_reach = float(time_to_reach)
+        self.target_temperature = clamp(0, self.start_temperature, self.MAX_TARGET_TEMP)
+
+        # the ramp is anchored once, here. Changing its settings re-times it from this anchor.
+        self.ramp_started_at = time.monotonic()
+
+        # warm restart: if the last run of this experiment had the same ramp, carry on from where it got to
+        # (the ramp kept going while the job was down), with the PID's integral.
+        self.checkpoint = Checkpoint(self)
+        state = self.checkpoint.load()
+        if state.get("ramp") == self._ramp_settings():
+            self.ramp_started_at = time.monotonic() - (time.time() - state["ramp_started_at"])
+        self._build_ramp()
+
+        # read the gains once, and keep a single controller so its integral and derivative state survive between ticks.
+        self.Kp = config.getfloat("temperature_automation.thermostat", "Kp")
+        self.Ki = config.getfloat("temperature_automation.thermostat", "Ki")
+        self.Kd = config.getfloat("temperature_automation.thermostat", "Kd")
+
+        self.pid = PID(
+            Kp=self.Kp,
+            Ki=self.Ki,
+            Kd=self.Kd,
+            setpoint=self.target_temperature,
+            unit=self.unit,
+            experiment=self.experiment,
+            job_name=self.job_name,
+            target_name="temperature",
+            output_limits=(-25, 25),  # avoid whiplashing
+        )
+        restore_pid(self.pid, state.get("pid"))
+
+    def _ramp_settings(self) -> list[float]:
+        return [self.start_temperature, self.final_target_temperature, self.time_to_reach]
+
+    def _checkpoint_state(self) -> dict:
+        return {
+            "ramp": self._ramp_settings(),
+            "ramp_started_at": time.time() - (time.monotonic() - self.ramp_started_at),  # as a unix time
+            "pid": pid_state(self.pid),
+        }
+
+    def on_disconnected(self) -> None:
+        super().on_disconnected()
+        self.checkpoint.save(self._checkpoint_state(), force=True)
+
+    def _build_ramp(self) -> None:
+        self.ramp = RampSchedule(self.start_temperature, self.final_target_temperature, self.time_to_reach * 60, self.ramp_started_at)
+
+    def execute(self) -> UpdatedHeaterDC:
+        while not hasattr(self, "pid"):
+            # sometimes when initializing, this execute can run before the subclasses __init__ is resolved.
+            pass
+
+        assert self.latest_temperature is not None
+
+        setpoint = self.ramp.setpoint_at(time.monotonic())
+        if setpoint != self.target_temperature:
+            self.set_target_temperature(setpoint, update_dc_now=False)
+
+        output = self.pid.update(
+            self.latest_temperature, dt=1
+        )  # 1 represents an arbitrary unit of time. The PID values will scale such that 1 makes sense.
+        self.update_heater_with_delta(output)
+        self.logger.debug(f"PID output = {output}")
+        self.checkpoint.save(self._checkpoint_state())
+
+        return UpdatedHeaterDC(
+            f"delta_dc={output}",
+            data={
+                "current_dc": self.heater_duty_cycle,
+                "delta_dc": output,
+                "target_temperature": self.target_temperature,
+            },
+        )
+
+    def set_final_target_temperature(self, final_target_temperature: float | str) -> None:
+        self.final_target_temperature = float(final_target_temperature)
+        self._build_ramp()
+
+    def set_start_temperature(self, start_temperature: float | str) -> None:
+        self.start_temperature = float(start_temperature)
+        self._build_ramp()
+
+    def set_time_to_reach(self, time_to_reach: float | str) -> None:
+        self.time_to_reach = float(time_to_reach)
+        self._build_ramp()
+
+    def set_target_temperature(self, target_temperature: float, update_dc_now: bool = True) -> None:
+        """
+
+        Parameters
+        ------------
+
+        target_temperature: float
+            the new target temperature
+        update_dc_now: bool
+            if possible, update the DC% to approach the new target temperatur
+
+        """
+        target_temperature = float(target_temperature)
+        if target_temperature > self.MAX_TARGET_TEMP:
+            self.logger.warning(
+                f"Values over {self.MAX_TARGET_TEMP}℃ are not supported. Setting to {self.MAX_TARGET_TEMP}℃."
+            )
+
+        target_temperature = clamp(0, target_temperature, self.MAX_TARGET_TEMP)
+        self.target_temperature = target_temperature
+        self.pid.set_setpoint(self.target_temperature)
+
+        # when set_target_temperature is executed, and we wish to update the DC to some new value,
+        # it's possible that it isn't updated immediately if set during the `evaluate` routine.
+        if update_dc_now and not self.is_heater_pwm_locked():
+            assert self.latest_temperature is not None
+            output = self.pid.update(
+                self.latest_temperature, dt=1
+            )  # 1 represents an arbitrary unit of time. The PID values will scale such that 1 makes sense.
+
+            if self.temperature_control_parent.publish_temperature_timer.is_paused:
+                self.update_heater_with_delta(output)
+            else:
+                # if another cycle is occurring very soon, don't bother updating the DC too much, as we don't want to "double dip" and change the dc twice quickly.
+                time_to_next_run = self.temperature_control_parent.publish_temperature_timer.time_to_next_run
+                duration_of_cycle = 90.0  # approx...
+                f = time_to_next_run / duration_of_cycle
+                self.update_heater_with_delta((1 - f) * output)
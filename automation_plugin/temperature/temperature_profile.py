@@ -0,0 +1,213 @@
+# -*- coding: utf-8 -*-
+"""
+Temperature automation that follows an arbitrary profile of hold / ramp / step / random segments, loaded
+from a YAML file:
+
+    cycles: 2  # repeat the segments this many times, 0 to repeat forever. Default 1.
+    segments:
+      - hold: {temperature: 30, minutes: 120}
+      - ramp: {to: 36, minutes: 360}            # `from` defaults to where the previous segment ended
+      - step: {temperature: 37, minutes: 60}
+      - hold: {minutes: 30}                     # `temperature` defaults to where the previous segment ended
+      - random: {min: 30, max: 37, dwell: 30, minutes: 600, seed: 1}
+
+The profile is compiled once into sorted breakpoints, and the setpoint at any time is found by binary
+search, so the per-tick cost doesn't grow with the number of segments and the setpoint never drifts.
+
+Check a profile before a run with
+$ python3 -m automation_plugin.temperature.temperature_profile my_profile.yaml
+"""
+from __future__ import annotations
+
+import time
+from bisect import bisect_right
+from random import Random
+from typing import Any, Optional
+
+from pioreactor.automations.events import UpdatedHeaterDC
+from pioreactor.automations.temperature.base import TemperatureAutomationJobContrib
+from pioreactor.config import config
+from pioreactor.utils import clamp
+from pioreactor.utils.streaming_calculations import PID
+
+MAX_TARGET_TEMP = 50
+SEGMENT_KINDS = ("hold", "ramp", "step", "random")
+
+
+class ProfileError(ValueError):
+    pass
+
+
+class TemperatureSchedule:
+    """
+    Piecewise-linear setpoint schedule. Breakpoint i starts at starts[i] seconds with temperature values[i],
+    and changes by slopes[i] °C/s until the next breakpoint.
+    """
+
+    def __init__(self, starts: list[float], values: list[float], slopes: list[float], period: float, cycles: int) -> None:
+        assert len(starts) == len(values) == len(slopes) > 0
+        self.starts = starts
+        self.values = values
+        self.slopes = slopes
+        self.period = period
+        self.cycles = cycles  # 0 means forever
+        self.final_temperature = values[-1] + slopes[-1] * (period - starts[-1])
+
+    @property
+    def total_seconds(self) -> float:
+        return float("inf") if self.cycles == 0 else self.period * self.cycles
+
+    def setpoint_at(self, seconds: float) -> float:
+        if seconds >= self.total_seconds:
+            return self.final_temperature
+        t = max(seconds, 0.0) % self.period
+        i = bisect_right(self.starts, t) - 1
+        return self.values[i] + self.slopes[i] * (t - self.starts[i])
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    @classmethod
+    def from_segments(cls, segments: list[dict[str, Any]], cycles: int = 1, initial_temperature: Optional[float] = None) -> TemperatureSchedule:
+        """Validate and compile a list of {kind: {...}} segments. Raises ProfileError naming the bad segment."""
+        if not segments:
+            raise ProfileError("A profile needs at least one segment.")
+        if not isinstance(cycles, int) or cycles < 0:
+            raise ProfileError("cycles must be a non-negative integer.")
+
+        starts: list[float] = []
+        values: list[float] = []
+        slopes: list[float] = []
+
+        def add_breakpoint(start: float, value: float, slope: float = 0.0) -> None:
+            starts.append(start)
+            values.append(value)
+            slopes.append(slope)
+
+        t = 0.0
+        current = initial_temperature
+
+        for i, segment in enumerate(segments):
+            if not isinstance(segment, dict) or len(segment) != 1:
+                raise ProfileError(f"Segment {i}: expected a single mapping like {{hold: {{...}}}}, got {segment!r}.")
+            ((kind, options),) = segment.items()
+            if kind not in SEGMENT_KINDS:
+                raise ProfileError(f"Segment {i}: unknown kind {kind!r}, expected one of {SEGMENT_KINDS}.")
+            options = options or {}
+
+            def number(key: str, default: Optional[float] = None) -> float:
+                value = options.get(key, default)
+                if value is None:
+                    raise ProfileError(f"Segment {i} ({kind}): `{key}` is required.")
+                try:
+                    return float(value)
+                except (TypeError, ValueError):
+                    raise ProfileError(f"Segment {i} ({kind}): `{key}` must be a number, got {value!r}.")
+
+            def temperature(key: str, default: Optional[float] = None) -> float:
+                value = number(key, default)
+                if not (0 <= value <= MAX_TARGET_TEMP):
+                    raise ProfileError(f"Segment {i} ({kind}): `{key}`={value} is outside 0-{MAX_TARGET_TEMP}℃.")
+                return value
+
+            seconds = number("minutes") * 60
+            if seconds <= 0:
+                raise ProfileError(f"Segment {i} ({kind}): `minutes` must be positive.")
+
+            if kind in ("hold", "step"):
+                current = temperature("temperature", current if kind == "hold" else None)
+                add_breakpoint(t, current)
+            elif kind == "ramp":
+                start = temperature("from", current)
+                current = temperature("to")
+                add_breakpoint(t, start, (current - start) / seconds)
+            elif kind == "random":
+                low, high = temperature("min"), temperature("max")
+                if low > high:
+                    raise ProfileError(f"Segment {i} (random): `min` is above `max`.")
+                dwell = number("dwell") * 60
+                if dwell <= 0:
+                    raise ProfileError(f"Segment {i} (random): `dwell` must be positive.")
+                rng = Random(options.get("seed"))
+                offset = 0.0
+                while offset < seconds:
+                    current = round(rng.uniform(low, high), 2)
+                    add_breakpoint(t + offset, current)
+                    offset += dwell
+
+            t += seconds
+
+        return cls(starts, values, slopes, period=t, cycles=cycles)
+
+    @classmethod
+    def load(cls, path: str, initial_temperature: Optional[float] = None) -> TemperatureSchedule:
+        import yaml
+
+        with open(path) as f:
+            profile = yaml.safe_load(f)
+        if not isinstance(profile, dict) or "segments" not in profile:
+            raise ProfileError(f"{path}: expected a mapping with a `segments` list.")
+        return cls.from_segments(profile["segments"], cycles=profile.get("cycles", 1), initial_temperature=initial_temperature)
+
+
+class TemperatureProfile(TemperatureAutomationJobContrib):
+    """
+    Uses a PID controller to track the setpoint of a temperature profile file.
+    """
+
+    automation_name = "temperature_profile"
+    published_settings = {
+        "profile": {"datatype": "string", "settable": False},
+        "target_temperature": {"datatype": "float", "unit": "°C", "settable": False},
+    }
+
+    def __init__(self, profile: str, **kwargs) -> None:
+        super().__init__(**kwargs)
+        # compile (and so validate) before anything is heated.
+        self.schedule = TemperatureSchedule.load(profile)
+        self.profile = profile
+        self.started_at = time.monotonic()
+        self.target_temperature = self.schedule.setpoint_at(0)
+
+        self.pid = PID(
+            Kp=config.getfloat("temperature_automation.thermostat", "Kp"),
+            Ki=config.getfloat("temperature_automation.thermostat", "Ki"),
+            Kd=config.getfloat("temperature_automation.thermostat", "Kd"),
+            setpoint=self.target_temperature,
+            unit=self.unit,
+            experiment=self.experiment,
+            job_name=self.job_name,
+            target_name="temperature",
+            output_limits=(-25, 25),  # avoid whiplashing
+        )
+
+    def execute(self) -> Optional[UpdatedHeaterDC]:
+        if not hasattr(self, "pid"):
+            # execute can run before __init__ has finished, on the first temperature reading.
+            return None
+
+        assert self.latest_temperature is not None
+
+        setpoint = clamp(0, self.schedule.setpoint_at(time.monotonic() - self.started_at), MAX_TARGET_TEMP)
+        if setpoint != self.target_temperature:
+            self.target_temperature = setpoint
+            self.pid.set_setpoint(setpoint)
+
+        output = self.pid.update(self.latest_temperature, dt=1)
+        self.update_heater_with_delta(output)
+
+        return UpdatedHeaterDC(
+            f"delta_dc={output}",
+            data={
+                "current_dc": self.heater_duty_cycle,
+                "delta_dc": output,
+                "target_temperature": self.target_temperature,
+            },
+        )
+
+
+if __name__ == "__main__":
+    import sys
+
+    schedule = TemperatureSchedule.load(sys.argv[1])
+    print(f"OK: {len(schedule)} breakpoints, {schedule.period / 3600:.2f}h per cycle, {schedule.total_seconds / 3600:.2f}h in total.")
@@ -0,0 +1,12 @@
+# -*- coding: utf-8 -*-
+"""Helpers shared by the automations."""
+from __future__ import annotations
+
+from typing import Any
+
+
+def as_bool(value: Any) -> bool:
+    # settings can arrive as strings from the CLI or MQTT.
+    if isinstance(value, str):
+        return value.strip().lower() in ("1", "true", "yes", "on")
+    return bool(value)
@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+"""
+Check an automation's settings, or the automations an experiment profile starts and updates, before anything
+is started on the Pioreactors:
+
+$ python3 -m automation_plugin.validation my_profile.yaml
+$ python3 -m automation_plugin.validation --automation morbidostat target_normalized_od=2 volume=0.5 dosing_mode=adaptive
+
+Settings are checked against settings_schema, precompiled from the automations by tools/generate_ui.py, so
+nothing is imported or parsed here: unknown (ex: misspelled) settings, missing required ones, values that
+can't be read as the setting's datatype, and values outside a mode's choices. Checks across settings, ex:
+PIDTurbidostat's target_od or target_normalized_od, are still left to the automations. Automations that aren't
+from this repo, ex: thermostat, are skipped. Profiles need pyyaml.
+
+On the Pioreactors, the registry also checks the settings each automation is started with, with
+check_on_start, so a misconfigured job fails with every problem at once, before its __init__ touches the
+pumps, the heater or the LEDs.
+"""
+from __future__ import annotations
+
+import argparse
+import difflib
+import functools
+import inspect
+import sys
+from typing import Any, Iterator
+
+from .settings_schema import SCHEMAS
+
+BOOLEANS = ("1", "true", "yes", "on", "0", "false", "no", "off")  # what utils.as_bool reads
+
+# profile jobs that start an automation, and those that update the running one, by kind of automation.
+CONTROLLER_JOBS = {"dosing_control": "dosing", "temperature_control": "temperature", "led_control": "led"}
+AUTOMATION_JOBS = {"dosing_automation": "dosing", "temperature_automation": "temperature", "led_automation": "led"}
+
+# passed to every automation by its controller, alongside the settings.
+JOB_ARGUMENTS = ("unit", "experiment", "temperature_control_parent")
+
+
+class SettingsError(ValueError):
+    pass
+
+
+def _readable_as(datatype: str, value: Any) -> bool:
+    # settings arrive as strings from the CLI and MQTT, and as YAML scalars from profiles.
+    if datatype == "float":
+        if isinstance(value, bool):
+            return False
+        try:
+            float(value)
+        except (TypeError, ValueError):
+            return False
+        return True
+    elif datatype == "integer":
+        if isinstance(value, bool):
+            return False
+        if isinstance(value, float):
+            return value.is_integer()
+        try:
+            int(value)
+        except (TypeError, ValueError):
+            return False
+        return True
+    elif datatype == "boolean":
+        return isinstance(value, (bool, int)) or (isinstance(value, str) and value.strip().lower() in BOOLEANS)
+    elif datatype == "string":
+        return isinstance(value, (str, int, float))
+    return True  # json
+
+
+def problems(automation_name: str, settings: dict[str, Any], updating: bool = False) -> list[str]:
+    """
+    What's wrong with starting automation_name with `settings`, or with updating it with them. Empty if nothing
+    is, or if the automation isn't from this repo.
+    """
+    schema = SCHEMAS.get(automation_name)
+    if schema is None:
+        return []
+
+    found = []
+    known = schema["settings"]
+    for key, value in settings.items():
+        spec = known.get(key)
+        if spec is None:
+            close = difflib.get_close_matches(key, known, n=1)
+            found.append(f"{automation_name} has no setting {key}." + (f" Did you mean {close[0]}?" if close else ""))
+        elif updating and not spec["settable"]:
+            found.append(f"{automation_name}'s {key} can't be changed while it runs.")
+        elif value is None or (isinstance(value, str) and value.strip().lower() in ("none", "null")):
+            if not spec["nullable"]:
+                found.append(f"{automation_name}'s {key} can't be null.")
+        elif isinstance(value, str) and "${{" in value:
+            continue  # an expression, evaluated when the profile runs
+        elif not _readable_as(spec["datatype"], value):
+            found.append(f"{automation_name}'s {key} should be a {spec['datatype']}, got {value!r}.")
+        elif spec["choices"] is not None and str(value) not in spec["choices"]:
+            found.append(f"{automation_name}'s {key} should be one of {', '.join(spec['choices'])}, got {value!r}.")
+
+    if not updating:
+        missing = [key for key, spec in known.items() if spec["required"] and key not in settings]
+        if missing:
+            found.append(f"{automation_name} needs {', '.join(missing)}.")
+    return found
+
+
+def validate(automation_name: str, settings: dict[str, Any]) -> None:
+    """Raise SettingsError, with everything that's wrong, if automation_name can't be started with `settings`."""
+    found = problems(automation_name, settings)
+    if found:
+        raise SettingsError(" ".join(found))
+
+
+def check_on_start(automation_class: type) -> None:
+    """Make automation_class validate the settings it's started with, before its own __init__ runs."""
+    init = automation_class.__init__
+    positional = list(inspect.signature(init).parameters)[1:]
+
+    @functools.wraps(init)
+    def checked_init(job, *args, **kwargs):
+        if type(job) is automation_class:  # not when a subclass calls super().__init__ with what's left
+            settings = dict(zip(positional, args))
+            settings.update((key, value) for key, value in kwargs.items() if key not in JOB_ARGUMENTS)
+            validate(automation_class.automation_name, settings)  # type: ignore
+        init(job, *args, **kwargs)
+
+    automation_class.__init__ = checked_init  # type: ignore
+
+
+def _actions(actions: Any) -> Iterator[dict[str, Any]]:
+    # flattened, including the actions of `repeat`s.
+    for action in actions or []:
+        if isinstance(action, dict):
+            yield action
+            yield from _actions(action.get("actions"))
+
+
+def _jobs_problems(jobs: dict[str, Any], where: str, started: dict[str, str]) -> tuple[list[str], dict[str, str]]:
+    # also returns the automation started for each kind, for updates elsewhere in the profile.
+    found = []
+    started = dict(started)
+    for job_name, kind in CONTROLLER_JOBS.items():
+        for action in _actions((jobs.get(job_name) or {}).get("actions")):
+            options = dict(action.get("options") or {})
+            if action.get("type") != "start" or "automation_name" not in options:
+                continue
+            automation_name = options.pop("automation_name")
+            started[kind] = automation_name
+            schema = SCHEMAS.get(automation_name)
+            if schema is not None and schema["kind"] != kind:
+                found.append(f"{where}: {job_name} can't start {automation_name}, a {schema['kind']} automation.")
+            else:
+                found += [f"{where}: {job_name}: {problem}" for problem in problems(automation_name, options)]
+
+    for job_name, kind in AUTOMATION_JOBS.items():
+        automation_name = started.get(kind)
+        for action in _actions((jobs.get(job_name) or {}).get("actions")):
+            if automation_name is not None and action.get("type") == "update":
+                found += [f"{where}: {job_name}: {problem}" for problem in problems(automation_name, action.get("options") or {}, updating=True)]
+    return found, started
+
+
+def profile_problems(profile: dict[str, Any]) -> list[str]:
+    """What's wrong with the automation settings in an experiment profile, read from YAML."""
+    found, started_in_common = _jobs_problems((profile.get("common") or {}).get("jobs") or {}, "common", {})
+    # automations started in common can be updated per unit.
+    for unit, unit_profile in (profile.get("pioreactors") or {}).items():
+        found += _jobs_problems((unit_profile or {}).get("jobs") or {}, unit, started_in_common)[0]
+    return found
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0], formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("arguments", nargs="*", metavar="profile | key=value", help="experiment profiles, or with --automation, settings")
+    parser.add_argument("--automation", help="check the settings given as key=value for this automation")
+    args = parser.parse_args()
+
+    found = []
+    if args.automation:
+        pairs = [pair.partition("=") for pair in args.arguments]
+        found += problems(args.automation, {key.strip(): value.strip() for key, _, value in pairs})
+        if args.automation not in SCHEMAS:
+            found.append(f"No automation {args.automation} in this repo.")
+    else:
+        import yaml
+
+        for path in args.arguments:
+            with open(path) as f:
+                found += [f"{path}: {problem}" for problem in profile_problems(yaml.safe_load(f) or {})]
+
+    for problem in found:
+        print(problem, file=sys.stderr)
+    sys.exit(1 if found else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -13,7 +13,8 @@ setup(
     packages=find_packages(),
     include_package_data=True,
     install_requires=[], # PROVIDE OTHER PYTHON REQUIREMENTS, ex: "pioreactor>=23.6.0", "numpy>=1.0"
+    extras_require={"tools": ["numpy>=1.20", "pyyaml"]},  # offline tooling in tools/
     entry_points={
-        "pioreactor.plugins": "<PLUGIN_NAME> = Automation_plugin"
+        "pioreactor.plugins": "automation_plugin = automation_plugin.registry"
     },
 )
\ No newline at end of file
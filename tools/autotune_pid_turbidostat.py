@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+"""
+Autotune Kp, Ki and Kd for PIDTurbidostat on the vectorized culture model in dosing_simulator.
+
+Candidates (a log-spaced grid, then optional rounds of random refinement around the best ones) are
+split into chunks and simulated across a process pool. Each candidate is scored on settling time,
+overshoot, total media used and pump actuations, and the winner is printed as a config section:
+
+$ python3 autotune_pid_turbidostat.py --target-normalized-od 3.0 --hours 48 --duration 1
+
+Requires numpy.
+"""
+from __future__ import annotations
+
+import argparse
+import os
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+
+import numpy as np
+
+from dosing_simulator import CultureModel
+from dosing_simulator import simulate
+
+METRICS = ("settling_hours", "overshoot", "media_ml", "pump_actuations")
+
+
+@dataclass
+class TuningProblem:
+    target_normalized_od: float
+    hours: float
+    duration: float
+    culture: CultureModel
+    band: float = 0.05  # settled once OD stays within this relative band around the target
+    seed: int = 0
+
+
+def evaluate(problem: TuningProblem, gains: np.ndarray) -> dict[str, np.ndarray]:
+    """Simulate one chunk of candidates (rows of Kp, Ki, Kd) and compute the raw metrics of each."""
+    result = simulate(
+        "pid_turbidostat",
+        hours=problem.hours,
+        duration=problem.duration,
+        culture=problem.culture,
+        record_every=1,
+        seed=problem.seed,
+        target_normalized_od=problem.target_normalized_od,
+        Kp=gains[:, 0],
+        Ki=gains[:, 1],
+        Kd=gains[:, 2],
+    )
+    target_od = problem.target_normalized_od * problem.culture.initial_od
+    relative_error = (result.od - target_od) / target_od
+
+    # settling: the first recorded time after which the OD never leaves the band again.
+    outside = np.abs(relative_error) > problem.band
+    n_records = outside.shape[0]
+    last_outside = n_records - 1 - np.argmax(outside[::-1], axis=0)
+    never_outside = ~outside.any(axis=0)
+    settled_at = np.where(never_outside, 0, last_outside + 1)
+    settling_hours = np.where(settled_at >= n_records, np.inf, result.hours[np.minimum(settled_at, n_records - 1)])
+
+    return {
+        "settling_hours": settling_hours,
+        "overshoot": np.clip(relative_error.max(axis=0), 0, None),
+        "media_ml": result.media_ml,
+        "pump_actuations": result.pump_actuations.astype(float),
+    }
+
+
+def _evaluate_chunk(args: tuple[TuningProblem, np.ndarray]) -> dict[str, np.ndarray]:
+    return evaluate(*args)
+
+
+def evaluate_all(problem: TuningProblem, gains: np.ndarray, workers: int) -> dict[str, np.ndarray]:
+    chunks = np.array_split(gains, max(1, min(len(gains), workers * 4)))
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        results = list(executor.map(_evaluate_chunk, [(problem, chunk) for chunk in chunks if len(chunk)]))
+    return {metric: np.concatenate([r[metric] for r in results]) for metric in METRICS}
+
+
+def score(metrics: dict[str, np.ndarray], weights: dict[str, float], hours: float) -> np.ndarray:
+    """Weighted sum of the metrics, each normalised by its median over candidates. Lower is better."""
+    total = np.zeros_like(metrics["media_ml"])
+    for metric, weight in weights.items():
+        values = np.where(np.isinf(metrics[metric]), 2 * hours, metrics[metric]) if metric == "settling_hours" else metrics[metric]
+        scale = np.median(values) or 1.0
+        total += weight * values / scale
+    return total
+
+
+def candidate_grid(kp_range: tuple[float, float], ki_range: tuple[float, float], kd_range: tuple[float, float], n: int) -> np.ndarray:
+    def axis(lo: float, hi: float) -> np.ndarray:
+        # 0 is always a candidate, so pure P / PI / PD controllers are in the sweep.
+        return np.concatenate([[0.0], np.geomspace(lo, hi, n)]) if lo > 0 else np.linspace(lo, hi, n)
+
+    kp, ki, kd = np.meshgrid(np.geomspace(*kp_range, n), axis(*ki_range), axis(*kd_range), indexing="ij")
+    return np.column_stack([kp.ravel(), ki.ravel(), kd.ravel()])
+
+
+def refine(best: np.ndarray, n: int, spread: float, rng: np.random.Generator) -> np.ndarray:
+    # log-normal perturbations around the current best candidates.
+    parents = best[rng.integers(len(best), size=n)]
+    return np.abs(parents * np.exp(spread * rng.standard_normal(parents.shape)))
+
+
+def config_section(gains: np.ndarray) -> str:
+    Kp, Ki, Kd = gains
+    return f"[dosing_automation.pid_turbidostat]\nKp={Kp:.4g}\nKi={Ki:.4g}\nKd={Kd:.4g}\n"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0], formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--target-normalized-od", type=float, required=True)
+    parser.add_argument("--hours", type=float, default=48.0)
+    parser.add_argument("--duration", type=float, default=1.0, help="minutes between execute calls")
+    parser.add_argument("--growth-rate", type=float, default=0.5, help="1/h")
+    parser.add_argument("--initial-od", type=float, default=0.05)
+    parser.add_argument("--carrying-capacity", type=float, default=5.0)
+    parser.add_argument("--od-noise", type=float, default=0.02, help="relative std. dev. of OD readings")
+    parser.add_argument("--kp", type=float, nargs=2, default=(0.1, 20.0))
+    parser.add_argument("--ki", type=float, nargs=2, default=(0.01, 5.0))
+    parser.add_argument("--kd", type=float, nargs=2, default=(0.01, 5.0))
+    parser.add_argument("--grid", type=int, default=12, help="points per gain axis")
+    parser.add_argument("--refine", type=int, default=3, help="rounds of random refinement around the best candidates")
+    parser.add_argument("--weights", type=float, nargs=4, default=(1.0, 1.0, 1.0, 0.5), metavar=METRICS)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    problem = TuningProblem(
+        target_normalized_od=args.target_normalized_od,
+        hours=args.hours,
+        duration=args.duration,
+        culture=CultureModel(
+            growth_rate=args.growth_rate,
+            initial_od=args.initial_od,
+            carrying_capacity=args.carrying_capacity,
+            od_noise=args.od_noise,
+        ),
+        seed=args.seed,
+    )
+    weights = dict(zip(METRICS, args.weights))
+    rng = np.random.default_rng(args.seed)
+
+    gains = candidate_grid(tuple(args.kp), tuple(args.ki), tuple(args.kd), args.grid)
+    metrics = evaluate_all(problem, gains, args.workers)
+    for round_ in range(args.refine):
+        scores = score(metrics, weights, args.hours)
+        best = gains[np.argsort(scores)[:10]]
+        new_gains = refine(best, n=len(best) * 50, spread=0.5 / (round_ + 1), rng=rng)
+        new_metrics = evaluate_all(problem, new_gains, args.workers)
+        gains = np.vstack([gains, new_gains])
+        metrics = {metric: np.concatenate([metrics[metric], new_metrics[metric]]) for metric in METRICS}
+
+    scores = score(metrics, weights, args.hours)
+    winner = int(np.argmin(scores))
+    print(f"# evaluated {len(gains)} candidates")
+    print("# " + ", ".join(f"{metric}={metrics[metric][winner]:.3g}" for metric in METRICS))
+    print(config_section(gains[winner]))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,497 @@
+# -*- coding: utf-8 -*-
+"""
+Offline, vectorized bioreactor simulator for the dosing automations in automation_plugin/dosing/.
+
+Every vial is one element of a NumPy array, so thousands of virtual vials (ex: one per parameter
+combination) advance together. The decision logic of each automation is mirrored by a subclass of
+VectorDosingJob, a stand-in for DosingAutomationJob whose attributes (latest_od, alt_media_fraction, ...)
+are arrays and whose `if` branches become masks.
+
+Example
+---------
+> from dosing_simulator import simulate, grid
+> settings = grid(target_normalized_od=[2.0, 3.0, 4.0], Kp=np.linspace(0.5, 5, 50), Ki=0.0, Kd=0.0)
+> result = simulate("pid_turbidostat", hours=24 * 14, duration=1.0, **settings)
+> result.media_ml  # total media used, per vial
+
+Each mirror covers the automation's default modes, listed in its UNMIRRORED: any other value of those
+settings raises NotImplementedError instead of simulating something else. Mirrored:
+
+    naive_turbidostat                            latest OD (no od_window)
+    adapted_turbidostat                          fixed_volume dosing_mode, latest OD (no od_window)
+    pid_turbidostat                              latest OD (no od_window), Kp, Ki and Kd as settings
+    morbidostat                                  fixed_volume dosing_mode, latest OD (no od_window)
+    switching_dosing                             planned and iterative switch_modes
+    chemostat_with_constant_alt_media_fraction   sequential and co_dosing exchange_modes
+
+Doses land within their execute here, so async_dosing, where the automations have it, makes no difference
+and is accepted. simulator_parity.py checks each mirrored mode against the automation itself, on the
+emulator: run it after changing an automation or its mirror.
+
+Requires numpy.
+"""
+from __future__ import annotations
+
+from abc import ABC
+from abc import abstractmethod
+from dataclasses import dataclass
+from dataclasses import field
+from typing import Any, Optional
+
+import numpy as np
+
+
+@dataclass
+class CultureModel:
+    """
+    Logistic growth, optionally inhibited by the drug carried in the alt-media:
+
+        mu = growth_rate * 1 / (1 + (alt_media_fraction / alt_media_ic50) ** hill)
+
+    Any field can be an array, one value per vial.
+    """
+
+    growth_rate: float | np.ndarray = 0.5  # 1/h
+    carrying_capacity: float | np.ndarray = 5.0  # OD
+    initial_od: float | np.ndarray = 0.05
+    alt_media_ic50: float | np.ndarray = np.inf  # as an alt_media_fraction. inf means no inhibition.
+    hill: float | np.ndarray = 2.0
+    od_noise: float = 0.0  # relative std. dev. of each OD reading
+
+    def specific_growth_rate(self, alt_media_fraction: np.ndarray) -> np.ndarray:
+        return self.growth_rate / (1 + (alt_media_fraction / self.alt_media_ic50) ** self.hill)
+
+    def grow(self, od: np.ndarray, alt_media_fraction: np.ndarray, dt_hours: float) -> np.ndarray:
+        # exact solution of the logistic ODE over dt, for a constant rate.
+        K = self.carrying_capacity
+        decay = np.exp(-self.specific_growth_rate(alt_media_fraction) * dt_hours)
+        return K / (1 + (K / od - 1) * decay)
+
+
+def subdose_count(ml: np.ndarray, max_ml: float) -> np.ndarray:
+    """mixing.subdose_count over arrays: execute_io_action halves any exchange above max_ml until every piece fits."""
+    return np.where(ml > max_ml, 2.0 ** np.ceil(np.log2(np.maximum(ml, 1e-12) / max_ml)), 1.0)
+
+
+def co_dosing_split(alt_media_fraction, target_fraction, vial_volume: float, ml, max_ml: float) -> tuple[np.ndarray, np.ndarray]:
+    """mixing.co_dosing_split over arrays: (media_ml, alt_media_ml) of one exchange landing on target_fraction."""
+
+    def all_alt_media_fraction(total_ml: np.ndarray) -> np.ndarray:
+        n = subdose_count(total_ml, max_ml)
+        return 1 - (1 - alt_media_fraction) * (vial_volume / (vial_volume + total_ml / n)) ** n
+
+    ml = np.array(ml, dtype=float)
+    short = all_alt_media_fraction(ml) < target_fraction
+    if short.any():
+        # enlarge the exchange to the smallest one that reaches the target, by doubling then bisecting.
+        low, high = ml.copy(), np.maximum(ml, max_ml)
+        while (growing := short & (all_alt_media_fraction(high) < target_fraction)).any():
+            low, high = np.where(growing, high, low), np.where(growing, 2 * high, high)
+        for _ in range(60):
+            mid = (low + high) / 2
+            reached = all_alt_media_fraction(mid) >= target_fraction
+            low, high = np.where(reached, low, mid), np.where(reached, mid, high)
+        ml = np.where(short, high, ml)
+
+    n = subdose_count(ml, max_ml)
+    decay = (vial_volume / (vial_volume + ml / n)) ** n
+    alt_media_ml = np.clip(ml * (target_fraction - alt_media_fraction * decay) / (1 - decay), 0.0, ml)
+    return ml - alt_media_ml, alt_media_ml
+
+
+def switch_volume(remaining, vial_volume: float, max_ml: float) -> tuple[np.ndarray, np.ndarray]:
+    """
+    mixing.switch_volume over arrays, from the factor `remaining` to dilute by: the volume of the single
+    execute_io_action, and the number of subdoses it's split into.
+    """
+    remaining = np.asarray(remaining, dtype=float)
+    ml, subdoses = np.zeros_like(remaining), np.ones_like(remaining)
+    solving = remaining < 1
+    n = 1.0
+    while solving.any():
+        candidate = n * vial_volume * (remaining ** (-1 / n) - 1)
+        count = subdose_count(candidate, max_ml)
+        exact, short = solving & (count == n), solving & (count < n)
+        # short: n / 2 subdoses fall short, and n overshoot, so the smallest volume split into n.
+        ml = np.where(exact, candidate, np.where(short, np.nextafter(n / 2 * max_ml, np.inf), ml))
+        subdoses = np.where(exact | short, n, subdoses)
+        solving &= ~(exact | short)
+        n *= 2
+    return ml, subdoses
+
+
+class VectorDosingJob(ABC):
+    """
+    Stand-in for DosingAutomationJob where each attribute is an array over vials. Subclasses mirror the
+    `execute` of one automation in automation_plugin/dosing/, reading the same attributes and calling
+    execute_io_action.
+    """
+
+    automation_name = "dosing_automation_base"
+    MAX_SUBDOSE = 0.75
+    # settings of the automation mirrored only at this value, ex: {"od_window": 0}.
+    UNMIRRORED: dict[str, Any] = {}
+    # settings of the automation that don't change what the mirrored modes do.
+    IGNORED: tuple[str, ...] = ()
+
+    def __init__(
+        self,
+        n_vials: int,
+        duration: float,
+        vial_volume: float = 14.0,
+        initial_alt_media_fraction: float = 0.0,
+        culture: Optional[CultureModel] = None,
+        seed: Optional[int] = None,
+        **settings,
+    ) -> None:
+        for name, value in settings.items():
+            if name in self.IGNORED:
+                continue
+            if name not in self.UNMIRRORED:
+                raise TypeError(f"{self.automation_name} has no setting {name}.")
+            if not np.all(np.asarray(value) == self.UNMIRRORED[name]):
+                raise NotImplementedError(f"The {self.automation_name} mirror only simulates {name}={self.UNMIRRORED[name]!r}.")
+
+        self.n_vials = n_vials
+        self.duration = float(duration)
+        self.vial_volume = float(vial_volume)
+        self.culture = culture or CultureModel()
+        self.rng = np.random.default_rng(seed)
+
+        self.od = np.broadcast_to(np.asarray(self.culture.initial_od, dtype=float), (n_vials,)).copy()
+        self.alt_media_fraction = np.full(n_vials, float(initial_alt_media_fraction))
+        self._initial_od = self.od.copy()
+        self._latest_od = self.od.copy()
+        self._has_reading = False
+        self.previous_normalized_od: Optional[np.ndarray] = None
+
+        self.media_ml = np.zeros(n_vials)
+        self.alt_media_ml = np.zeros(n_vials)
+        self.waste_ml = np.zeros(n_vials)
+        self.pump_actuations = np.zeros(n_vials, dtype=np.int64)
+
+    @staticmethod
+    def setting(value, n_vials: int, dtype=float) -> np.ndarray:
+        return np.broadcast_to(np.asarray(value, dtype=dtype), (n_vials,)).copy()
+
+    @property
+    def latest_od(self) -> dict[str, np.ndarray]:
+        return {"2": self._latest_od}
+
+    @property
+    def latest_normalized_od(self) -> np.ndarray:
+        return self._latest_od / self._initial_od
+
+    def observe(self) -> None:
+        # take an OD reading, like ODReader publishing to the automation.
+        if self._has_reading:
+            self.previous_normalized_od = self.latest_normalized_od
+        self._has_reading = True
+        noise = self.culture.od_noise
+        self._latest_od = self.od * (1 + noise * self.rng.standard_normal(self.n_vials)) if noise else self.od.copy()
+
+    def grow(self, dt_hours: float) -> None:
+        self.od = self.culture.grow(self.od, self.alt_media_fraction, dt_hours)
+
+    def execute_io_action(self, waste_ml=0.0, media_ml=0.0, alt_media_ml=0.0) -> dict[str, np.ndarray]:
+        """
+        Vectorized execute_io_action: exchanges larger than MAX_SUBDOSE are split in 2**k equal subdoses,
+        each followed by waste, exactly as DosingAutomationJob does.
+        """
+        media_ml = self.setting(media_ml, self.n_vials)
+        alt_media_ml = self.setting(alt_media_ml, self.n_vials)
+        waste_ml = self.setting(waste_ml, self.n_vials)
+        total = media_ml + alt_media_ml
+        if np.any(waste_ml < total):
+            raise ValueError("Not removing enough waste: waste_ml should be greater than sum of dosed ml")
+
+        dosing = total > 0
+        halvings = np.where(total > self.MAX_SUBDOSE, np.ceil(np.log2(np.maximum(total, 1e-12) / self.MAX_SUBDOSE)), 0)
+        parts = np.where(dosing, 2.0**halvings, 0.0)
+        subdose = np.divide(total, parts, out=np.zeros(self.n_vials), where=dosing)
+
+        # after p subdoses of s mL, of which a fraction a/s is alt-media, f -> f* + (f - f*) r**p with r = V/(V+s).
+        dilution = (self.vial_volume / (self.vial_volume + subdose)) ** parts
+        dosed_fraction = np.divide(alt_media_ml, total, out=self.alt_media_fraction.copy(), where=dosing)
+        self.alt_media_fraction = dosed_fraction + (self.alt_media_fraction - dosed_fraction) * dilution
+        self.od = self.od * dilution
+
+        self.media_ml += media_ml
+        self.alt_media_ml += alt_media_ml
+        self.waste_ml += waste_ml
+        self.pump_actuations += (parts * ((media_ml > 0).astype(int) + (alt_media_ml > 0) + (waste_ml > 0))).astype(np.int64)
+        return {"media_ml": media_ml, "alt_media_ml": alt_media_ml, "waste_ml": waste_ml}
+
+    @abstractmethod
+    def execute(self) -> None:
+        """The automation's execute, over all vials."""
+
+
+class VectorPID:
+    """pioreactor.utils.streaming_calculations.PID, over arrays. Only vials in `mask` are updated."""
+
+    def __init__(self, Kp, Ki, Kd, setpoint, output_limits: tuple[float, float], n_vials: int) -> None:
+        self.Kp = VectorDosingJob.setting(Kp, n_vials)
+        self.Ki = VectorDosingJob.setting(Ki, n_vials)
+        self.Kd = VectorDosingJob.setting(Kd, n_vials)
+        self.setpoint = VectorDosingJob.setting(setpoint, n_vials)
+        self.output_limits = output_limits
+        self.error_sum = np.zeros(n_vials)
+        self.last_input = np.full(n_vials, np.nan)
+
+    def update(self, input_: np.ndarray, dt: float, mask: np.ndarray) -> np.ndarray:
+        lower, upper = self.output_limits
+        error = self.setpoint - input_
+        self.error_sum = np.where(mask, np.clip(self.error_sum + error * dt, lower, upper), self.error_sum)
+        derivative = np.where(np.isnan(self.last_input), 0.0, -(input_ - self.last_input) / dt)
+        output = np.clip(self.Kp * error + self.Ki * self.error_sum + self.Kd * derivative, lower, upper)
+        self.last_input = np.where(mask, input_, self.last_input)
+        return np.where(mask, output, 0.0)
+
+
+class NaiveTurbidostat(VectorDosingJob):
+    automation_name = "naive_turbidostat"
+    UNMIRRORED = {"od_window": 0}
+    VOLUME = 1.0  # NaiveTurbidostat has no volume setting, it exchanges 1.0mL
+
+    def __init__(self, target_od, **kwargs) -> None:
+        super().__init__(**kwargs)
+        self.target_od = self.setting(target_od, self.n_vials)
+
+    def execute(self) -> None:
+        ml = np.where(self.latest_od["2"] > self.target_od, self.VOLUME, 0.0)
+        self.execute_io_action(media_ml=ml, waste_ml=ml)
+
+
+class AdaptedTurbidostat(VectorDosingJob):
+    automation_name = "adapted_turbidostat"
+    UNMIRRORED = {"dosing_mode": "fixed_volume", "od_window": 0}
+    IGNORED = ("async_dosing",)
+
+    def __init__(self, volume, max_od=-1.0, min_od=-1.0, max_normalized_od=-1.0, min_normalized_od=-1.0, **kwargs) -> None:
+        super().__init__(**kwargs)
+        self.volume = self.setting(volume, self.n_vials)
+        max_normalized_od = self.setting(max_normalized_od, self.n_vials)
+        min_normalized_od = self.setting(min_normalized_od, self.n_vials)
+        self.use_normalized_od = (min_normalized_od > 0) & (max_normalized_od > 0)
+        self.max_value = np.where(self.use_normalized_od, max_normalized_od, self.setting(max_od, self.n_vials))
+        self.min_value = np.where(self.use_normalized_od, min_normalized_od, self.setting(min_od, self.n_vials))
+        self.is_pumping = np.zeros(self.n_vials, dtype=bool)
+
+    def execute(self) -> None:
+        value = np.where(self.use_normalized_od, self.latest_normalized_od, self.latest_od["2"])
+        # start pumping above max, keep pumping until below min.
+        self.is_pumping = (value >= self.max_value) | (self.is_pumping & (value >= self.min_value))
+        ml = np.where(self.is_pumping, self.volume, 0.0)
+        self.execute_io_action(media_ml=ml, waste_ml=ml)
+
+
+class PIDTurbidostat(VectorDosingJob):
+    automation_name = "pid_turbidostat"
+    UNMIRRORED = {"od_window": 0}
+    IGNORED = ("async_dosing",)
+
+    def __init__(self, Kp, Ki, Kd, target_normalized_od=None, target_od=None, **kwargs) -> None:
+        super().__init__(**kwargs)
+        if (target_normalized_od is None) == (target_od is None):
+            raise ValueError("Provide exactly one of target nOD or target OD.")
+        self.is_targeting_nOD = target_normalized_od is not None
+        self.target = self.setting(target_normalized_od if self.is_targeting_nOD else target_od, self.n_vials)
+        self.pid = VectorPID(-np.asarray(Kp), -np.asarray(Ki), -np.asarray(Kd), self.target, (0, 14), self.n_vials)
+
+    def execute(self) -> None:
+        value = self.latest_normalized_od if self.is_targeting_nOD else self.latest_od["2"]
+        above = value >= self.target
+        volume = self.pid.update(value, dt=self.duration / 60, mask=above)
+        self.execute_io_action(media_ml=volume, waste_ml=volume)
+
+
+class Morbidostat(VectorDosingJob):
+    automation_name = "morbidostat"
+    UNMIRRORED = {"dosing_mode": "fixed_volume", "od_window": 0}
+    # only used by the adaptive dosing_mode.
+    IGNORED = ("async_dosing", "alt_media_drug_concentration", "ic50", "hill", "inhibition_step")
+
+    def __init__(self, target_normalized_od, volume, **kwargs) -> None:
+        super().__init__(**kwargs)
+        self.target_normalized_od = self.setting(target_normalized_od, self.n_vials)
+        self.volume = self.setting(volume, self.n_vials)
+
+    def execute(self) -> None:
+        if self.previous_normalized_od is None:
+            return
+        add_drug = (self.latest_normalized_od >= self.target_normalized_od) & (self.latest_normalized_od >= self.previous_normalized_od)
+        self.execute_io_action(
+            alt_media_ml=np.where(add_drug, self.volume, 0.0),
+            media_ml=np.where(add_drug, 0.0, self.volume),
+            waste_ml=self.volume,
+        )
+
+
+class SwitchingDosing(VectorDosingJob):
+    automation_name = "switching_dosing"
+
+    def __init__(self, target_od, switch_mode: str = "planned", **kwargs) -> None:
+        super().__init__(**kwargs)
+        self.target_od = self.setting(target_od, self.n_vials)
+        self.switch_mode = switch_mode
+        self.on_alt_media = np.zeros(self.n_vials, dtype=bool)
+
+    def execute(self) -> None:
+        switching = self.latest_od["2"] >= self.target_od
+        if not switching.any():
+            return
+
+        # the quantity being diluted is (1 - fraction) when moving to alt-media, and fraction when moving to media.
+        to_alt = switching & ~self.on_alt_media
+        to_media = switching & self.on_alt_media
+        current = np.where(to_alt, 1 - self.alt_media_fraction, self.alt_media_fraction)
+        target = 0.05
+        ratio = np.where(switching, np.minimum(target / np.maximum(current, 1e-12), 1.0), 1.0)
+
+        r = self.vial_volume / (self.vial_volume + self.MAX_SUBDOSE)
+        if self.switch_mode == "planned":
+            # one execute_io_action, split into subdoses: lands on target.
+            ml, subdoses = switch_volume(ratio, self.vial_volume, self.MAX_SUBDOSE)
+            actuations = np.where(ml > 0, subdoses, 0.0)
+            dilution = (self.vial_volume / (self.vial_volume + ml / subdoses)) ** subdoses
+        else:
+            actuations = np.ceil(np.log(ratio) / np.log(r))
+            ml = actuations * self.MAX_SUBDOSE
+            dilution = r**actuations
+
+        self.od = self.od * dilution
+        self.alt_media_fraction = np.where(to_alt, 1 - current * dilution, np.where(to_media, current * dilution, self.alt_media_fraction))
+        self.alt_media_ml += np.where(to_alt, ml, 0.0)
+        self.media_ml += np.where(to_media, ml, 0.0)
+        self.waste_ml += np.where(switching, ml, 0.0)
+        self.pump_actuations += (2 * actuations).astype(np.int64)
+        self.on_alt_media ^= switching
+
+
+class ChemostatWithConstantAltMediaFraction(VectorDosingJob):
+    automation_name = "chemostat_with_constant_alt_media_fraction"
+    EXCHANGE_MODES = ("sequential", "co_dosing")
+
+    def __init__(self, volume, target_fraction, exchange_mode: str = "sequential", **kwargs) -> None:
+        super().__init__(**kwargs)
+        self.volume = self.setting(volume, self.n_vials)
+        self.target_fraction = self.setting(target_fraction, self.n_vials)
+        if exchange_mode not in self.EXCHANGE_MODES:
+            raise ValueError(f"exchange_mode must be one of {self.EXCHANGE_MODES}.")
+        self.exchange_mode = exchange_mode
+
+    def execute(self) -> None:
+        if self.exchange_mode == "co_dosing":
+            # `volume` of media per cycle at target_fraction, as in sequential mode.
+            media_ml, alt_media_ml = co_dosing_split(
+                self.alt_media_fraction, self.target_fraction, self.vial_volume, self.volume / (1 - self.target_fraction), self.MAX_SUBDOSE
+            )
+            self.execute_io_action(media_ml=media_ml, alt_media_ml=alt_media_ml, waste_ml=media_ml + alt_media_ml)
+            return
+
+        self.execute_io_action(media_ml=self.volume, waste_ml=self.volume)
+        delta_alt_media = np.maximum(self.vial_volume * (self.target_fraction - self.alt_media_fraction) / (1 - self.target_fraction), 0)
+        self.execute_io_action(alt_media_ml=delta_alt_media, waste_ml=delta_alt_media)
+
+
+AUTOMATIONS: dict[str, type[VectorDosingJob]] = {
+    cls.automation_name: cls
+    for cls in (
+        NaiveTurbidostat,
+        AdaptedTurbidostat,
+        PIDTurbidostat,
+        Morbidostat,
+        SwitchingDosing,
+        ChemostatWithConstantAltMediaFraction,
+    )
+}
+
+
+@dataclass
+class SimulationResult:
+    hours: np.ndarray  # recorded timepoints
+    od: np.ndarray  # (timepoints, vials)
+    alt_media_fraction: np.ndarray  # (timepoints, vials)
+    media_ml: np.ndarray
+    alt_media_ml: np.ndarray
+    waste_ml: np.ndarray
+    pump_actuations: np.ndarray
+    settings: dict[str, np.ndarray] = field(default_factory=dict)
+
+
+def grid(**settings) -> dict[str, np.ndarray]:
+    """Cartesian product of the given settings, flattened to one value per vial."""
+    names = list(settings)
+    mesh = np.meshgrid(*[np.atleast_1d(np.asarray(settings[name])) for name in names], indexing="ij")
+    return {name: values.ravel() for name, values in zip(names, mesh)}
+
+
+def simulate(
+    automation: str | type[VectorDosingJob],
+    hours: float,
+    duration: float,
+    n_vials: Optional[int] = None,
+    culture: Optional[CultureModel] = None,
+    record_every: int = 60,
+    vial_volume: float = 14.0,
+    initial_alt_media_fraction: float = 0.0,
+    seed: Optional[int] = None,
+    **settings,
+) -> SimulationResult:
+    """
+    Run an automation (by automation_name, or a VectorDosingJob subclass) on n_vials for `hours`, calling
+    `execute` every `duration` minutes. Array settings give one value per vial; n_vials defaults to their length.
+    """
+    job_class = AUTOMATIONS[automation] if isinstance(automation, str) else automation
+    if n_vials is None:
+        n_vials = max((np.size(value) for value in settings.values() if value is not None), default=1)
+
+    job = job_class(
+        n_vials=n_vials,
+        duration=duration,
+        vial_volume=vial_volume,
+        initial_alt_media_fraction=initial_alt_media_fraction,
+        culture=culture,
+        seed=seed,
+        **settings,
+    )
+
+    dt_hours = duration / 60
+    n_ticks = int(round(hours / dt_hours))
+    n_records = n_ticks // record_every + 1
+    recorded_hours = np.empty(n_records)
+    recorded_od = np.empty((n_records, n_vials))
+    recorded_fraction = np.empty((n_records, n_vials))
+
+    for tick in range(n_ticks + 1):
+        if tick % record_every == 0:
+            i = tick // record_every
+            recorded_hours[i] = tick * dt_hours
+            recorded_od[i] = job.od
+            recorded_fraction[i] = job.alt_media_fraction
+        job.observe()
+        job.execute()
+        job.grow(dt_hours)
+
+    return SimulationResult(
+        hours=recorded_hours,
+        od=recorded_od,
+        alt_media_fraction=recorded_fraction,
+        media_ml=job.media_ml,
+        alt_media_ml=job.alt_media_ml,
+        waste_ml=job.waste_ml,
+        pump_actuations=job.pump_actuations,
+        settings={name: VectorDosingJob.setting(value, n_vials, dtype=None if isinstance(value, str) else float) for name, value in settings.items() if value is not None},
+    )
+
+
+if __name__ == "__main__":
+    import time
+
+    settings = grid(target_normalized_od=np.linspace(2, 6, 20), Kp=np.linspace(0.5, 10, 50), Ki=[0.0, 0.1], Kd=0.0)
+    started = time.perf_counter()
+    result = simulate("pid_turbidostat", hours=24 * 14, duration=1.0, culture=CultureModel(od_noise=0.02), seed=0, **settings)
+    print(f"simulated {result.od.shape[1]} vials for 14 days in {time.perf_counter() - started:.1f}s")
+    best = np.argmin(result.media_ml)
+    print({name: float(values[best]) for name, values in result.settings.items()}, f"{result.media_ml[best]:.0f}mL media")
@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+"""
+A fake serial scale on a pty, speaking the protocol ScaleReader (automation_plugin/dosing/scale.py) reads:
+every b"\\r" it receives is answered with the current weight, ex: b"  0.1234kg\\r". Point a ScaleReader, or
+the scale_port of ChemostatWithScale in config.ini, at its `port` to run without a scale:
+
+    with FakeScale(weight=100.0, flow=0.5) as scale:
+        reader = ScaleReader(scale.port).start()
+
+The weight changes by `flow` g/s, ex: to mimic a running pump. To exercise the framing, `garbage_every`
+makes every nth answer unparseable, and `split` writes each answer in two pieces. Running this file checks
+ScaleReader against it:
+
+$ python3 fake_scale.py
+
+Requires pyserial, and a POSIX system for the pty.
+"""
+from __future__ import annotations
+
+import os
+import pty
+import sys
+import time
+import tty
+from pathlib import Path
+from threading import Event, Lock, Thread
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+
+class FakeScale:
+    def __init__(self, weight: float = 100.0, flow: float = 0.0, garbage_every: int = 0, split: bool = False) -> None:
+        self.flow = flow  # g/s
+        self.garbage_every = garbage_every
+        self.split = split
+        self.requests = 0
+
+        self._lock = Lock()
+        self._weight = weight
+        self._weighed_at = time.monotonic()
+        self._stop_event = Event()
+        self._thread: Thread | None = None
+
+        self._master, self._slave = pty.openpty()
+        tty.setraw(self._slave)  # no echo, and no translation of b"\r"
+        self.port = os.ttyname(self._slave)
+
+    @property
+    def weight(self) -> float:
+        """In g."""
+        with self._lock:
+            return self._weight + self.flow * (time.monotonic() - self._weighed_at)
+
+    @weight.setter
+    def weight(self, value: float) -> None:
+        with self._lock:
+            self._weight, self._weighed_at = value, time.monotonic()
+
+    def start(self) -> FakeScale:
+        self._thread = Thread(target=self._serve, daemon=True, name="fake-scale")
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop_event.set()
+        # closing the master end wakes the server out of its read.
+        for fd in (self._master, self._slave):
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+        if self._thread is not None:
+            self._thread.join(timeout=1.0)
+            self._thread = None
+
+    def __enter__(self) -> FakeScale:
+        return self.start()
+
+    def __exit__(self, *args) -> None:
+        self.stop()
+
+    def answer(self) -> bytes:
+        self.requests += 1
+        if self.garbage_every and self.requests % self.garbage_every == 0:
+            return b"ERR\r"
+        return f"  {self.weight / 1000:.4f}kg\r".encode()
+
+    def _serve(self) -> None:
+        while not self._stop_event.is_set():
+            try:
+                received = os.read(self._master, 64)
+            except OSError:
+                return
+            for _ in range(received.count(b"\r")):
+                answer = self.answer()
+                try:
+                    if self.split:
+                        os.write(self._master, answer[: len(answer) // 2])
+                        time.sleep(0.002)
+                        answer = answer[len(answer) // 2 :]
+                    os.write(self._master, answer)
+                except OSError:
+                    return
+
+
+def check() -> None:
+    """ScaleReader against FakeScale: framing, the ring buffer, and start and stop."""
+    if str(REPO_ROOT) not in sys.path:
+        sys.path.append(str(REPO_ROOT))
+    from automation_plugin.dosing.scale import parse_weight
+    from automation_plugin.dosing.scale import ScaleReader
+
+    assert abs(parse_weight(b"  0.1234kg\r") - 123.4) < 1e-9
+    assert parse_weight(b"ERR\r") is None and parse_weight(b"") is None
+
+    buffer_size = 8
+    with FakeScale(weight=100.0, flow=10.0, garbage_every=3, split=True) as scale:
+        reader = ScaleReader(scale.port, buffer_size=buffer_size, timeout=0.2).start()
+        try:
+            assert reader.running
+            first = reader.wait_for_sample(timeout=2.0)
+            assert first is not None and first[1] >= 100.0, first
+
+            # enough round trips to wrap the ring buffer, some of them garbage.
+            while scale.requests < 3 * buffer_size:
+                time.sleep(0.01)
+            samples = reader.samples()
+            assert len(samples) == buffer_size, len(samples)
+            assert all(earlier[0] < later[0] for earlier, later in zip(samples, samples[1:])), "timestamps out of order"
+            assert all(earlier[1] <= later[1] for earlier, later in zip(samples, samples[1:])), "split answers misread"
+            assert all(100.0 <= weight <= scale.weight for _, weight in samples), "garbage answers misread"
+            assert first not in samples, "the oldest samples weren't dropped"
+
+            latest = reader.latest()
+            assert latest is not None and reader.samples(since=latest[0]) == []
+            after = reader.wait_for_sample(after=latest[0], timeout=2.0)
+            assert after is not None and after[0] > latest[0]
+
+            reader.pause()
+            time.sleep(0.1)
+            requests = scale.requests
+            time.sleep(0.3)
+            assert scale.requests == requests, "polled while paused"
+            recent = [weight for _, weight in reader.samples()[-4:]]
+            assert abs(reader.mean_weight(4) - sum(recent) / 4) < 1e-9
+        finally:
+            reader.stop()
+        assert not reader.running
+
+    failed = ScaleReader("/dev/no-such-scale", timeout=0.2)
+    try:
+        failed.start()
+    except Exception:
+        pass
+    else:
+        raise AssertionError("started on a port that doesn't exist")
+    assert not failed.running
+
+
+if __name__ == "__main__":
+    check()
+    print("ScaleReader works against FakeScale.")
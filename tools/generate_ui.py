@@ -0,0 +1,329 @@
+# -*- coding: utf-8 -*-
+"""
+Generate the UI descriptors and the settings schema of every automation in this repo, from the source.
+
+Each automation class in automation_plugin/dosing/, temperature/ and led/ is read with ast, without importing
+it (so neither pioreactor nor the automations' dependencies are needed). From its `__init__` signature,
+`published_settings` and `<SETTING>S` choice tuples (ex: DOSING_MODES for dosing_mode), this writes:
+
+- automation_plugin/ui/contrib/automations/<dosing|temperature|led>/<automation_name>.yaml, the descriptor
+  the Pioreactor UI builds its start dialog from. Display names, labels, units and descriptions edited in an
+  existing descriptor are kept, as long as the key still exists, and so are the defaults of settings that
+  don't have one in the code.
+- automation_plugin/settings_schema.py, the precompiled table automation_plugin/validation.py checks
+  settings and experiment profiles against, before any job is started, and automation_plugin/registry.py
+  imports the automations' modules from.
+
+Run it after changing an automation's settings:
+$ python3 tools/generate_ui.py
+and in CI, to fail on outdated files:
+$ python3 tools/generate_ui.py --check
+
+Requires pyyaml.
+"""
+from __future__ import annotations
+
+import argparse
+import ast
+import difflib
+import json
+import re
+import sys
+from pathlib import Path
+from typing import Any, Optional
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+PACKAGE_DIRECTORY = REPO_ROOT / "automation_plugin"
+SOURCE_DIRECTORIES = ("dosing", "temperature", "led")  # in the package
+UI_DIRECTORY = PACKAGE_DIRECTORY / "ui" / "contrib" / "automations"
+SCHEMA_PATH = PACKAGE_DIRECTORY / "settings_schema.py"
+PLUGIN_NAME = "automation_plugin"
+
+# kind of automation, by the pioreactor base class it subclasses.
+KINDS = {
+    "DosingAutomationJob": "dosing",
+    "DosingAutomationJobContrib": "dosing",
+    "TemperatureAutomationJob": "temperature",
+    "TemperatureAutomationJobContrib": "temperature",
+    "LEDAutomationJob": "led",
+    "LEDAutomationJobContrib": "led",
+}
+
+# settings taken by the base classes' __init__, through **kwargs. Only the ones with a label are UI fields.
+BASE_SETTINGS: dict[str, dict[str, dict[str, Any]]] = {
+    "dosing": {
+        "duration": {"datatype": "float", "required": False, "nullable": True, "unit": "min", "label": "Duration"},
+        "skip_first_run": {"datatype": "boolean", "required": False, "nullable": False},
+        "initial_alt_media_fraction": {"datatype": "float", "required": False, "nullable": False},
+        "initial_vial_volume": {"datatype": "float", "required": False, "nullable": False},
+    },
+    "temperature": {},
+    "led": {
+        "duration": {"datatype": "float", "required": True, "nullable": False, "unit": "min", "label": "Duration"},
+        "skip_first_run": {"datatype": "boolean", "required": False, "nullable": False},
+    },
+}
+
+HEADER = "# generated by tools/generate_ui.py from {source}. Edited names, labels, units and descriptions are kept.\n"
+SCHEMA_HEADER = '''# -*- coding: utf-8 -*-
+# generated by tools/generate_ui.py: rerun it instead of editing.
+#
+# automation_name -> kind, module (in automation_plugin) and class, and setting -> datatype, whether it's
+# required, can be None, can be changed while running, and its allowed values.
+'''
+
+
+def datatype_of(annotation: Optional[ast.expr], default: Any) -> str:
+    # the settings' values arrive as strings from the CLI, hence annotations like `float | str`.
+    text = ast.unparse(annotation) if annotation is not None else ""
+    for name, datatype in (("bool", "boolean"), ("int", "integer"), ("float", "float"), ("dict", "json"), ("list", "json"), ("str", "string")):
+        if re.search(rf"\b{name}\b", text):
+            return datatype
+    for python_type, datatype in ((bool, "boolean"), (int, "integer"), (float, "float"), (str, "string")):
+        if isinstance(default, python_type):
+            return datatype
+    return "float"  # un-annotated, ex: NaiveTurbidostat's target_od
+
+
+def is_optional(annotation: Optional[ast.expr]) -> bool:
+    return annotation is not None and re.search(r"\bOptional\b|\bNone\b", ast.unparse(annotation)) is not None
+
+
+def literal(node: Optional[ast.expr], default: Any = None) -> Any:
+    if node is None:
+        return default
+    try:
+        return ast.literal_eval(node)
+    except ValueError:
+        return default
+
+
+def humanize(name: str) -> str:
+    # "target_normalized_od" -> "Target normalized od", "PIDTurbidostat" -> "PID Turbidostat"
+    if "_" in name or name.islower():
+        return name.replace("_", " ").capitalize()
+    return re.sub(r"(?<=[a-z])(?=[A-Z])|(?<=[A-Z])(?=[A-Z][a-z])", " ", name)
+
+
+def first_paragraph(docstring: Optional[str]) -> Optional[str]:
+    if not docstring:
+        return None
+    return " ".join(docstring.strip().split("\n\n")[0].split())
+
+
+def find_automations(path: Path) -> list[dict[str, Any]]:
+    tree = ast.parse(path.read_text(), filename=str(path))
+    module_values = {
+        target.id: literal(node.value)
+        for node in tree.body
+        if isinstance(node, ast.Assign)
+        for target in node.targets
+        if isinstance(target, ast.Name)
+    }
+
+    automations = []
+    for cls in (node for node in tree.body if isinstance(node, ast.ClassDef)):
+        kinds = [KINDS[ast.unparse(base)] for base in cls.bases if ast.unparse(base) in KINDS]
+        if not kinds:
+            continue
+
+        attributes: dict[str, Any] = {}
+        init: Optional[ast.FunctionDef] = None
+        for node in cls.body:
+            if isinstance(node, ast.Assign) and isinstance(node.targets[0], ast.Name):
+                attributes[node.targets[0].id] = literal(node.value)
+            elif isinstance(node, ast.AnnAssign) and isinstance(node.target, ast.Name):
+                attributes[node.target.id] = literal(node.value)
+            elif isinstance(node, ast.FunctionDef) and node.name == "__init__":
+                init = node
+        if not isinstance(attributes.get("automation_name"), str):
+            continue
+
+        arguments: list[tuple[str, Optional[ast.expr], bool, Any]] = []  # name, annotation, has a default, default
+        if init is not None:
+            positional = init.args.args[1:]
+            defaults = [None] * (len(positional) - len(init.args.defaults)) + list(init.args.defaults)
+            arguments += [(arg.arg, arg.annotation, default is not None, literal(default)) for arg, default in zip(positional, defaults)]
+            arguments += [
+                (arg.arg, arg.annotation, default is not None, literal(default))
+                for arg, default in zip(init.args.kwonlyargs, init.args.kw_defaults)
+            ]
+
+        automations.append(
+            {
+                "class_name": cls.name,
+                "automation_name": attributes["automation_name"],
+                "kind": kinds[0],
+                "module": ".".join(path.relative_to(PACKAGE_DIRECTORY).with_suffix("").parts),
+                "source": path.relative_to(REPO_ROOT).as_posix(),
+                "description": first_paragraph(ast.get_docstring(cls)) or module_values.get("__plugin_summary__"),
+                "published_settings": attributes.get("published_settings") or {},
+                "attributes": attributes,
+                "arguments": arguments,
+            }
+        )
+    return automations
+
+
+def settings_of(automation: dict[str, Any]) -> tuple[dict[str, dict[str, Any]], list[str]]:
+    """The automation's settings, in __init__ order then the base class's, and warnings about its published_settings."""
+    published = automation["published_settings"]
+    settings: dict[str, dict[str, Any]] = {}
+    for name, annotation, has_default, default in automation["arguments"]:
+        published_setting = published.get(name, {})
+        choices = automation["attributes"].get(f"{name.upper()}S")
+        settings[name] = {
+            "datatype": published_setting.get("datatype") or datatype_of(annotation, default),
+            "required": not has_default,
+            "nullable": (has_default and default is None) or is_optional(annotation),
+            "settable": bool(published_setting.get("settable", False)),
+            "choices": list(choices) if isinstance(choices, tuple) else None,
+            "default": default,
+            "unit": published_setting.get("unit"),
+        }
+
+    for name, base_setting in BASE_SETTINGS[automation["kind"]].items():
+        if name not in settings:
+            published_setting = published.get(name, {})
+            settings[name] = {
+                "datatype": base_setting["datatype"],
+                "required": base_setting["required"],
+                "nullable": base_setting["nullable"],
+                "settable": bool(published_setting.get("settable", False)),
+                "choices": None,
+                "default": None,
+                "unit": published_setting.get("unit", base_setting.get("unit")),
+                "label": base_setting.get("label"),
+            }
+
+    warnings = []
+    for name, published_setting in published.items():
+        if published_setting.get("settable") and name not in settings:
+            close = difflib.get_close_matches(name, settings, n=1)
+            hint = f" Did you mean {close[0]}?" if close else ""
+            warnings.append(f"{automation['source']}: settable published setting {name} isn't a setting of {automation['class_name']}.{hint}")
+    return settings, warnings
+
+
+def python_literal(value: Any) -> str:
+    # like repr, with the double quotes the rest of the repo uses.
+    if isinstance(value, str):
+        return json.dumps(value, ensure_ascii=False)
+    if isinstance(value, (list, tuple)):
+        return "[" + ", ".join(python_literal(item) for item in value) + "]"
+    if isinstance(value, dict):
+        return "{" + ", ".join(f"{python_literal(key)}: {python_literal(item)}" for key, item in value.items()) + "}"
+    return repr(value)
+
+
+def render_descriptor(automation: dict[str, Any], settings: dict[str, dict[str, Any]], existing: dict[str, Any]) -> str:
+    import yaml
+
+    existing_fields = {field.get("key"): field for field in existing.get("fields") or [] if isinstance(field, dict)}
+    fields = []
+    for name, setting in settings.items():
+        if name in BASE_SETTINGS[automation["kind"]] and not setting.get("label"):
+            continue  # not shown in the UI, ex: skip_first_run
+        kept = existing_fields.get(name, {})
+        field: dict[str, Any] = {"key": name}
+        unit = setting["unit"] or kept.get("unit")
+        if unit:
+            field["unit"] = unit
+        field["label"] = kept.get("label") or setting.get("label") or humanize(name)
+        if kept.get("description"):
+            field["description"] = kept["description"]
+        has_default = not setting["required"] and name not in BASE_SETTINGS[automation["kind"]]
+        field["default"] = setting["default"] if has_default else kept.get("default")
+        fields.append(field)
+
+    descriptor = {
+        "display_name": existing.get("display_name") or humanize(automation["class_name"]),
+        "automation_name": automation["automation_name"],
+        "source": PLUGIN_NAME,
+        "description": existing.get("description") or automation["description"] or humanize(automation["class_name"]),
+        "fields": fields,
+    }
+
+    class Dumper(yaml.SafeDumper):
+        # indent list items under their key, as in the hand-written descriptors.
+        def increase_indent(self, flow: bool = False, indentless: bool = False) -> None:
+            return super().increase_indent(flow, False)
+
+    return HEADER.format(source=automation["source"]) + yaml.dump(descriptor, Dumper=Dumper, sort_keys=False, allow_unicode=True, width=1000)
+
+
+def render_schema(schemas: dict[str, dict[str, Any]]) -> str:
+    lines = [SCHEMA_HEADER + "SCHEMAS = {"]
+    for name, schema in schemas.items():
+        lines.append(f"    {python_literal(name)}: {{")
+        lines.append(f"        \"kind\": {python_literal(schema['kind'])},")
+        lines.append(f"        \"module\": {python_literal(schema['module'])},")
+        lines.append(f"        \"class\": {python_literal(schema['class'])},")
+        lines.append("        \"settings\": {")
+        lines += [f"            {python_literal(key)}: {python_literal(setting)}," for key, setting in schema["settings"].items()]
+        lines.append("        },")
+        lines.append("    },")
+    lines.append("}")
+    return "\n".join(lines) + "\n"
+
+
+def generate() -> tuple[dict[Path, str], list[str]]:
+    """Rendered files by path, and warnings."""
+    import yaml
+
+    outputs: dict[Path, str] = {}
+    warnings: list[str] = []
+    schemas: dict[str, dict[str, Any]] = {}
+    for directory in SOURCE_DIRECTORIES:
+        for path in sorted((PACKAGE_DIRECTORY / directory).glob("*.py")):
+            for automation in find_automations(path):
+                name = automation["automation_name"]
+                if name in schemas:
+                    warnings.append(f"{automation['source']}: automation_name {name} is already used by {schemas[name]['module']}.")
+                    continue
+
+                settings, setting_warnings = settings_of(automation)
+                warnings += setting_warnings
+
+                descriptor_path = UI_DIRECTORY / automation["kind"] / f"{name}.yaml"
+                existing = yaml.safe_load(descriptor_path.read_text()) if descriptor_path.exists() else None
+                outputs[descriptor_path] = render_descriptor(automation, settings, existing if isinstance(existing, dict) else {})
+
+                schemas[name] = {
+                    "kind": automation["kind"],
+                    "module": automation["module"],
+                    "class": automation["class_name"],
+                    "settings": {
+                        key: {field: setting[field] for field in ("datatype", "required", "nullable", "settable", "choices")}
+                        for key, setting in settings.items()
+                    },
+                }
+
+    outputs[SCHEMA_PATH] = render_schema(dict(sorted(schemas.items())))
+    return outputs, warnings
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0], formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--check", action="store_true", help="don't write anything, exit with 1 if a file is outdated")
+    args = parser.parse_args()
+
+    outputs, warnings = generate()
+    for warning in warnings:
+        print(f"warning: {warning}", file=sys.stderr)
+
+    outdated = [path for path, content in outputs.items() if not path.exists() or path.read_text() != content]
+    for path in outdated:
+        relative = path.relative_to(REPO_ROOT)
+        if args.check:
+            print(f"outdated: {relative}", file=sys.stderr)
+        else:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_text(outputs[path])
+            print(f"wrote {relative}", file=sys.stderr)
+    if args.check and outdated:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,870 @@
+# -*- coding: utf-8 -*-
+"""
+Off-device emulator to run the automation classes in this repo unchanged.
+
+`Emulator.install()` puts stand-ins for the pioreactor modules the plugins import into sys.modules: the
+automation base classes (with execute_io_action), local_persistant_storage, config, PID, PWMPump, MQTT
+publishing, and the LED / heater setters. Time is virtual: while installed, `time.time`, `time.monotonic`
+and `time.sleep` read and advance the emulator clock, so a 24h LightCycle or TemperatureGradient run
+finishes in well under a second, and two runs with the same seed are identical.
+
+A scalar culture (logistic growth, dilution, alt_media_fraction) and a first-order thermal model
+stand in for the vial.
+
+Example
+---------
+> with Emulator(seed=0) as emulator:
+>     LightCycle = emulator.load("automation_plugin/led/light_cycle.py").LightCycle
+>     job = emulator.run(LightCycle, hours=24, duration=60, max_light_intensity=50)
+>     print(emulator.led_history[-1])
+"""
+from __future__ import annotations
+
+import importlib.util
+import json
+import logging
+import random
+import sys
+import time
+import types
+from configparser import ConfigParser
+from contextlib import contextmanager
+from dataclasses import asdict
+from dataclasses import dataclass
+from dataclasses import is_dataclass
+from math import exp
+from pathlib import Path
+from typing import Any, Callable, Optional
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+PACKAGE = "automation_plugin"
+
+DEFAULT_CONFIG = {
+    "bioreactor": {"max_volume_ml": "14", "initial_volume_ml": "14", "initial_alt_media_fraction": "0"},
+    "dosing_automation.config": {
+        "max_subdose": "0.75",
+        "waste_removal_multiplier": "2.0",
+        "max_volume_to_warn": "17.0",
+        "max_volume_to_stop": "18.0",
+        "pause_between_subdoses_seconds": "5.0",
+    },
+    "dosing_automation.pid_turbidostat": {"Kp": "1.0", "Ki": "0.0", "Kd": "0.0"},
+    "temperature_automation.thermostat": {"Kp": "3.0", "Ki": "0.0", "Kd": "4.5"},
+    "od_config": {"samples_per_second": "0.2"},
+    "PWM_reverse": {"stirring": "1", "media": "2", "alt_media": "3", "waste": "4", "heating": "5"},
+}
+PWM_TO_PIN = {"1": 17, "2": 13, "3": 16, "4": 12, "5": 18}
+
+# seconds between temperature inferences in TemperatureController, which is what triggers temperature automations.
+TEMPERATURE_INFERENCE_EVERY_N_SECONDS = 225
+
+# the emulator currently installed. The stand-in modules reach the clock, vial and MQTT through it.
+EMULATOR: Optional[Emulator] = None
+
+
+def _emulator() -> Emulator:
+    if EMULATOR is None:
+        raise RuntimeError("No Emulator is installed.")
+    return EMULATOR
+
+
+class VirtualClock:
+    """Time only moves when something sleeps, or when the emulator advances to the next scheduled run."""
+
+    def __init__(self, start: float = 1_700_000_000.0) -> None:
+        self._start = start
+        self._elapsed = 0.0
+
+    def time(self) -> float:
+        return self._start + self._elapsed
+
+    def monotonic(self) -> float:
+        return self._elapsed
+
+    def sleep(self, seconds: float) -> None:
+        self._elapsed += max(seconds, 0.0)
+
+    def advance_to(self, monotonic_time: float) -> None:
+        self._elapsed = max(self._elapsed, monotonic_time)
+
+
+class VirtualCulture:
+    """Scalar vial model. State is integrated lazily up to the current virtual time whenever it is read."""
+
+    def __init__(
+        self,
+        clock: VirtualClock,
+        rng: random.Random,
+        initial_od: float = 0.05,
+        growth_rate: float = 0.5,
+        carrying_capacity: float = 5.0,
+        alt_media_ic50: float = float("inf"),
+        hill: float = 2.0,
+        od_noise: float = 0.0,
+        vial_volume: float = 14.0,
+        max_volume: float = 14.0,
+        alt_media_fraction: float = 0.0,
+    ) -> None:
+        self.clock = clock
+        self.rng = rng
+        self.initial_od = initial_od
+        self.growth_rate = growth_rate
+        self.carrying_capacity = carrying_capacity
+        self.alt_media_ic50 = alt_media_ic50
+        self.hill = hill
+        self.od_noise = od_noise
+        self.max_volume = max_volume
+        self._od = initial_od
+        self._vial_volume = vial_volume
+        self._alt_media_fraction = alt_media_fraction
+        self._synced_at = clock.monotonic()
+
+    def _sync(self) -> None:
+        dt_hours = (self.clock.monotonic() - self._synced_at) / 3600
+        if dt_hours > 0:
+            mu = self.growth_rate / (1 + (self._alt_media_fraction / self.alt_media_ic50) ** self.hill)
+            K = self.carrying_capacity
+            self._od = K / (1 + (K / self._od - 1) * exp(-mu * dt_hours))
+        self._synced_at = self.clock.monotonic()
+
+    @property
+    def od(self) -> float:
+        self._sync()
+        return self._od
+
+    @property
+    def vial_volume(self) -> float:
+        return self._vial_volume
+
+    @property
+    def alt_media_fraction(self) -> float:
+        return self._alt_media_fraction
+
+    def read_od(self) -> float:
+        return self.od * (1 + self.od_noise * self.rng.gauss(0, 1))
+
+    def dose(self, pump: str, ml: float) -> None:
+        self._sync()
+        if pump == "waste":
+            # the efflux tube keeps the vial from going below max_volume, like VialVolumeCalculator.
+            self._vial_volume = max(self._vial_volume - ml, min(self._vial_volume, self.max_volume))
+            return
+        alt_media_ml = ml if pump == "alt_media" else 0.0
+        self._alt_media_fraction = (self._alt_media_fraction * self._vial_volume + alt_media_ml) / (self._vial_volume + ml)
+        self._od = self._od * self._vial_volume / (self._vial_volume + ml)
+        self._vial_volume += ml
+
+
+class VirtualHeater:
+    """First order thermal model: the vial relaxes towards ambient + gain * duty_cycle with time constant tau."""
+
+    def __init__(self, clock: VirtualClock, ambient: float = 22.0, gain: float = 0.35, tau_seconds: float = 1200.0) -> None:
+        self.clock = clock
+        self.ambient = ambient
+        self.gain = gain
+        self.tau_seconds = tau_seconds
+        self.duty_cycle = 0.0
+        self._temperature = ambient
+        self._synced_at = clock.monotonic()
+
+    def _sync(self) -> None:
+        dt = self.clock.monotonic() - self._synced_at
+        if dt > 0:
+            steady_state = self.ambient + self.gain * self.duty_cycle
+            self._temperature = steady_state + (self._temperature - steady_state) * exp(-dt / self.tau_seconds)
+        self._synced_at = self.clock.monotonic()
+
+    @property
+    def temperature(self) -> float:
+        self._sync()
+        return self._temperature
+
+    def set_duty_cycle(self, duty_cycle: float) -> None:
+        self._sync()
+        self.duty_cycle = min(max(float(duty_cycle), 0.0), 100.0)
+
+
+class FakeMQTTClient:
+    def __init__(self, messages: list[tuple[float, str, Any]]) -> None:
+        self.messages = messages
+
+    def publish(self, topic: str, payload: Any, qos: int = 0, retain: bool = False, **kwargs) -> None:
+        self.messages.append((_emulator().clock.time(), topic, payload))
+
+    def loop_stop(self) -> None:
+        pass
+
+    def disconnect(self) -> None:
+        pass
+
+
+@contextmanager
+def local_persistant_storage(cache_name: str):
+    yield _emulator().storage.setdefault(cache_name, {})
+
+
+def clamp(minimum: float, x: float, maximum: float) -> float:
+    return max(minimum, min(x, maximum))
+
+
+def create_client(*args, **kwargs) -> FakeMQTTClient:
+    return _emulator().mqtt
+
+
+def publish(topic: str, message: Any, **kwargs) -> None:
+    _emulator().mqtt.publish(topic, message)
+
+
+def led_intensity(
+    desired_state: dict,
+    unit: Optional[str] = None,
+    experiment: Optional[str] = None,
+    verbose: bool = True,
+    source_of_event: Optional[str] = None,
+    pubsub_client: Optional[FakeMQTTClient] = None,
+) -> bool:
+    _emulator().set_leds(desired_state)
+    return True
+
+
+def decode(raw: str | bytes, type: Callable[..., Any] = dict) -> Any:
+    # msgspec.json.decode, for the structs in this module.
+    return type(**json.loads(raw))
+
+
+def encode(obj: Any) -> bytes:
+    # msgspec.json.encode, for the structs in this module.
+    return json.dumps(asdict(obj) if is_dataclass(obj) else obj, default=str).encode()
+
+
+class CalibrationError(Exception):
+    pass
+
+
+class JobRequiredError(Exception):
+    pass
+
+
+@dataclass
+class PumpCalibration:
+    name: str
+    pioreactor_unit: str
+    created_at: str
+    pump: str
+    hz: float
+    dc: float
+    duration_: float
+    bias_: float
+    voltage: float
+    volumes: Optional[list[float]] = None
+    durations: Optional[list[float]] = None
+
+    def ml_to_duration(self, ml: float) -> float:
+        return (ml - self.bias_) / self.duration_
+
+    def duration_to_ml(self, duration: float) -> float:
+        return duration * self.duration_ + self.bias_
+
+
+@dataclass
+class DosingEvent:
+    volume_change: float
+    event: str
+    source_of_event: Optional[str]
+    timestamp: Any
+
+
+class QOS:
+    AT_MOST_ONCE = 0
+    AT_LEAST_ONCE = 1
+    EXACTLY_ONCE = 2
+
+
+class PID:
+    """Same update rule as pioreactor.utils.streaming_calculations.PID, publishing to the fake MQTT."""
+
+    def __init__(
+        self,
+        Kp: float,
+        Ki: float,
+        Kd: float,
+        setpoint: float,
+        output_limits: tuple[Optional[float], Optional[float]] = (None, None),
+        sample_time: Optional[float] = None,
+        unit: Optional[str] = None,
+        experiment: Optional[str] = None,
+        job_name: Optional[str] = None,
+        target_name: Optional[str] = None,
+        derivative_smoothing: float = 0.0,
+    ) -> None:
+        self.Kp, self.Ki, self.Kd = Kp, Ki, Kd
+        self.setpoint = setpoint
+        self.output_limits = output_limits
+        self.derivative_smoothing = derivative_smoothing
+        self.unit, self.experiment, self.job_name, self.target_name = unit, experiment, job_name, target_name
+        self.reset()
+        self._last_input: Optional[float] = None
+
+    def reset(self) -> None:
+        self.error_prev: Optional[float] = None
+        self.error_sum = 0.0
+        self.derivative_prev = 0.0
+
+    def set_setpoint(self, new_setpoint: float) -> None:
+        self.setpoint = new_setpoint
+
+    def update(self, input_: float, dt: float = 1.0) -> float:
+        lower, upper = self.output_limits
+        error = self.setpoint - input_
+        self.error_sum += error * dt
+        if lower is not None:
+            self.error_sum = max(self.error_sum, lower)
+        if upper is not None:
+            self.error_sum = min(self.error_sum, upper)
+
+        derivative = -(input_ - self._last_input) / dt if self._last_input is not None else 0
+        derivative = (1 - self.derivative_smoothing) * derivative + self.derivative_smoothing * self.derivative_prev
+        self.error_prev = error
+        self.derivative_prev = derivative
+
+        output = self.Kp * error + self.Ki * self.error_sum + self.Kd * derivative
+        if lower is not None:
+            output = max(output, lower)
+        if upper is not None:
+            output = min(output, upper)
+
+        self._last_input = input_
+        publish(f"pioreactor/{self.unit}/{self.experiment}/pid_log/{self.job_name}", json.dumps({"setpoint": self.setpoint, "latest_output": output}))
+        return output
+
+
+class AutomationEvent:
+    def __init__(self, message: str = "", data: Optional[dict] = None) -> None:
+        self.message = message
+        self.data = data
+
+    def __str__(self) -> str:
+        return f"{self.human_readable_name()}: {self.message}" if self.message else self.human_readable_name()
+
+    def human_readable_name(self) -> str:
+        return type(self).__name__
+
+
+def _event_module() -> types.ModuleType:
+    module = types.ModuleType("pioreactor.automations.events")
+    module.AutomationEvent = AutomationEvent
+    for name in ("NoEvent", "DilutionEvent", "AddMediaEvent", "AddAltMediaEvent", "ChangedLedIntensity", "RunningContinuously", "ErrorOccurred", "UpdatedHeaterDC"):
+        setattr(module, name, type(name, (AutomationEvent,), {}))
+    return module
+
+
+events = _event_module()
+
+
+class AutomationJob:
+    INIT, READY, SLEEPING, DISCONNECTED = "init", "ready", "sleeping", "disconnected"
+    automation_name = "automation_job"
+    job_name = "automation_job"
+    published_settings: dict[str, dict] = {}
+
+    def __init__(self, unit: str, experiment: str) -> None:
+        self.unit = unit
+        self.experiment = experiment
+        self.logger = logging.getLogger(f"{self.job_name}.{self.automation_name}")
+        self.pub_client = _emulator().mqtt
+        self.latest_event: Optional[AutomationEvent] = None
+        self.state = self.READY
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        super().__setattr__(name, value)
+        if name in type(self).published_settings and "pub_client" in self.__dict__:
+            self.publish(f"pioreactor/{self.unit}/{self.experiment}/{self.job_name}/{name}", value)
+
+    def publish(self, topic: str, payload: Any, **kwargs) -> None:
+        self.pub_client.publish(topic, payload)
+
+    def add_to_published_settings(self, name: str, props: dict) -> None:
+        type(self).published_settings = {**type(self).published_settings, name: props}
+
+    def set_state(self, new_state: str) -> None:
+        self.state = new_state
+
+    def on_disconnected(self) -> None:
+        pass
+
+    def clean_up(self) -> None:
+        self.on_disconnected()
+        self.state = self.DISCONNECTED
+
+    def execute(self) -> Optional[AutomationEvent]:
+        return events.NoEvent()
+
+    def run(self, timeout: float = 60.0) -> Optional[AutomationEvent]:
+        if self.state != self.READY:
+            return None
+        try:
+            event = self.execute()
+        except Exception as e:
+            self.logger.debug(e, exc_info=True)
+            self.logger.error(e)
+            event = events.ErrorOccurred(str(e))
+        if event:
+            self.logger.info(str(event))
+        self.latest_event = event
+        return event
+
+
+def _pump_program(pump: str) -> Callable[..., float]:
+    def pump_program(unit: str, experiment: str, ml: float, source_of_event: str = "", mqtt_client=None, **kwargs) -> float:
+        emulator = _emulator()
+        with local_persistant_storage("current_pump_calibration") as cache:
+            calibration = json.loads(cache[pump]) if pump in cache else {"duration_": 1.0, "bias_": 0.0}
+        emulator.clock.sleep(max((ml - calibration["bias_"]) / calibration["duration_"], 0.0))
+        emulator.dose(pump, ml, source_of_event)
+        return ml
+
+    return pump_program
+
+
+class DosingAutomationJob(AutomationJob):
+    automation_name = "dosing_automation_base"
+    job_name = "dosing_automation"
+    published_settings = {"duration": {"datatype": "float", "settable": True}}
+
+    previous_normalized_od: Optional[float] = None
+    previous_od: Optional[dict[str, float]] = None
+    previous_growth_rate: Optional[float] = None
+    _latest_normalized_od: Optional[float] = None
+    _latest_od: Optional[dict[str, float]] = None
+    _latest_growth_rate: Optional[float] = None
+
+    def __init__(self, unit: str, experiment: str, duration: Optional[float] = None, skip_first_run: bool = False, **kwargs) -> None:
+        super().__init__(unit, experiment)
+        self.skip_first_run = skip_first_run
+        self.duration = float(duration) if duration else None
+        config = _emulator().config
+        self.MAX_SUBDOSE = config.getfloat("dosing_automation.config", "max_subdose")
+        self.MAX_VIAL_VOLUME_TO_STOP = config.getfloat("dosing_automation.config", "max_volume_to_stop")
+
+    add_media_to_bioreactor = staticmethod(_pump_program("media"))
+    add_alt_media_to_bioreactor = staticmethod(_pump_program("alt_media"))
+    remove_waste_from_bioreactor = staticmethod(_pump_program("waste"))
+
+    @property
+    def alt_media_fraction(self) -> float:
+        return _emulator().culture.alt_media_fraction
+
+    @property
+    def vial_volume(self) -> float:
+        return _emulator().culture.vial_volume
+
+    @property
+    def latest_od(self) -> dict[str, float]:
+        assert self._latest_od is not None, "no OD readings yet"
+        return self._latest_od
+
+    @property
+    def latest_normalized_od(self) -> float:
+        assert self._latest_normalized_od is not None, "no OD readings yet"
+        return self._latest_normalized_od
+
+    @property
+    def latest_growth_rate(self) -> float:
+        return self._latest_growth_rate or 0.0
+
+    def _observe(self, od: float, normalized_od: float, growth_rate: float) -> None:
+        self.previous_od, self.previous_normalized_od, self.previous_growth_rate = self._latest_od, self._latest_normalized_od, self._latest_growth_rate
+        self._latest_od, self._latest_normalized_od, self._latest_growth_rate = {"2": od}, normalized_od, growth_rate
+
+    def block_until_not_sleeping(self) -> bool:
+        return self.state != self.SLEEPING
+
+    def execute_io_action(self, waste_ml: float = 0, media_ml: float = 0, alt_media_ml: float = 0, **other_pumps_ml: float) -> dict[str, float]:
+        # same recursion and ordering as DosingAutomationJob.execute_io_action, with the pauses on the virtual clock.
+        all_pumps_ml = {"media_ml": media_ml, "alt_media_ml": alt_media_ml, **other_pumps_ml}
+        sum_of_volumes = sum(all_pumps_ml.values())
+        if not (waste_ml >= sum_of_volumes):
+            raise ValueError("Not removing enough waste: waste_ml should be greater than sum of dosed ml")
+
+        volumes_moved = {"waste_ml": 0.0, **{pump: 0.0 for pump in all_pumps_ml}}
+        source_of_event = f"{self.job_name}:{self.automation_name}"
+        config = _emulator().config
+
+        if sum_of_volumes > self.MAX_SUBDOSE:
+            for _ in range(2):
+                moved = self.execute_io_action(waste_ml=sum_of_volumes / 2, **{pump: ml / 2 for pump, ml in all_pumps_ml.items()})
+                for pump, ml in moved.items():
+                    volumes_moved[pump] += ml
+            return volumes_moved
+
+        for pump, volume_ml in all_pumps_ml.items():
+            if (self.vial_volume + volume_ml) >= self.MAX_VIAL_VOLUME_TO_STOP:
+                self.logger.error(f"Stopping all pumping since {self.vial_volume} + {volume_ml} mL is beyond safety threshold {self.MAX_VIAL_VOLUME_TO_STOP} mL.")
+                self.set_state(self.SLEEPING)
+            if volume_ml > 0 and self.state == self.READY:
+                pump_function = getattr(self, f"add_{pump.removesuffix('_ml')}_to_bioreactor")
+                volumes_moved[pump] += pump_function(
+                    unit=self.unit, experiment=self.experiment, ml=volume_ml, source_of_event=source_of_event, mqtt_client=self.pub_client
+                )
+                time.sleep(config.getfloat("dosing_automation.config", "pause_between_subdoses_seconds"))
+
+        if waste_ml > 0 and self.state == self.READY:
+            volumes_moved["waste_ml"] += self.remove_waste_from_bioreactor(
+                unit=self.unit, experiment=self.experiment, ml=waste_ml, source_of_event=source_of_event, mqtt_client=self.pub_client
+            )
+            self.remove_waste_from_bioreactor(
+                unit=self.unit,
+                experiment=self.experiment,
+                ml=waste_ml * config.getfloat("dosing_automation.config", "waste_removal_multiplier"),
+                source_of_event=source_of_event,
+                mqtt_client=self.pub_client,
+            )
+        return volumes_moved
+
+
+class TemperatureAutomationJob(AutomationJob):
+    automation_name = "temperature_automation_base"
+    job_name = "temperature_automation"
+    published_settings: dict[str, dict] = {}
+
+    latest_temperature: Optional[float] = None
+    previous_temperature: Optional[float] = None
+
+    def __init__(self, unit: str, experiment: str, temperature_control_parent: Optional[VirtualTemperatureController] = None, **kwargs) -> None:
+        super().__init__(unit, experiment)
+        self.temperature_control_parent = temperature_control_parent or _emulator().temperature_controller
+
+    def update_heater(self, new_duty_cycle: float) -> bool:
+        return self.temperature_control_parent.update_heater(new_duty_cycle)
+
+    def update_heater_with_delta(self, delta_duty_cycle: float) -> bool:
+        return self.temperature_control_parent.update_heater(self.heater_duty_cycle + delta_duty_cycle)
+
+    @property
+    def heater_duty_cycle(self) -> float:
+        return self.temperature_control_parent.heater_duty_cycle
+
+    def is_heater_pwm_locked(self) -> bool:
+        return False
+
+    def _set_latest_temperature(self, temperature: float) -> None:
+        self.previous_temperature = self.latest_temperature
+        self.latest_temperature = temperature
+        if self.state in (self.READY, self.INIT):
+            self.latest_event = self.execute()
+
+
+class LEDAutomationJob(AutomationJob):
+    automation_name = "led_automation_base"
+    job_name = "led_automation"
+    published_settings = {"duration": {"datatype": "float", "settable": True}}
+
+    def __init__(self, unit: str, experiment: str, duration: float, skip_first_run: bool = False, **kwargs) -> None:
+        super().__init__(unit, experiment)
+        self.skip_first_run = skip_first_run
+        self.duration = float(duration)
+        self.edited_channels: set[str] = set()
+
+    def set_led_intensity(self, channel: str, intensity: float) -> bool:
+        self.edited_channels.add(channel)
+        return led_intensity({channel: intensity}, unit=self.unit, experiment=self.experiment, source_of_event=f"{self.job_name}:{self.automation_name}")
+
+
+class _Timer:
+    is_paused = False
+
+    @property
+    def time_to_next_run(self) -> float:
+        emulator = _emulator()
+        return max(emulator.next_temperature_inference - emulator.clock.monotonic(), 0.0)
+
+
+class VirtualTemperatureController:
+    def __init__(self, heater: VirtualHeater) -> None:
+        self.heater = heater
+        self.publish_temperature_timer = _Timer()
+
+    @property
+    def heater_duty_cycle(self) -> float:
+        return self.heater.duty_cycle
+
+    def update_heater(self, new_duty_cycle: float) -> bool:
+        self.heater.set_duty_cycle(new_duty_cycle)
+        _emulator().heater_history.append((_emulator().clock.time(), self.heater.duty_cycle))
+        return True
+
+
+class PWMPump:
+    def __init__(self, unit: str, experiment: str, pin: int, calibration: Optional[PumpCalibration] = None, mqtt_client=None) -> None:
+        pin_to_channel = {pin_: channel for channel, pin_ in PWM_TO_PIN.items()}
+        channel_to_pump = {channel: pump for pump, channel in _emulator().config["PWM_reverse"].items()}
+        self.pump = channel_to_pump[pin_to_channel[pin]]
+        self.calibration = calibration
+        self._started_at: Optional[float] = None
+
+    def continuously(self, block: bool = True) -> None:
+        self._started_at = time.monotonic()
+
+    def stop(self) -> None:
+        if self._started_at is not None:
+            self._move(time.monotonic() - self._started_at)
+            self._started_at = None
+
+    def by_duration(self, seconds: float, block: bool = True) -> None:
+        time.sleep(seconds)
+        self._move(seconds)
+
+    def by_volume(self, ml: float, block: bool = True) -> None:
+        self.by_duration(self.calibration.ml_to_duration(ml) if self.calibration else ml)
+
+    def _move(self, seconds: float) -> None:
+        ml = self.calibration.duration_to_ml(seconds) if self.calibration else seconds
+        _emulator().dose(self.pump, max(ml, 0.0), "PWMPump")
+
+    def __enter__(self) -> PWMPump:
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.stop()
+
+
+class Emulator:
+    def __init__(
+        self,
+        seed: int = 0,
+        unit: str = "emulated_unit",
+        experiment: str = "emulated_experiment",
+        config: Optional[dict[str, dict[str, str]]] = None,
+        culture: Optional[dict[str, float]] = None,
+        heater: Optional[dict[str, float]] = None,
+        start_time: float = 1_700_000_000.0,
+    ) -> None:
+        self.unit = unit
+        self.experiment = experiment
+        self.rng = random.Random(seed)
+        self.seed = seed
+        self.clock = VirtualClock(start=start_time)
+        self.config = ConfigParser()
+        self.config.optionxform = str  # type: ignore
+        self.config.read_dict(DEFAULT_CONFIG)
+        self.config.read_dict(config or {})
+
+        self.culture = VirtualCulture(self.clock, self.rng, **(culture or {}))
+        self.heater = VirtualHeater(self.clock, **(heater or {}))
+        self.temperature_controller = VirtualTemperatureController(self.heater)
+        self.next_temperature_inference = 0.0
+
+        self.messages: list[tuple[float, str, Any]] = []
+        self.mqtt = FakeMQTTClient(self.messages)
+        self.storage: dict[str, dict[str, Any]] = {
+            "current_pump_calibration": {
+                pump: json.dumps(
+                    {
+                        "name": f"emulated_{pump}",
+                        "pioreactor_unit": unit,
+                        "created_at": "1970-01-01T00:00:00Z",
+                        "pump": pump,
+                        "hz": 200.0,
+                        "dc": 100.0,
+                        "duration_": 0.5,
+                        "bias_": 0.0,
+                        "voltage": -1.0,
+                    }
+                )
+                for pump in ("media", "alt_media", "waste")
+            }
+        }
+        self.dosing_history: list[tuple[float, str, float, str]] = []
+        self.led_history: list[tuple[float, dict[str, float]]] = []
+        self.heater_history: list[tuple[float, float]] = []
+        self.led_state: dict[str, float] = {}
+        self._saved: dict[str, Any] = {}
+
+    # hooks used by the stand-in modules
+    def dose(self, pump: str, ml: float, source_of_event: str) -> None:
+        self.culture.dose(pump, ml)
+        self.dosing_history.append((self.clock.time(), pump, ml, source_of_event))
+        self.mqtt.publish(f"pioreactor/{self.unit}/{self.experiment}/dosing_events", json.dumps({"event": pump, "volume_change": ml, "source_of_event": source_of_event}))
+
+    def set_leds(self, desired_state: dict[str, float]) -> None:
+        self.led_state.update({channel: float(intensity) for channel, intensity in desired_state.items()})
+        self.led_history.append((self.clock.time(), dict(desired_state)))
+
+    # installation
+    def _modules(self) -> dict[str, types.ModuleType]:
+        def module(name: str, **attrs: Any) -> types.ModuleType:
+            m = types.ModuleType(name)
+            m.__path__ = []  # type: ignore  # let every stand-in act as a package
+            m.__dict__.update(attrs)
+            return m
+
+        modules = {
+            "msgspec": module("msgspec"),
+            "msgspec.json": module("msgspec.json", decode=decode, encode=encode),
+            "pioreactor": module("pioreactor"),
+            "pioreactor.config": module("pioreactor.config", config=self.config),
+            "pioreactor.exc": module("pioreactor.exc", CalibrationError=CalibrationError, JobRequiredError=JobRequiredError),
+            "pioreactor.types": module("pioreactor.types", LedChannel=str, PdChannel=str),
+            "pioreactor.structs": module("pioreactor.structs", PumpCalibration=PumpCalibration, DosingEvent=DosingEvent),
+            "pioreactor.hardware": module("pioreactor.hardware", PWM_TO_PIN=PWM_TO_PIN),
+            "pioreactor.whoami": module(
+                "pioreactor.whoami",
+                get_unit_name=lambda: self.unit,
+                get_latest_experiment_name=lambda: self.experiment,
+                is_testing_env=lambda: True,
+            ),
+            "pioreactor.pubsub": module("pioreactor.pubsub", create_client=create_client, publish=publish, QOS=QOS),
+            "pioreactor.utils": module("pioreactor.utils", local_persistant_storage=local_persistant_storage, clamp=clamp),
+            "pioreactor.utils.streaming_calculations": module("pioreactor.utils.streaming_calculations", PID=PID),
+            "pioreactor.automations": module("pioreactor.automations", events=events),
+            "pioreactor.automations.events": events,
+            "pioreactor.automations.dosing": module("pioreactor.automations.dosing"),
+            "pioreactor.automations.dosing.base": module(
+                "pioreactor.automations.dosing.base", DosingAutomationJob=DosingAutomationJob, DosingAutomationJobContrib=DosingAutomationJob
+            ),
+            "pioreactor.automations.temperature": module("pioreactor.automations.temperature"),
+            "pioreactor.automations.temperature.base": module(
+                "pioreactor.automations.temperature.base",
+                TemperatureAutomationJob=TemperatureAutomationJob,
+                TemperatureAutomationJobContrib=TemperatureAutomationJob,
+            ),
+            "pioreactor.automations.led": module("pioreactor.automations.led"),
+            "pioreactor.automations.led.base": module(
+                "pioreactor.automations.led.base", LEDAutomationJob=LEDAutomationJob, LEDAutomationJobContrib=LEDAutomationJob
+            ),
+            "pioreactor.actions": module("pioreactor.actions"),
+            "pioreactor.actions.pump": module("pioreactor.actions.pump", PWMPump=PWMPump),
+            "pioreactor.actions.led_intensity": module("pioreactor.actions.led_intensity", led_intensity=led_intensity),
+        }
+        return modules
+
+    def install(self) -> Emulator:
+        global EMULATOR
+        if EMULATOR is not None:
+            raise RuntimeError("Another Emulator is already installed.")
+        EMULATOR = self
+
+        modules = self._modules()
+        self._saved = {
+            "modules": {name: sys.modules.get(name) for name in modules},
+            "time": (time.time, time.monotonic, time.sleep),
+            "path": list(sys.path),
+        }
+        sys.modules.update(modules)
+        time.time, time.monotonic, time.sleep = self.clock.time, self.clock.monotonic, self.clock.sleep  # type: ignore
+        # the package, from this checkout. Its modules are imported again, against these stand-ins.
+        sys.path.insert(0, str(REPO_ROOT))
+        self._forget_package()
+        random.seed(self.seed)
+        return self
+
+    def uninstall(self) -> None:
+        global EMULATOR
+        # automation_profiling and decision_trace patch the stand-in base classes, which outlive this emulator.
+        for name in ("automation_profiling", "decision_trace"):
+            hook = sys.modules.get(f"{PACKAGE}.{name}")
+            if hook is not None:
+                hook.disable()
+        self._forget_package()
+        for name, previous in self._saved["modules"].items():
+            if previous is None:
+                sys.modules.pop(name, None)
+            else:
+                sys.modules[name] = previous
+        time.time, time.monotonic, time.sleep = self._saved["time"]
+        sys.path[:] = self._saved["path"]
+        EMULATOR = None
+
+    def __enter__(self) -> Emulator:
+        return self.install()
+
+    def __exit__(self, *args) -> None:
+        self.uninstall()
+
+    @staticmethod
+    def _forget_package() -> None:
+        # its modules hold on to the stand-ins they were imported against.
+        for name in [name for name in sys.modules if name == PACKAGE or name.startswith(f"{PACKAGE}.")]:
+            del sys.modules[name]
+
+    def load(self, path: str | Path) -> types.ModuleType:
+        """
+        Import a module of the package, by its file (relative to the repo root, or absolute), or any other
+        automation file, against the stand-in modules.
+        """
+        path = (Path(path) if Path(path).is_absolute() else REPO_ROOT / path).resolve()
+        if path.is_relative_to(REPO_ROOT / PACKAGE):
+            return importlib.import_module(".".join(path.relative_to(REPO_ROOT).with_suffix("").parts))
+
+        spec = importlib.util.spec_from_file_location(path.stem, path)
+        assert spec is not None and spec.loader is not None
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[path.stem] = module
+        spec.loader.exec_module(module)
+        return module
+
+    # running
+    def set_setting(self, job: AutomationJob, name: str, value: Any) -> None:
+        """Like publishing to .../<setting>/set: use the job's setter if it has one."""
+        setter = getattr(job, f"set_{name}", None)
+        if callable(setter):
+            setter(value)
+        else:
+            setattr(job, name, value)
+
+    def run(
+        self,
+        automation_class: type,
+        hours: float,
+        duration: Optional[float] = None,
+        at: Optional[list[tuple[float, Callable[[AutomationJob], None]]]] = None,
+        **settings: Any,
+    ) -> AutomationJob:
+        """
+        Instantiate `automation_class` with `settings` and run it for `hours` of virtual time. Dosing and LED
+        automations run every `duration` minutes, temperature automations on every temperature inference.
+        `at` schedules callbacks, ex: [(6.0, lambda job: emulator.set_setting(job, "volume", 1.0))].
+        """
+        is_temperature = issubclass(automation_class, TemperatureAutomationJob)
+        if is_temperature:
+            job = automation_class(unit=self.unit, experiment=self.experiment, temperature_control_parent=self.temperature_controller, **settings)
+        else:
+            if duration is None:
+                raise ValueError("Dosing and LED automations need a duration, in minutes.")
+            job = automation_class(unit=self.unit, experiment=self.experiment, duration=duration, **settings)
+
+        scheduled = sorted(at or [], key=lambda item: item[0])
+        started_at = self.clock.monotonic()
+        ends_at = started_at + hours * 3600
+        next_run = started_at + ((job.duration * 60) if getattr(job, "skip_first_run", False) else 0.0)
+
+        while next_run <= ends_at and job.state != job.DISCONNECTED:
+            self.clock.advance_to(next_run)
+            while scheduled and started_at + scheduled[0][0] * 3600 <= self.clock.monotonic():
+                scheduled.pop(0)[1](job)
+
+            if is_temperature:
+                self.next_temperature_inference = next_run + TEMPERATURE_INFERENCE_EVERY_N_SECONDS
+                job._set_latest_temperature(self.heater.temperature)
+                interval = TEMPERATURE_INFERENCE_EVERY_N_SECONDS
+            else:
+                if isinstance(job, DosingAutomationJob):
+                    od = self.culture.read_od()
+                    job._observe(od, od / self.culture.initial_od, self.culture.growth_rate)
+                job.run()
+                interval = job.duration * 60
+
+            # like RepeatedTimer: keep the cadence, but never schedule in the past if a run overran.
+            next_run = max(next_run + interval, self.clock.monotonic())
+
+        self.clock.advance_to(ends_at)
+        job.clean_up()
+        return job
+
+
+if __name__ == "__main__":
+    with Emulator(seed=0) as emulator:
+        started_cpu = time.process_time()
+        LightCycle = emulator.load("automation_plugin/led/light_cycle.py").LightCycle
+        emulator.run(LightCycle, hours=24, duration=60, max_light_intensity=50)
+        print(f"24h of LightCycle: {len(emulator.led_history)} LED writes, {time.process_time() - started_cpu:.3f}s CPU")
@@ -0,0 +1,409 @@
+# -*- coding: utf-8 -*-
+"""
+Replay recorded OD, normalized OD, growth rate or temperature readings through an automation in this repo, and
+compare what it would have done with what was logged.
+
+Readings are streamed from exported CSVs (od_readings, od_readings_filtered, growth_rates,
+temperature_readings) or from decision_trace files, memory-mapped, and merged by timestamp. The automation
+runs unchanged on the emulator, with its clock following the data: dosing and LED automations run every
+`duration` minutes of data, temperature automations on every temperature reading. Dosing events, heater
+updates and LED changes, replayed and logged (dosing_events and led_change_events exports, or the volumes,
+duty cycles and intensities in a trace), are summed into --bucket-hours buckets and written out as CSV rows
+as soon as a bucket can no longer change, so memory stays constant whatever the length of the data.
+
+$ python3 replay.py automation_plugin/dosing/PID_turbidostat.py --nod od_readings_filtered.csv --dosing-events dosing_events.csv \\
+    --duration 1 -s target_normalized_od=2.5 -s volume=1.0 --config dosing_automation.pid_turbidostat.Kp=2.0 > replay.csv
+
+The replay is open loop: the readings don't respond to the replayed doses, so compare settings over
+stretches where the replayed and logged doses stay close, ex: validating a change of thresholds or gains
+before rolling it out. Leave async_dosing off, so doses land within their execute.
+"""
+from __future__ import annotations
+
+import argparse
+import csv
+import heapq
+import mmap
+import os
+import sys
+import time
+from datetime import datetime
+from datetime import timezone
+from itertools import chain
+from operator import itemgetter
+from pathlib import Path
+from typing import Any, Iterable, Iterator, Optional
+
+from pioreactor_emulator import AutomationJob
+from pioreactor_emulator import DosingAutomationJob
+from pioreactor_emulator import Emulator
+from pioreactor_emulator import REPO_ROOT
+from pioreactor_emulator import TemperatureAutomationJob
+
+# (unix timestamp, kind, value). Inputs are fed to the automation, the other kinds are logged actions.
+Reading = tuple[float, str, float]
+INPUTS = ("od", "normalized_od", "growth_rate", "temperature")
+PUMPS = ("media", "alt_media", "waste")
+SOURCES = ("replayed", "logged")
+
+# value columns of the exports, by kind. The first one present is used.
+CSV_COLUMNS = {
+    "od": ("od_reading", "od"),
+    "normalized_od": ("normalized_od_reading", "normalized_od"),
+    "growth_rate": ("rate", "growth_rate"),
+    "temperature": ("temperature_c", "temperature"),
+}
+DOSING_EVENTS = {"add_media": "media", "add_alt_media": "alt_media", "remove_waste": "waste"}
+
+# summed per bucket. heater_dc columns are averaged over the bucket's heater updates on output.
+SUMS = ("executes", "events") + tuple(
+    f"{source}_{name}"
+    for name in [f"{pump}_ml" for pump in PUMPS] + ["doses", "heater_updates", "heater_dc", "led_writes"]
+    for source in SOURCES
+)
+COLUMNS = ("bucket_start",) + SUMS
+
+
+def parse_timestamp(value: str) -> float:
+    """Unix timestamp from a number or an ISO 8601 string. Naive timestamps are taken as UTC, like the exports."""
+    if value[4:5] != "-":  # not YYYY-...
+        return float(value)
+    parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
+
+
+def _csv_rows(path: str | Path, unit: Optional[str] = None) -> Iterator[tuple[dict[str, int], list[str]]]:
+    with open(path, newline="") as f:
+        reader = csv.reader(f)
+        header = {name: i for i, name in enumerate(next(reader, []))}
+        if "timestamp" not in header:
+            raise ValueError(f"{path} has no timestamp column.")
+        unit_column = header.get("pioreactor_unit")
+        for row in reader:
+            if row and (unit is None or unit_column is None or row[unit_column] == unit):
+                yield header, row
+
+
+def _column(header: dict[str, int], candidates: tuple[str, ...], path: str | Path) -> int:
+    for name in candidates:
+        if name in header:
+            return header[name]
+    raise ValueError(f"{path} has none of the columns {candidates}.")
+
+
+def read_csv(path: str | Path, kind: str, unit: Optional[str] = None, column: Optional[str] = None) -> Iterator[Reading]:
+    """Stream the readings of an exported CSV as `kind`. Rows must be in time order, as exported."""
+    index = None
+    for header, row in _csv_rows(path, unit):
+        if index is None:
+            index = _column(header, (column,) if column else CSV_COLUMNS[kind], path)
+        if row[index]:
+            yield parse_timestamp(row[header["timestamp"]]), kind, float(row[index])
+
+
+def read_dosing_events(path: str | Path, unit: Optional[str] = None) -> Iterator[Reading]:
+    """Stream the pump actuations of a dosing_events export, as (timestamp, pump, ml)."""
+    event_index = volume_index = None
+    for header, row in _csv_rows(path, unit):
+        if event_index is None:
+            event_index = _column(header, ("event",), path)
+            volume_index = _column(header, ("volume_change_ml", "volume_change"), path)
+        pump = DOSING_EVENTS.get(row[event_index])
+        if pump is not None:
+            yield parse_timestamp(row[header["timestamp"]]), pump, abs(float(row[volume_index]))
+
+
+def read_led_events(path: str | Path, unit: Optional[str] = None) -> Iterator[Reading]:
+    """Stream the changes of a led_change_events export, one per channel, as (timestamp, "led", intensity)."""
+    index = None
+    for header, row in _csv_rows(path, unit):
+        if index is None:
+            index = _column(header, ("intensity",), path)
+        yield parse_timestamp(row[header["timestamp"]]), "led", float(row[index])
+
+
+def read_trace(path: str | Path) -> Iterator[Reading]:
+    """
+    Stream a decision_trace file: the inputs each execute saw, and the volumes, duty cycle and LED intensity
+    it logged. The file is memory-mapped and unpacked one record at a time. Traced waste_ml excludes the extra
+    waste removal, and a traced dose is one execute's volume for a pump, not one actuation.
+    """
+    if str(REPO_ROOT) not in sys.path:
+        sys.path.append(str(REPO_ROOT))
+    from automation_plugin.decision_trace import FIELDS
+    from automation_plugin.decision_trace import RECORD
+
+    position = {name: i for i, (name, _) in enumerate(FIELDS)}
+    if os.path.getsize(path) < RECORD.size:
+        return
+
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        # a partly written last record (ex: power loss during a flush) is skipped.
+        view = memoryview(mapped)[: len(mapped) - len(mapped) % RECORD.size]
+        records = RECORD.iter_unpack(view)
+        try:
+            for values in records:
+                timestamp = values[position["timestamp"]]
+                for kind in INPUTS:
+                    value = values[position[kind]]
+                    if value == value:  # not NaN
+                        yield timestamp, kind, value
+                for pump in PUMPS:
+                    ml = values[position[f"{pump}_ml"]]
+                    if ml > 0:
+                        yield timestamp, pump, ml
+                for kind, field in (("heater", "heater_duty_cycle"), ("led", "led_intensity")):
+                    value = values[position[field]]
+                    if value == value:
+                        yield timestamp, kind, value
+        finally:
+            # the mmap can only close once nothing points into it.
+            del records
+            view.release()
+
+
+def merge(*streams: Iterable[Reading]) -> Iterator[Reading]:
+    """Merge time-ordered streams into one, lazily."""
+    return heapq.merge(*streams, key=itemgetter(0))
+
+
+class Buckets:
+    """Sums per bucket. Only the buckets that can still change are held."""
+
+    def __init__(self, started_at: float, bucket_seconds: float) -> None:
+        self.started_at = started_at
+        self.bucket_seconds = bucket_seconds
+        self.open: dict[int, dict[str, float]] = {}
+        self.next_index = 0  # first bucket not written out yet
+        self.next_close = started_at + bucket_seconds  # end of that bucket
+
+    def _index(self, timestamp: float) -> int:
+        return int((timestamp - self.started_at) // self.bucket_seconds)
+
+    def add(self, timestamp: float, column: str, value: float = 1.0) -> None:
+        index = max(self._index(timestamp), self.next_index)
+        bucket = self.open.get(index)
+        if bucket is None:
+            bucket = self.open[index] = dict.fromkeys(SUMS, 0.0)
+        bucket[column] += value
+
+    def _row(self, index: int) -> dict[str, Any]:
+        sums = self.open.pop(index, None) or dict.fromkeys(SUMS, 0.0)
+        for source in SOURCES:
+            updates = sums[f"{source}_heater_updates"]
+            sums[f"{source}_heater_dc"] = sums[f"{source}_heater_dc"] / updates if updates else float("nan")
+        started_at = self.started_at + index * self.bucket_seconds
+        return {"bucket_start": datetime.fromtimestamp(started_at, timezone.utc).isoformat(), **sums}
+
+    def close_before(self, timestamp: float) -> Iterator[dict[str, Any]]:
+        """Write out the buckets before the one holding `timestamp`: nothing from then on can land in them."""
+        while self.next_index < self._index(timestamp):
+            yield self._row(self.next_index)
+            self.next_index += 1
+        self.next_close = self.started_at + (self.next_index + 1) * self.bucket_seconds
+
+    def close_all(self) -> Iterator[dict[str, Any]]:
+        while self.open:
+            yield self._row(self.next_index)
+            self.next_index += 1
+
+
+def find_automation(module: Any, class_name: Optional[str] = None) -> type:
+    if class_name:
+        return getattr(module, class_name)
+    candidates = [
+        value
+        for value in vars(module).values()
+        if isinstance(value, type) and issubclass(value, AutomationJob) and value.__module__ == module.__name__
+    ]
+    if len(candidates) != 1:
+        raise ValueError(f"Found {[c.__name__ for c in candidates]} in {module.__name__}: pick one with --class.")
+    return candidates[0]
+
+
+def replay(
+    automation: str | Path,
+    readings: Iterable[Reading],
+    duration: Optional[float] = None,
+    settings: Optional[dict[str, Any]] = None,
+    class_name: Optional[str] = None,
+    config: Optional[dict[str, dict[str, str]]] = None,
+    bucket_hours: float = 1.0,
+    unit: str = "replayed_unit",
+    experiment: str = "replayed_experiment",
+) -> Iterator[dict[str, Any]]:
+    """
+    Run the automation defined in the file `automation` over the time-ordered `readings`, yielding one row
+    (see COLUMNS) per bucket of replayed and logged actions.
+    """
+    readings = iter(readings)
+    first = next(readings, None)
+    if first is None:
+        return
+    started_at = first[0]
+
+    with Emulator(unit=unit, experiment=experiment, config=config, start_time=started_at) as emulator:
+        automation_class = find_automation(emulator.load(automation), class_name)
+        is_temperature = issubclass(automation_class, TemperatureAutomationJob)
+        is_dosing = issubclass(automation_class, DosingAutomationJob)
+        if is_temperature:
+            job = automation_class(unit=unit, experiment=experiment, temperature_control_parent=emulator.temperature_controller, **(settings or {}))
+        else:
+            if duration is None:
+                raise ValueError("Dosing and LED automations need a duration, in minutes.")
+            job = automation_class(unit=unit, experiment=experiment, duration=duration, **(settings or {}))
+
+        buckets = Buckets(started_at, bucket_hours * 3600)
+        latest: dict[str, float] = {}
+        first_od: Optional[float] = None
+        first_run_delay = job.duration * 60 if getattr(job, "skip_first_run", False) else 0.0
+        # dosing automations start once there is an OD reading, temperature automations run on readings instead.
+        next_run = float("inf") if (is_temperature or is_dosing) else first_run_delay
+
+        def tally(event: Any) -> None:
+            buckets.add(emulator.clock.time(), "executes")
+            if event and type(event).__name__ != "NoEvent":
+                buckets.add(emulator.clock.time(), "events")
+
+        def drain() -> None:
+            for timestamp, pump, ml, _ in emulator.dosing_history:
+                if pump in PUMPS:
+                    buckets.add(timestamp, f"replayed_{pump}_ml", ml)
+                    buckets.add(timestamp, "replayed_doses")
+            for timestamp, state in emulator.led_history:
+                buckets.add(timestamp, "replayed_led_writes", len(state))
+            for timestamp, duty_cycle in emulator.heater_history:
+                buckets.add(timestamp, "replayed_heater_updates")
+                buckets.add(timestamp, "replayed_heater_dc", duty_cycle)
+            emulator.dosing_history.clear()
+            emulator.led_history.clear()
+            emulator.heater_history.clear()
+            emulator.messages.clear()
+
+        for timestamp, kind, value in chain([first], readings):
+            now = timestamp - started_at
+
+            # runs due before this reading see everything up to their time.
+            while next_run < now and job.state != job.DISCONNECTED:
+                emulator.clock.advance_to(next_run)
+                if is_dosing:
+                    od = latest.get("od", latest.get("normalized_od"))
+                    normalized_od = latest.get("normalized_od", od / first_od if first_od else od)
+                    job._observe(od, normalized_od, latest.get("growth_rate", 0.0))
+                tally(job.run())
+                drain()
+                next_run = max(next_run + job.duration * 60, emulator.clock.monotonic())
+
+            if timestamp >= buckets.next_close:
+                yield from buckets.close_before(timestamp)
+
+            if kind in INPUTS:
+                latest[kind] = value
+                if kind == "od" and first_od is None:
+                    first_od = value
+                if is_dosing and kind in ("od", "normalized_od") and next_run == float("inf"):
+                    next_run = now + first_run_delay
+                elif is_temperature and kind == "temperature" and job.state in (job.READY, job.INIT):
+                    emulator.clock.advance_to(now)
+                    job._set_latest_temperature(value)
+                    tally(job.latest_event)
+                    drain()
+            elif kind in PUMPS:
+                buckets.add(timestamp, f"logged_{kind}_ml", value)
+                buckets.add(timestamp, "logged_doses")
+            elif kind == "heater":
+                buckets.add(timestamp, "logged_heater_updates")
+                buckets.add(timestamp, "logged_heater_dc", value)
+            elif kind == "led":
+                buckets.add(timestamp, "logged_led_writes")
+
+        job.clean_up()
+        drain()
+        yield from buckets.close_all()
+
+
+def _key_values(pairs: list[str]) -> dict[str, str]:
+    result = {}
+    for pair in pairs:
+        key, sep, value = pair.partition("=")
+        if not sep:
+            raise argparse.ArgumentTypeError(f"Expected key=value, got {pair!r}.")
+        result[key.strip()] = value.strip()
+    return result
+
+
+def _config(pairs: list[str]) -> dict[str, dict[str, str]]:
+    # section names have dots in them (dosing_automation.pid_turbidostat), keys don't.
+    config: dict[str, dict[str, str]] = {}
+    for key, value in _key_values(pairs).items():
+        section, _, option = key.rpartition(".")
+        config.setdefault(section, {})[option] = value
+    return config
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0], formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("automation", help="plugin file, relative to the repo root or absolute")
+    parser.add_argument("--class", dest="class_name", help="automation class, if the file defines several")
+    parser.add_argument("--od", help="od_readings export")
+    parser.add_argument("--nod", help="od_readings_filtered export (normalized OD)")
+    parser.add_argument("--growth-rate", help="growth_rates export")
+    parser.add_argument("--temperature", help="temperature_readings export")
+    parser.add_argument("--trace", action="append", default=[], help="decision_trace file: inputs and logged actions")
+    parser.add_argument("--dosing-events", help="dosing_events export, to compare against")
+    parser.add_argument("--led-events", help="led_change_events export, to compare against")
+    parser.add_argument("--unit", help="only use rows of this pioreactor_unit")
+    parser.add_argument("--duration", type=float, help="minutes between execute calls (dosing and LED automations)")
+    parser.add_argument("-s", "--setting", action="append", default=[], help="automation setting, key=value")
+    parser.add_argument("--config", action="append", default=[], help="config.ini override, section.key=value")
+    parser.add_argument("--bucket-hours", type=float, default=1.0)
+    parser.add_argument("--output", help="CSV of buckets (default: stdout)")
+    args = parser.parse_args()
+
+    streams: list[Iterable[Reading]] = [read_trace(path) for path in args.trace]
+    for kind, path in (("od", args.od), ("normalized_od", args.nod), ("growth_rate", args.growth_rate), ("temperature", args.temperature)):
+        if path:
+            streams.append(read_csv(path, kind, unit=args.unit))
+    if args.dosing_events:
+        streams.append(read_dosing_events(args.dosing_events, unit=args.unit))
+    if args.led_events:
+        streams.append(read_led_events(args.led_events, unit=args.unit))
+    if not streams:
+        parser.error("Give at least one of --od, --nod, --growth-rate, --temperature or --trace.")
+
+    automation = Path(args.automation).resolve() if Path(args.automation).exists() else REPO_ROOT / args.automation
+    totals = dict.fromkeys(SUMS, 0.0)
+    n_buckets = 0
+    started_cpu = time.process_time()
+    output = open(args.output, "w", newline="") if args.output else sys.stdout
+    try:
+        writer = csv.DictWriter(output, fieldnames=COLUMNS)
+        writer.writeheader()
+        for row in replay(
+            automation,
+            merge(*streams),
+            duration=args.duration,
+            settings=_key_values(args.setting),
+            class_name=args.class_name,
+            config=_config(args.config),
+            bucket_hours=args.bucket_hours,
+        ):
+            writer.writerow(row)
+            n_buckets += 1
+            for column in SUMS:
+                if not column.endswith("heater_dc"):
+                    totals[column] += row[column]
+    finally:
+        if output is not sys.stdout:
+            output.close()
+
+    print(f"# {n_buckets} buckets of {args.bucket_hours:g}h replayed in {time.process_time() - started_cpu:.2f}s CPU: {totals['executes']:.0f} executes, {totals['events']:.0f} events", file=sys.stderr)
+    print(f"# {'':<16}{'replayed':>12}{'logged':>12}", file=sys.stderr)
+    for name in [f"{pump}_ml" for pump in PUMPS] + ["doses", "heater_updates", "led_writes"]:
+        print(f"# {name:<16}{totals['replayed_' + name]:>12.2f}{totals['logged_' + name]:>12.2f}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+"""
+Check the mirrors in dosing_simulator.py against the automations they mirror: each mirrored mode runs on the
+emulator, the automation itself, and on the simulator, from the same culture and with the same settings,
+and the media and alt-media dosed and the final OD and alt_media_fraction must agree within --tolerance.
+Waste isn't compared: the emulator's pumps remove waste_removal_multiplier times what was added.
+
+$ python3 simulator_parity.py
+$ python3 simulator_parity.py --hours 48 morbidostat
+
+Exits with 1 if any mirror disagrees. Requires numpy.
+"""
+from __future__ import annotations
+
+import argparse
+import importlib
+import sys
+from typing import Any
+
+from dosing_simulator import AUTOMATIONS
+from dosing_simulator import CultureModel
+from dosing_simulator import simulate
+from pioreactor_emulator import Emulator
+from pioreactor_emulator import PACKAGE
+from pioreactor_emulator import REPO_ROOT
+
+# a drug in the alt-media, so morbidostat and the alt-media automations change the growth.
+CULTURE = {"growth_rate": 0.5, "carrying_capacity": 5.0, "initial_od": 0.05, "alt_media_ic50": 0.3, "hill": 2.0}
+
+# (automation_name, duration, settings) of every mirrored mode. Doses land instantly in the simulator, so each
+# duration leaves the exchanges time to run on the emulator, and the dilution doesn't wash the culture out.
+# PID gains are config of the automation, settings of the mirror.
+CASES: list[tuple[str, float, dict[str, Any]]] = [
+    ("naive_turbidostat", 5.0, {"target_od": 1.0}),
+    ("adapted_turbidostat", 5.0, {"volume": 0.5, "max_od": 1.0, "min_od": 0.8, "max_normalized_od": -1.0, "min_normalized_od": -1.0}),
+    ("adapted_turbidostat", 5.0, {"volume": 0.5, "max_od": -1.0, "min_od": -1.0, "max_normalized_od": 20.0, "min_normalized_od": 16.0}),
+    ("pid_turbidostat", 5.0, {"target_normalized_od": 10.0, "Kp": 1.0, "Ki": 0.0, "Kd": 0.0}),
+    ("pid_turbidostat", 5.0, {"target_od": 0.5, "Kp": 2.0, "Ki": 0.1, "Kd": 0.0}),
+    ("morbidostat", 20.0, {"target_normalized_od": 10.0, "volume": 1.0}),
+    ("switching_dosing", 5.0, {"target_od": 1.0, "switch_mode": "planned"}),
+    ("switching_dosing", 5.0, {"target_od": 1.0, "switch_mode": "iterative"}),
+    ("chemostat_with_constant_alt_media_fraction", 20.0, {"volume": 1.0, "target_fraction": 0.2, "exchange_mode": "sequential"}),
+    ("chemostat_with_constant_alt_media_fraction", 20.0, {"volume": 1.0, "target_fraction": 0.2, "exchange_mode": "co_dosing"}),
+]
+PID_GAINS = ("Kp", "Ki", "Kd")
+
+
+def emulate(automation_name: str, hours: float, duration: float, settings: dict[str, Any]) -> dict[str, float]:
+    if str(REPO_ROOT) not in sys.path:
+        sys.path.append(str(REPO_ROOT))
+    from automation_plugin.settings_schema import SCHEMAS
+
+    schema = SCHEMAS[automation_name]
+    gains = {name: str(settings.pop(name)) for name in PID_GAINS if name in settings}
+    with Emulator(seed=0, config={f"dosing_automation.{automation_name}": gains}, culture=CULTURE) as emulator:
+        automation_class = getattr(importlib.import_module(f"{PACKAGE}.{schema['module']}"), schema["class"])
+        # the simulator records the vial before each execute, so sample it before the last one too. Automations
+        # that stop themselves, ex: switching_dosing, have no last execute: sample the vial at the end.
+        last = {}
+        sample = lambda job: last.update(od=emulator.culture.od, alt_media_fraction=emulator.culture.alt_media_fraction)
+        emulator.run(automation_class, hours=hours, duration=duration, at=[(hours, sample)], **settings)
+        if not last:
+            sample(None)
+
+        dosed = {"media": 0.0, "alt_media": 0.0}
+        for _, pump, ml, _ in emulator.dosing_history:
+            if pump in dosed:
+                dosed[pump] += ml
+        return {"media_ml": dosed["media"], "alt_media_ml": dosed["alt_media"], **last}
+
+
+def mirror(automation_name: str, hours: float, duration: float, settings: dict[str, Any]) -> dict[str, float]:
+    result = simulate(automation_name, hours=hours, duration=duration, n_vials=1, culture=CultureModel(**CULTURE), record_every=1, **settings)
+    return {
+        "media_ml": float(result.media_ml[0]),
+        "alt_media_ml": float(result.alt_media_ml[0]),
+        "od": float(result.od[-1, 0]),
+        "alt_media_fraction": float(result.alt_media_fraction[-1, 0]),
+    }
+
+
+def agree(emulated: float, simulated: float, tolerance: float) -> bool:
+    # absolute for quantities near 0, ex: the alt-media of a turbidostat.
+    return abs(emulated - simulated) <= tolerance * max(abs(emulated), abs(simulated), 1.0)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Check the dosing simulator's mirrors against the automations, on the emulator.")
+    parser.add_argument("automations", nargs="*", help="automation_names to check, default: all mirrored")
+    parser.add_argument("--hours", type=float, default=48.0)
+    parser.add_argument("--tolerance", type=float, default=0.02, help="relative")
+    args = parser.parse_args()
+
+    unknown = set(args.automations) - set(AUTOMATIONS)
+    if unknown:
+        parser.error(f"no mirror of {', '.join(sorted(unknown))}.")
+
+    failed = 0
+    for automation_name, duration, settings in CASES:
+        if args.automations and automation_name not in args.automations:
+            continue
+        emulated = emulate(automation_name, args.hours, duration, dict(settings))
+        simulated = mirror(automation_name, args.hours, duration, dict(settings))
+        mismatched = [name for name in emulated if not agree(emulated[name], simulated[name], args.tolerance)]
+        failed += bool(mismatched)
+
+        print(f"{'FAIL' if mismatched else 'ok':4} {automation_name} every {duration:g}min {settings}")
+        for name in emulated:
+            mark = "  <-" if name in mismatched else ""
+            print(f"       {name:18} emulator {emulated[name]:10.4f}   simulator {simulated[name]:10.4f}{mark}")
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())